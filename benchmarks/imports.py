@@ -0,0 +1,40 @@
+"""
+Measure the time it takes to import samuroi in a fresh interpreter, as every batch worker process has to pay it, and
+check that no heavy optional dependency gets loaded on import.
+
+Usage: python benchmarks/imports.py [repeat]
+"""
+import subprocess
+import sys
+import time
+
+# modules which should only be imported on first use
+heavy = ['PyQt5', 'matplotlib', 'cv2', 'skimage', 'scipy.signal', 'h5py']
+
+statements = ['pass',
+              'import numpy',
+              'import samuroi',
+              'from samuroi import SamuROIData',
+              'import samuroi.batch']
+
+
+def timeit(statement, repeat):
+    t0 = time.time()
+    for i in range(repeat):
+        subprocess.check_call([sys.executable, '-c', statement])
+    return (time.time() - t0) / repeat
+
+
+def loaded(statement):
+    check = "import sys; print(' '.join(m for m in {!r} if m in sys.modules))".format(heavy)
+    return subprocess.check_output([sys.executable, '-c', statement + '; ' + check]).decode().strip()
+
+
+def main(repeat=10):
+    print("{:>35} {:>10}  {}".format("statement", "seconds", "heavy modules"))
+    for statement in statements:
+        print("{:>35} {:>10.4f}  {}".format(statement, timeit(statement, repeat), loaded(statement)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
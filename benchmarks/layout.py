@@ -0,0 +1,46 @@
+"""
+Compare the pixel major and the time major memory layout of the video data for trace extraction, frame access and
+single pixel access.
+
+Usage: python benchmarks/layout.py [Y X T]
+"""
+import sys
+import time
+
+import numpy
+
+from samuroi import SamuROIData
+from samuroi.masks.circle import CircleMask
+
+
+def timeit(f, repeat=3):
+    t0 = time.time()
+    for i in range(repeat):
+        f()
+    return (time.time() - t0) / repeat
+
+
+def main(Y=256, X=256, T=2000, nmasks=500):
+    rng = numpy.random.RandomState(0)
+    data = rng.normal(size=(Y, X, T)).astype(numpy.float32)
+    masks = [CircleMask(center=rng.uniform(0, min(Y, X), 2), radius=4) for i in range(nmasks)]
+    y, x = rng.randint(0, Y, 200), rng.randint(0, X, 200)
+
+    print("{:>8} {:>10} {:>10} {:>10}".format("layout", "traces", "frames", "pixels"))
+    for layout in ['pixel', 'time']:
+        segmentation = SamuROIData(data, layout=layout)
+
+        def traces():
+            segmentation.trace_cache.clear()
+            segmentation.traces(masks)
+
+        def frames():
+            for i in range(0, T, 10):
+                segmentation.frame(i).copy()
+
+        print("{:>8} {:>10.4f} {:>10.4f} {:>10.4f}".format(layout, timeit(traces), timeit(frames),
+                                                           timeit(lambda: segmentation.pixels(y, x))))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:4]])
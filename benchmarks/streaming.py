@@ -0,0 +1,59 @@
+"""
+Measure the out-of-core trace extraction from a raw video file which stores one frame after another, read chunk by
+chunk with different chunk budgets, compared to extracting the traces from the video held in memory.
+
+Usage: python benchmarks/streaming.py [Y X T]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+
+from samuroi.masks.circle import CircleMask
+from samuroi.util.traces import extract_traces
+from samuroi.util.video import RawVideo
+
+
+def timeit(f, repeat=3):
+    t0 = time.time()
+    for i in range(repeat):
+        f()
+    return (time.time() - t0) / repeat
+
+
+def benchmark(masks, data, overlay, budget=None):
+    """Time the trace extraction after one warm up run, which compiles the weights and fills the page cache."""
+
+    def extract():
+        extract_traces(masks, data, overlay, budget)
+
+    extract()
+    return timeit(extract)
+
+
+def main(Y=256, X=256, T=4000, nmasks=500):
+    rng = numpy.random.RandomState(0)
+    masks = [CircleMask(center=rng.uniform(0, min(Y, X), 2), radius=4) for i in range(nmasks)]
+    overlay = numpy.ones((Y, X), dtype=bool)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'video.raw')
+        frames = numpy.memmap(filename, dtype=numpy.float32, mode='w+', shape=(T, Y, X))
+        for start in range(0, T, 100):
+            frames[start:start + 100] = rng.normal(size=frames[start:start + 100].shape)
+        frames.flush()
+        del frames
+
+        video = RawVideo(filename, shape=(Y, X, T), dtype=numpy.float32, layout='tyx')
+
+        print("{:>12} {:>10}".format("budget", "seconds"))
+        # copy the video into memory, numpy.asarray would return a view on the memory map, which would get streamed
+        print("{:>12} {:>10.4f}".format("in memory", benchmark(masks, numpy.array(video), overlay)))
+        for budget in [2 ** 20, 16 * 2 ** 20, 256 * 2 ** 20]:
+            print("{:>12} {:>10.4f}".format(budget, benchmark(masks, video, overlay, budget)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:4]])
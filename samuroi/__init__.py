@@ -1,2 +1,21 @@
-from .gui.samuroiwindow import SamuROIWindow
+import sys
+import types
+
 from .samuroidata import SamuROIData
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Import the gui on first access of `samuroi.SamuROIWindow`, such that `import samuroi` does not load PyQt5 and
+    matplotlib, e.g. in headless batch processing (see :py:mod:`samuroi.batch`).
+    """
+
+    def __getattr__(self, name):
+        if name == 'SamuROIWindow':
+            from .gui.samuroiwindow import SamuROIWindow
+            return SamuROIWindow
+        raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name))
+
+
+# python 3.6 does not support module level __getattr__ functions yet
+sys.modules[__name__].__class__ = _LazyModule
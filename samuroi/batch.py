@@ -0,0 +1,194 @@
+"""
+Headless batch processing of many recordings without the gui. Each input file is processed in its own worker process
+by :py:func:`samuroi.batch.process`:
+
+1. load the video data from a tif, hdf5 or npy file,
+2. optionally normalize the data with one of the baselines of :py:mod:`samuroi.plugins.baseline`,
+3. add the masks from swc files and segmentations (.npy label images),
+4. extract the traces of all masks and optionally run template matching on them,
+5. store everything with :py:meth:`samuroi.SamuROIData.save_hdf5`.
+
+Usage::
+
+    samuroi-batch data/*.tif --swc tree.swc --segmentation cells.npy --baseline median --tau1 150 --tau2 1 -j 8 -o out
+"""
+import argparse
+import os
+import sys
+
+
+def load_data(filename, threads=None):
+    """
+    Load the video data of a recording. Hdf5 files are read lazily via :py:class:`samuroi.util.video.HDF5Video`, npy
+    files are memory mapped.
+
+    :param filename: the filename of a .tif/.tiff, .h5/.hdf5 (video in dataset 'data') or .npy file.
+    :param threads: the number of threads used for decoding tif files.
+    :return: the video data with shape (Y,X,T).
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ('.tif', '.tiff'):
+        from .plugins.tif import load_tif
+        return load_tif(filename, threads=threads)
+    if ext in ('.h5', '.hdf5'):
+        from .util.video import HDF5Video
+        return HDF5Video(filename, 'data')
+    if ext == '.npy':
+        import numpy
+        return numpy.load(filename, mmap_mode='r')
+    raise Exception("Unknown file type: " + filename)
+
+
+def process(filename, output, swcfiles=(), segmentations=(), baseline=None, tau1=None, tau2=None, threshold=4.,
+            kernel_length=None, overlay=True, data=False, threads=None):
+    """
+    Run the whole pipeline on a single recording and store the result as hdf5 file.
+
+    :param filename: the recording, see :py:func:`samuroi.batch.load_data`.
+    :param output: the filename of the hdf5 file to write.
+    :param swcfiles: filenames of swc files whose branches get added as masks.
+    :param segmentations: filenames of .npy label images which get added as :py:class:`samuroi.masks.segmentation.Segmentation`.
+    :param baseline: the mode of :py:func:`samuroi.plugins.baseline.deltaF` or None to keep the raw data.
+    :param tau1: the slow time constant of the biexponential template, template matching is skipped if None.
+    :param tau2: the fast time constant of the biexponential template.
+    :param threshold: the detection threshold of the template matching.
+    :param kernel_length: optionally crop the template to this number of frames.
+    :param overlay: flag whether the thresholded overlay should be applied to the masks, otherwise all pixels are used.
+    :param data: flag whether the (normalized) video data should be stored in the output file.
+    :param threads: the number of threads used within this process.
+    :return: the output filename.
+    """
+    import numpy
+    from .samuroidata import SamuROIData
+    from .util.video import max_projection
+
+    video = load_data(filename, threads=threads)
+    # the morphology is the maximum projection of the raw data, just as in the gui
+    morphology = max_projection(video)
+    if baseline is not None:
+        from .plugins.baseline import deltaF
+        video = deltaF(video, mode=baseline, threads=threads)
+
+    samudata = SamuROIData(video, morphology)
+    if not overlay:
+        samudata.overlay = numpy.ones(samudata.data.shape[0:2], dtype=bool)
+
+    from .plugins.swc import load_swc
+    for swcfile in swcfiles:
+        samudata.load_swc(load_swc(swcfile))
+
+    from .masks.segmentation import Segmentation
+    for segfile in segmentations:
+        name = os.path.splitext(os.path.basename(segfile))[0]
+        samudata.masks.add(Segmentation(data=numpy.load(segfile), name=name))
+
+    samudata.save_hdf5(output, data=data)
+
+    if tau1 is not None:
+        from .event.biexponential import BiExponentialParameters
+        from .event.template_matching import template_matching_batch
+        kernel = BiExponentialParameters(tau1=tau1, tau2=tau2).kernel()
+        if kernel_length is not None:
+            kernel = kernel[0:kernel_length]
+        masks = list(samudata.masks)
+        # the traces were calculated for saving already and come from the cache
+        results = template_matching_batch(samudata.traces(masks), kernel=kernel, threshold=threshold)
+        save_events(output, masks, results)
+
+    return output
+
+
+def save_events(filename, masks, results):
+    """
+    Append the detected events to an hdf5 file written by :py:meth:`samuroi.SamuROIData.save_hdf5`. The event indices
+    of all masks are stored as ragged column 'indices' of the table 'events' (see
+    :py:func:`samuroi.util.hdf5.write_table`), the kernel and threshold as attributes.
+
+    :param filename: the hdf5 file.
+    :param masks: the list of masks.
+    :param results: the list of :py:class:`samuroi.event.template_matching.ClementsBekkersResult`, one per mask.
+    """
+    import h5py
+    from .util.hdf5 import write_table
+    with h5py.File(filename, mode='a') as f:
+        group = write_table(f, 'events', [m.name for m in masks], ragged={'indices': [r.indices for r in results]})
+        if len(results) > 0:
+            group.attrs['threshold'] = results[0].threshold
+            group.attrs['kernel'] = results[0].kernel
+
+
+def _output_filename(filename, outdir):
+    name = os.path.splitext(os.path.basename(filename))[0] + '.h5'
+    return os.path.join(outdir if outdir is not None else os.path.dirname(filename), name)
+
+
+parser = argparse.ArgumentParser(description='Process recordings with SamuROI without the gui.')
+
+parser.add_argument('filenames', type=str, nargs='+', help='The recordings to process (.tif, .h5 or .npy).')
+
+parser.add_argument('--swc', dest='swcfiles', type=str, action='append', default=[],
+                    help='Filename of swc file to load for every recording.')
+
+parser.add_argument('--segmentation', dest='segmentations', type=str, action='append', default=[],
+                    help='Filename of segmentations to load for every recording. (.npy files)')
+
+parser.add_argument('--baseline', type=str, default=None, choices=['stdv', 'median', 'linear_bleech', 'rolling'],
+                    help='Normalize the data to dF/F0 with the given baseline.')
+
+parser.add_argument('--tau1', type=float, default=None,
+                    help='Slow decay of the biexponential template. If given, run template matching.')
+
+parser.add_argument('--tau2', type=float, default=1., help='Fast rise of the biexponential template.')
+
+parser.add_argument('--threshold', type=float, default=4., help='Detection threshold of the template matching.')
+
+parser.add_argument('--kernel-length', dest='kernel_length', type=int, default=None,
+                    help='Crop the template to the given number of frames.')
+
+parser.add_argument('--no-overlay', dest='overlay', action='store_false',
+                    help='Use all pixels of the masks instead of applying the thresholded overlay.')
+
+parser.add_argument('--data', action='store_true', help='Also store the (normalized) video data.')
+
+parser.add_argument('-o', '--output', dest='outdir', type=str, default=None,
+                    help='Directory for the hdf5 files, defaults to the directory of each recording.')
+
+parser.add_argument('-j', '--jobs', type=int, default=None,
+                    help='The number of worker processes, defaults to the number of cpus.')
+
+
+def main(argv=None):
+    """Entry point of the `samuroi-batch` console script."""
+    args = parser.parse_args(argv)
+
+    from concurrent.futures import ProcessPoolExecutor
+    jobs = args.jobs if args.jobs is not None else os.cpu_count()
+    jobs = max(1, min(jobs, len(args.filenames)))
+    # share the cpus between the worker processes, which use threads internally
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+
+    if args.outdir is not None:
+        os.makedirs(args.outdir, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for filename in args.filenames:
+            future = executor.submit(process, filename, _output_filename(filename, args.outdir),
+                                     swcfiles=args.swcfiles, segmentations=args.segmentations, baseline=args.baseline,
+                                     tau1=args.tau1, tau2=args.tau2, threshold=args.threshold,
+                                     kernel_length=args.kernel_length, overlay=args.overlay, data=args.data,
+                                     threads=threads)
+            futures[future] = filename
+        from concurrent.futures import as_completed
+        for future in as_completed(futures):
+            try:
+                print("{} -> {}".format(futures[future], future.result()))
+            except Exception as e:
+                failed += 1
+                print("{} failed: {}".format(futures[future], e), file=sys.stderr)
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
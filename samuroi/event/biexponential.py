@@ -63,3 +63,22 @@ class BiExponentialParameters(object):
             if p[-1] > 0.01:
                 print("Warning: support for biexp may be to small.")
             return p
+
+
+def kernel_bank(tau1s, tau2s):
+    """
+    Create the kernels for all combinations of the given time constants, where tau1 > tau2. All kernels share a common
+    support that is long enough for the slowest kernel, such that they can be matched in one pass by
+    :py:func:`samuroi.event.template_matching.template_matching_bank`.
+
+    :param tau1s: iterable of slow time constants.
+    :param tau2s: iterable of fast time constants.
+    :return: tuple (parameters, kernels), with a list of :py:class:`samuroi.event.biexponential.BiExponentialParameters`
+        and a 2D numpy array with one kernel per row in the same order.
+    """
+    parameters = [BiExponentialParameters(tau1=tau1, tau2=tau2) for tau1 in tau1s for tau2 in tau2s if tau1 > tau2]
+    if len(parameters) == 0:
+        raise Exception("The kernel bank needs at least one pair of time constants with tau1 > tau2.")
+    N = max(len(p.kernel()) for p in parameters)
+    x = numpy.arange(float(N))
+    return parameters, numpy.array([p.kernel(x) for p in parameters])
@@ -20,6 +20,18 @@ class ClementsBekkersResult(object):
         """the kernel that was used for matching"""
 
 
+class KernelBankResult(ClementsBekkersResult):
+    """
+    Results of template matching with a bank of kernels, see
+    :py:func:`samuroi.event.template_matching.template_matching_bank`. The attributes crit, s and c refer to the best
+    matching template at each time point.
+    """
+    def __init__(self, indices, crit, s, c, threshold, kernel, template):
+        super(KernelBankResult, self).__init__(indices=indices, crit=crit, s=s, c=c, threshold=threshold, kernel=kernel)
+        self.template = template
+        """the index of the best matching kernel (i.e. the row in kernel) for each time point"""
+
+
 def template_matching(data, kernel, threshold):
     r"""
     .. note::
@@ -144,3 +156,145 @@ def template_matching(data, kernel, threshold):
     #     # TODO for multi parameter wavelets, replace this with iteration over 1D gradients
     #     dw = -2.* numpy.convolve(data,dwavelet,mode = 'same') + 2*(wavelet*dwavelet).sum()
     #     return dn,dw
+
+
+def _window_sums(y, N):
+    """
+    Calculate the sums over all blocks of N consecutive values along the last axis, aligned like
+    `numpy.convolve(y, numpy.ones(N), mode='same')`, via cumulative sums in O(T).
+    """
+    T = y.shape[-1]
+    cs = numpy.zeros(shape=y.shape[:-1] + (T + 1,))
+    numpy.cumsum(y, axis=-1, out=cs[..., 1:])
+    # index n of the 'same' output is index j = n + (N-1)//2 of the 'full' output, which sums y[j-N+1:j+1]
+    j = numpy.arange(T) + (N - 1) // 2
+    return cs[..., numpy.minimum(j + 1, T)] - cs[..., numpy.maximum(j - N + 1, 0)]
+
+
+def _criterion(sum_y, sum_yy, sum_ey, sum_e, sum_ee, N):
+    """
+    Calculate the optimal scaling, offset and the detection criterion from the sliding sums, see
+    :py:func:`samuroi.event.template_matching.template_matching` for the formulas.
+
+    :return: tuple (s, c, crit)
+    """
+    s_n = (sum_ey - sum_e * sum_y / N) / (sum_ee - sum_e * sum_e / N)
+    c_n = (sum_y - s_n * sum_e) / N
+    sse_n = sum_yy + sum_ee * s_n ** 2 + N * c_n ** 2 - 2 * (s_n * sum_ey + c_n * sum_y - s_n * c_n * sum_e)
+    crit = s_n / (sse_n / (N - 1)) ** 0.5
+    return s_n, c_n, crit
+
+
+def template_matching_batch(data, kernel, threshold, budget=None):
+    r"""
+    Batched variant of :py:func:`samuroi.event.template_matching.template_matching`, which matches the template
+    against many traces at once. The correlation with the template is calculated by FFT along the time axis for all
+    traces of a block simultaneously and the sliding sums via cumulative sums, instead of three direct convolutions per
+    trace.
+
+    :param data: 2D numpy array with shape (n_traces, T), e.g. as returned by :py:meth:`samuroi.SamuROIData.traces`.
+    :param kernel: 1D numpy array with the template to use.
+    :param threshold: scalar value usually between 4 to 5.
+    :param budget: The number of bytes of intermediate arrays per block of traces. Defaults to 16MB, such that the
+        intermediate arrays of one block stay in the cpu cache as far as possible.
+    :return: A list with one :py:class:`samuroi.event.template_matching.ClementsBekkersResult` per trace.
+    """
+    import scipy.fft
+
+    data = numpy.atleast_2d(data)
+    n, T = data.shape
+    if T <= len(kernel):
+        raise Exception("Data length needs to exceed kernel length.")
+
+    # reverse kernel, since we use convolve
+    e = numpy.asarray(kernel, dtype=float)[::-1]
+    N = len(e)
+    sum_e = numpy.sum(e)
+    sum_ee = numpy.sum(e ** 2)
+
+    # the spectrum of the kernel, zero padded to allow for linear instead of circular convolution
+    nfft = scipy.fft.next_fast_len(T + N - 1, real=True)
+    spectrum = scipy.fft.rfft(e, nfft)
+    offset = (N - 1) // 2
+
+    budget = 16 * 2 ** 20 if budget is None else budget
+    # about ten arrays of the block size are alive at the same time
+    rows = max(1, int(budget // (10 * 8 * nfft)))
+
+    results = []
+    for start in range(0, n, rows):
+        y = numpy.asarray(data[start:start + rows], dtype=float)
+
+        sum_y = _window_sums(y, N)
+        sum_yy = _window_sums(y ** 2, N)
+        sum_ey = scipy.fft.irfft(scipy.fft.rfft(y, nfft, axis=-1) * spectrum, nfft, axis=-1)[:, offset:offset + T]
+
+        s_n, c_n, crit = _criterion(sum_y, sum_yy, sum_ey, sum_e, sum_ee, N)
+
+        for i in range(len(y)):
+            results.append(ClementsBekkersResult(indices=numpy.where(crit[i] > threshold)[0], crit=crit[i], s=s_n[i],
+                                                 c=c_n[i], threshold=threshold, kernel=kernel))
+    return results
+
+
+def template_matching_bank(data, kernels, threshold, budget=None):
+    """
+    Match a bank of templates against many traces and keep the best matching template for each time point. All kernels
+    need to have the same length (see :py:func:`samuroi.event.biexponential.kernel_bank`), hence the sliding sums over
+    the data are shared by all templates and each trace gets transformed by FFT only once. Apart from that, the
+    criterion is the same as in :py:func:`samuroi.event.template_matching.template_matching`.
+
+    :param data: 2D numpy array with shape (n_traces, T).
+    :param kernels: 2D numpy array with one template per row.
+    :param threshold: scalar value usually between 4 to 5.
+    :param budget: The number of bytes of intermediate arrays per block of traces, defaults to 16MB.
+    :return: A list with one :py:class:`samuroi.event.template_matching.KernelBankResult` per trace.
+    """
+    import scipy.fft
+
+    data = numpy.atleast_2d(data)
+    kernels = numpy.atleast_2d(kernels)
+    n, T = data.shape
+    K, N = kernels.shape
+    if T <= N:
+        raise Exception("Data length needs to exceed kernel length.")
+
+    # reverse kernels, since we use convolve
+    e = numpy.asarray(kernels, dtype=float)[:, ::-1]
+    sum_e = numpy.sum(e, axis=1)
+    sum_ee = numpy.sum(e ** 2, axis=1)
+
+    nfft = scipy.fft.next_fast_len(T + N - 1, real=True)
+    spectra = scipy.fft.rfft(e, nfft, axis=-1)
+    offset = (N - 1) // 2
+
+    budget = 16 * 2 ** 20 if budget is None else budget
+    rows = max(1, int(budget // (16 * 8 * nfft)))
+
+    results = []
+    for start in range(0, n, rows):
+        y = numpy.asarray(data[start:start + rows], dtype=float)
+
+        # shared by all templates
+        sum_y = _window_sums(y, N)
+        sum_yy = _window_sums(y ** 2, N)
+        spectrum_y = scipy.fft.rfft(y, nfft, axis=-1)
+
+        best = numpy.full(shape=y.shape, fill_value=-numpy.inf)
+        best_s = numpy.full(shape=y.shape, fill_value=numpy.nan)
+        best_c = numpy.full(shape=y.shape, fill_value=numpy.nan)
+        template = numpy.full(shape=y.shape, fill_value=-1, dtype=int)
+        for k in range(K):
+            sum_ey = scipy.fft.irfft(spectrum_y * spectra[k], nfft, axis=-1)[:, offset:offset + T]
+            s_n, c_n, crit = _criterion(sum_y, sum_yy, sum_ey, sum_e[k], sum_ee[k], N)
+            better = crit > best
+            best[better] = crit[better]
+            best_s[better] = s_n[better]
+            best_c[better] = c_n[better]
+            template[better] = k
+        best[template < 0] = numpy.nan
+
+        for i in range(len(y)):
+            results.append(KernelBankResult(indices=numpy.where(best[i] > threshold)[0], crit=best[i], s=best_s[i],
+                                            c=best_c[i], threshold=threshold, kernel=kernels, template=template[i]))
+    return results
@@ -14,6 +14,9 @@ Classes
 .. automodule:: samuroi.gui.roitree
     :members:
 
+.. automodule:: samuroi.gui.scheduler
+    :members:
+
 .. automodule:: samuroi.gui.toolbars
     :members:
 
@@ -92,36 +92,44 @@ class FindEventsMenu(QMenu):
 
     def find_events(self, algorithm):
         """
+        Run the algorithm on the traces of all masks in a worker thread of the windows
+        :py:class:`samuroi.gui.scheduler.JobScheduler`. Once done, the results get stored in the masks and
+        :py:attr:`samuroi.SamuROIData.events_changed` is triggered.
+
         Args:
-            algorithm: The algorithm needs to take a trace as input and return a namedtuple with the results
-            segmentation:
+            algorithm: The algorithm needs to take a 2D array with one trace per row as input and return a list with
+                one result object per trace.
         """
 
         segmentation = self.parent().segmentation
 
-        # loop over all masks
-        for mask in segmentation.masks:
-            # run the algorithm on the trace of the mask
-            trace = segmentation.postprocessor(mask(segmentation.data, segmentation.overlay))
+        masks = list(segmentation.masks)
+
+        def job():
+            # calculate the traces of all masks in one go and run the algorithm on all traces at once
+            return algorithm(segmentation.traces(masks))
 
-            result = algorithm(trace)
+        def on_done(results):
+            for mask, result in zip(masks, results):
+                # store the result "in" the mask
+                #  todo that's actually really dirty -.-
+                mask.events = result
 
-            # store the result "in" the mask
-            #  todo that's actually really dirty -.-
-            mask.events = result
+                # # add all found events to the mask
+                # if not hasattr(mask,"events"):
+                #     mask.events = {}
+                #
+                # mask.events[result.algorithm]
+            segmentation.events_changed(masks)
 
-            # # add all found events to the mask
-            # if not hasattr(mask,"events"):
-            #     mask.events = {}
-            #
-            # mask.events[result.algorithm]
+        self.parent().scheduler.submit("find_events", job, on_done)
 
     def on_tm_biexponential(self):
         dlg = BiExpParameterDialog(self)
 
         def on_ok():
             from ...event.biexponential import BiExponentialParameters
-            from ...event.template_matching import template_matching
+            from ...event.template_matching import template_matching_batch
             tau1 = dlg.text_tau1.value()
             tau2 = dlg.text_tau2.value()
             # amplitude = dlg.text_amplitude.value()
@@ -133,7 +141,7 @@ class FindEventsMenu(QMenu):
             # create algorithm object
             # 1. create kernel
             kernel = params.kernel()
-            self.find_events(lambda trace: template_matching(data=trace, kernel=kernel, threshold=threshold))
+            self.find_events(lambda traces: template_matching_batch(data=traces, kernel=kernel, threshold=threshold))
 
         def on_cancel():
             dlg.close()
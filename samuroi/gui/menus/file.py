@@ -51,10 +51,12 @@ class FileMenu(QMenu):
         fileName = QtGui.QFileDialog.getOpenFileName(self.parent(),
                                                      "Open SWC File",
                                                      ".",
-                                                     "SWC Files (*.swc)")
+                                                     "SWC Files (*.swc *.swc.gz *.swc.bz2 *.swc.xz)")
         from samuroi.plugins.swc import load_swc
         swc = load_swc(str(fileName))
-        self.app.segmentation.load_swc(swc)
+        # redraw once after all masks of the morphology were added
+        with self.app.draw_on_exit():
+            self.app.segmentation.load_swc(swc)
 
     def load_tiff(self):
         fileName = QtGui.QFileDialog.getOpenFileName(self.parent(),
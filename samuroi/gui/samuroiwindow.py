@@ -39,6 +39,10 @@ class SamuROIWindow(QMainWindow):
         super().__init__(*args, **kwargs)
         self.segmentation = SamuROIData(data, morphology)
 
+        # run expensive calculations off the gui thread
+        from .scheduler import JobScheduler
+        self.scheduler = JobScheduler(parent=self)
+
         # set window title
         self.setWindowTitle("SamuROI")
         # instantiate a widget, it will be the main one
@@ -60,14 +64,15 @@ class SamuROIWindow(QMainWindow):
         self._setup_toolbars()
 
         from .widgets.rasterview import RasterViewDockWidget
-        self.linescandockwidget = RasterViewDockWidget("RasterView", parent=self, segmentation=self.segmentation)
+        self.linescandockwidget = RasterViewDockWidget("RasterView", parent=self, segmentation=self.segmentation,
+                                                       scheduler=self.scheduler)
         self.addDockWidget(QtCore.Qt.TopDockWidgetArea, self.linescandockwidget)
         # connect to selection to update linescan if selection allows to deduce a branch
         self.roiselectionmodel.selectionChanged.connect(self.on_selection_change)
 
         from .widgets.traceview import TraceViewDockWidget
         self.tracedockwidget = TraceViewDockWidget("TraceView", parent=self, segmentation=self.segmentation,
-                                                   selectionmodel=self.roiselectionmodel)
+                                                   selectionmodel=self.roiselectionmodel, scheduler=self.scheduler)
         self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.tracedockwidget)
 
         from .roitree import RoiTreeWidget
@@ -89,6 +94,12 @@ class SamuROIWindow(QMainWindow):
         self.find_events_menu = FindEventsMenu(parent=self)
         self.menubar.addMenu(self.find_events_menu)
 
+    def closeEvent(self, event):
+        self.scheduler.shutdown()
+        self.frame_widget.pause()
+        self.frame_widget.canvas.frame_cache.shutdown()
+        super().closeEvent(event)
+
     def on_selection_change(self, selected, deselected):
         """
         When the selection is either a single mask with children, or a set of child masks from only one parent mask,
@@ -97,13 +108,14 @@ class SamuROIWindow(QMainWindow):
         from ..masks.branch import BranchMask
         from ..masks.segment import SegmentMask
         from ..masks.segmentation import Segmentation as SegmentationMask
+        from ..masks.pixel import PixelMaskCollection
         masks = set()
         for index in self.roiselectionmodel.selectedIndexes():
             item = index.internalPointer()
             if item.mask is not None:
-                if type(item.mask) in (BranchMask, SegmentationMask):
+                if type(item.mask) in (BranchMask, SegmentationMask, PixelMaskCollection):
                     masks.add(item.mask)
-                elif type(item.mask) in (SegmentMask, SegmentationMask.Child):
+                elif type(item.mask) in (SegmentMask, SegmentationMask.Child, PixelMaskCollection.Child):
                     masks.add(item.mask.parent)
 
         if len(masks) == 1:
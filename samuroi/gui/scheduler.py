@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class JobScheduler(QObject):
+    """
+    Runs expensive computations (trace extraction, event detection, overlay calculation) in a pool of worker threads,
+    such that the gui stays responsive. The result of each job is handed to a callback on the gui thread, which usually
+    stores it in the :py:class:`samuroi.SamuROIData` and thereby triggers the usual
+    :py:class:`samuroi.util.event.Event` signals.
+
+    Each job has a key. Submitting a job with a key that is already in use supersedes the older job: it gets cancelled
+    if it did not start yet, otherwise its result is discarded. Hence, e.g. quickly stepping through thresholds will
+    only deliver the overlay of the latest threshold.
+    """
+
+    # emitted from the worker threads, the queued connection delivers to the gui thread
+    result_ready = pyqtSignal(object, object)
+
+    def __init__(self, parent=None, threads=None):
+        """
+        :param parent: the parent QObject.
+        :param threads: the number of worker threads, defaults to the choice of concurrent.futures.
+        """
+        super().__init__(parent)
+        self.__executor = ThreadPoolExecutor(max_workers=threads)
+        # mapping from key to the latest job (future, callback)
+        self.__jobs = {}
+        self.result_ready.connect(self.__deliver)
+
+    def submit(self, key, func, callback=None, error=None):
+        """
+        Run func in a worker thread.
+
+        :param key: a hashable identifying the job, e.g. ("traceview", id(widget)). Jobs with the same key supersede
+            each other.
+        :param func: the function without arguments to call in the worker thread.
+        :param callback: function taking the result of func, called on the gui thread unless the job got superseded.
+        :param error: function taking the exception if func raised, called on the gui thread. Defaults to re-raising
+            the exception on the gui thread.
+        :return: the concurrent.futures.Future of the job.
+        """
+        self.cancel(key)
+        future = self.__executor.submit(func)
+        self.__jobs[key] = (future, callback, error)
+        future.add_done_callback(lambda f: self.result_ready.emit(key, f))
+        return future
+
+    def cancel(self, key):
+        """Cancel the job with the given key, if it did not start yet the result will be discarded."""
+        if key in self.__jobs:
+            future, callback, error = self.__jobs.pop(key)
+            future.cancel()
+
+    def pending(self, key):
+        """:return: True if a job with the given key was submitted and its result was not delivered yet."""
+        return key in self.__jobs
+
+    def shutdown(self):
+        """Drop all pending jobs and stop the worker threads."""
+        for key in list(self.__jobs):
+            self.cancel(key)
+        self.__executor.shutdown(wait=False)
+
+    def __deliver(self, key, future):
+        if key not in self.__jobs or self.__jobs[key][0] is not future:
+            # the job was superseded or cancelled
+            return
+        future, callback, error = self.__jobs.pop(key)
+        exception = future.exception()
+        if exception is not None:
+            if error is None:
+                raise exception
+            error(exception)
+        elif callback is not None:
+            callback(future.result())
@@ -28,7 +28,11 @@ class MaskToolbar(ToolBar):
         self.threshold_spin_box.setValue(self.active_segmentation.threshold / self.__threshold_base)
 
     def update_threshold(self, value):
-        self.active_segmentation.threshold = self.__threshold_base * value / 100.
+        # calculate the overlay in the background, quickly changing the value only delivers the latest overlay
+        segmentation = self.active_segmentation
+        threshold = self.__threshold_base * value / 100.
+        self.parent().scheduler.submit("threshold", lambda: segmentation.threshold_overlay(threshold),
+                                       lambda overlay: segmentation.set_threshold(threshold, overlay))
 
     def __init__(self, parent, *args, **kwargs):
         super(MaskToolbar, self).__init__(parent=parent, *args, **kwargs)
@@ -60,17 +64,19 @@ class MaskToolbar(ToolBar):
 class SplitJoinToolbar(ToolBar):
     def split_selected(self):
         from ..masks.branch import BranchMask
+        masks = []
+        for sr in self.parent().roiselectionmodel.selection():
+            for index in sr.indexes():
+                item = index.internalPointer()
+                if type(item.mask) is BranchMask and item.mask not in masks:
+                    masks.append(item.mask)
         with self.parent().draw_on_exit():
-            for sr in self.parent().roiselectionmodel.selection():
-                for index in sr.indexes():
-                    item = index.internalPointer()
-                    if type(item.mask) is BranchMask:
-                        item.mask.split(length=self.split_length_widget.value())
+            BranchMask.split_many(masks, length=self.split_length_widget.value())
 
     def split_all(self):
+        from ..masks.branch import BranchMask
         with self.parent().draw_on_exit():
-            for mask in self.active_segmentation.branchmasks:
-                mask.split(length=self.split_length_widget.value())
+            BranchMask.split_many(list(self.active_segmentation.branchmasks), length=self.split_length_widget.value())
 
     def __init__(self, parent, *args, **kwargs):
         super(SplitJoinToolbar, self).__init__(parent=parent, *args, **kwargs)
@@ -47,11 +47,28 @@ class CanvasBase(FigureCanvas):
 
         self.draw()
 
-    def __init__(self):
+    def __init__(self, scheduler=None):
         # initialize the canvas where the Figure renders into
         FigureCanvas.__init__(self, Figure())
 
+        # the scheduler of type samuroi.gui.scheduler.JobScheduler used to calculate traces off the gui thread
+        self.scheduler = scheduler
+
         # allow this widget to have the focus set by tab or mouse click
         self.setFocusPolicy(QtCore.Qt.StrongFocus)
 
         self.axes = self.figure.add_subplot(111)
+
+    def submit(self, name, func, callback):
+        """
+        Run func in a worker thread of the scheduler and pass its result to callback on the gui thread. A job with the
+        same name supersedes the previous job of this canvas. Without scheduler, func will be called directly.
+
+        :param name: the name of the job, unique within this canvas.
+        :param func: function without arguments, which does the expensive calculation.
+        :param callback: function taking the result of func.
+        """
+        if self.scheduler is None:
+            callback(func())
+        else:
+            self.scheduler.submit((name, id(self)), func, callback)
@@ -4,7 +4,7 @@ import matplotlib
 import numpy
 from PyQt5 import QtCore
 from PyQt5.QtCore import QItemSelectionModel
-from PyQt5.QtWidgets import QWidget, QSlider, QVBoxLayout, QHBoxLayout
+from PyQt5.QtWidgets import QWidget, QSlider, QVBoxLayout, QHBoxLayout, QToolButton, QDoubleSpinBox, QLabel, QStyle
 from matplotlib.patches import Polygon
 
 from .canvasbase import CanvasBase
@@ -25,6 +25,14 @@ class FrameViewCanvas(CanvasBase):
         self.selectionmodel = selectionmodel
         self.__active_frame = None
 
+        # frames at all levels of the resolution pyramid, the neighbours of the active frame get prefetched
+        from ...util.framecache import FrameCache
+        self.frame_cache = FrameCache(self.segmentation.frame)
+        self.prefetch = 4
+        # the pyramid level of the displayed frame and the rendered canvas without the frame image
+        self.__level = 0
+        self.__background = None
+
         # a map, mapping from mask to artist
         self.__artists = {}
         from itertools import cycle
@@ -41,11 +49,14 @@ class FrameViewCanvas(CanvasBase):
         # red_alpha_cm.set_under([0,0,0,0])
 
         # norm = matplotlib.colors.LogNorm(.001,1.)
-        x, y, t = self.segmentation.data.shape
-        vmin, vmax = numpy.nanpercentile(self.segmentation.data[..., :min(int(t / 10), 50)], q=[pmin, pmax])
+        vmin, vmax = self.frame_limits(pmin, pmax)
         norm = matplotlib.colors.Normalize(vmin=vmin, vmax=vmax, clip=True)
-        self.frameimg = self.axes.imshow(self.segmentation.data[..., 0], cmap=red_alpha_cm, norm=norm,
+        self.frameimg = self.axes.imshow(self.segmentation.frame(0), cmap=red_alpha_cm, norm=norm,
                                          interpolation='nearest')
+        # the frame image is not part of the regular drawing. it is blitted on top of the cached background holding the
+        # morphology, the overlay and all mask artists, such that changing the frame does not redraw all artists.
+        self.frameimg.set_animated(True)
+        self.mpl_connect('draw_event', self.on_draw)
         self.overlayimg = self.axes.imshow(self.rgba_overlay, interpolation="nearest")
         # disable autoscale on image axes, to avoid rescaling due to additional artists.
         self.axes.set_autoscale_on(False)
@@ -62,7 +73,9 @@ class FrameViewCanvas(CanvasBase):
         # connect to selection model
         self.selectionmodel.selectionChanged.connect(self.on_selection_changed)
 
-        self.mpl_connect('pick_event', self.onpick)
+        # hit testing is done with the spatial index of the masks instead of picking every single artist
+        self.segmentation.spatial_index
+        self.mpl_connect('button_press_event', self.onpick)
 
     @property
     def rgba_overlay(self):
@@ -94,16 +107,69 @@ class FrameViewCanvas(CanvasBase):
         self.meanimg.set_data(self.segmentation.morphology)
 
         # norm = matplotlib.colors.LogNorm(.001,1.)
-        x, y, t = self.segmentation.data.shape
-        vmin, vmax = numpy.nanpercentile(self.segmentation.data[..., :min(t / 10, 50)], q=[pmin, pmax])
+        vmin, vmax = self.frame_limits(pmin, pmax)
         norm = matplotlib.colors.Normalize(vmin=vmin, vmax=vmax, clip=True)
 
         self.frameimg.set_norm(norm)
-        self.frameimg.set_data(self.segmentation.data[..., self.segmentation.active_frame])
+        self.frame_cache.clear()
+        self.__set_frame()
         self.draw()
 
+    def frame_limits(self, pmin, pmax, samples=2 ** 20):
+        """
+        Estimate the color range of the frames as percentiles over the first frames. Only a regular subset of the pixels
+        is used, such that at most `samples` values need to be sorted.
+        """
+        Y, X, T = self.segmentation.data.shape
+        frames = range(min(max(int(T / 10), 1), 50))
+        step = max(1, int(numpy.ceil(numpy.sqrt(Y * X * len(frames) / float(samples)))))
+        values = numpy.stack([self.segmentation.frame(i)[::step, ::step] for i in frames])
+        return numpy.nanpercentile(values, q=[pmin, pmax])
+
+    @property
+    def level(self):
+        """The level within the resolution pyramid of the displayed frame."""
+        return self.__level
+
+    def __visible_level(self):
+        """The pyramid level matching the number of data pixels per screen pixel of the present zoom."""
+        from ...util.framecache import pyramid_level
+        x0, x1 = self.axes.get_xlim()
+        y0, y1 = self.axes.get_ylim()
+        bbox = self.axes.bbox
+        return min(pyramid_level(abs(x1 - x0), bbox.width), pyramid_level(abs(y1 - y0), bbox.height))
+
+    def __set_frame(self):
+        """Show the active frame at the present pyramid level and prefetch its successors."""
+        i, level = self.segmentation.active_frame, self.__level
+        image = self.frame_cache.get(i, level)
+        f = 2 ** level
+        self.frameimg.set_data(image)
+        # the downsampled image covers the blocks of the full resolution image
+        self.frameimg.set_extent((-0.5, image.shape[1] * f - 0.5, image.shape[0] * f - 0.5, -0.5))
+        T = self.segmentation.data.shape[-1]
+        self.frame_cache.prefetch([j for j in range(i + 1, i + 1 + self.prefetch) if j < T], level)
+
+    def on_draw(self, event):
+        """After each full redraw (e.g. after zooming) keep the background and draw the frame image on top."""
+        level = self.__visible_level()
+        if level != self.__level:
+            self.__level = level
+            self.__set_frame()
+        self.__background = self.copy_from_bbox(self.axes.bbox)
+        self.axes.draw_artist(self.frameimg)
+
+    def blit_frame(self):
+        """Redraw only the frame image on top of the cached background."""
+        if self.__background is None:
+            self.draw()
+            return
+        self.restore_region(self.__background)
+        self.axes.draw_artist(self.frameimg)
+        self.blit(self.axes.bbox)
+
     def create_outlined_artist(self, mask, color, **kwargs):
-        artist = matplotlib.patches.Polygon(xy=mask.outline - 0.5, lw=1, picker=True, fill=False, color='gray',
+        artist = matplotlib.patches.Polygon(xy=mask.outline - 0.5, lw=1, fill=False, color='gray',
                                             **kwargs)
 
         artist.color = color
@@ -149,7 +215,7 @@ class FrameViewCanvas(CanvasBase):
                 self.remove_mask(mask)
 
     def create_circle_artist(self, mask, color, **kwargs):
-        artist = matplotlib.patches.Circle(radius=mask.radius, xy=mask.center - 0.5, lw=1, picker=True, fill=False,
+        artist = matplotlib.patches.Circle(radius=mask.radius, xy=mask.center - 0.5, lw=1, fill=False,
                                            color='gray', **kwargs)
 
         artist.color = color
@@ -185,6 +251,49 @@ class FrameViewCanvas(CanvasBase):
         self.__artists[mask] = artist
         return artist
 
+    def create_pixel_collection_artist(self, mask, color=None):
+        """Draw the pixels of all children of a :py:class:`samuroi.masks.pixel.PixelMaskCollection` as one scatter."""
+        conv = matplotlib.colors.ColorConverter()
+        colors = numpy.zeros(shape=(len(mask.y), 4), dtype=float)
+        sizes = numpy.full(len(mask.y), 5.)
+        colors[:] = conv.to_rgba('gray')
+        artist = self.axes.scatter(mask.x, mask.y, c=colors, s=sizes)
+        artist.mask = mask
+        for child in mask.children:
+            if not hasattr(child, "color"):
+                child.color = next(self.colorcycle)
+
+        def select(rows, a, color):
+            colors[rows] = conv.to_rgba(color if a else 'gray')
+            sizes[rows] = 30 if a else 5
+            artist.set_facecolors(colors)
+            artist.set_edgecolors(colors)
+            artist.set_sizes(sizes)
+
+        def set_selected(self, a):
+            for child in mask.children:
+                select(slice(mask.offsets[child.index], mask.offsets[child.index + 1]), a, child.color)
+
+        artist.set_selected = types.MethodType(set_selected, artist)
+        self.__artists[mask] = artist
+
+        class ArtistProxy(object):
+            """proxy object for the children of the collection. Redirect set_selected to the rows of the scatter."""
+
+            def __init__(self, mask):
+                self.artist = artist
+                self.mask = mask
+
+            def remove(self):
+                # the scatter is removed together with the collection
+                pass
+
+            def set_selected(self, a):
+                select(slice(mask.offsets[self.mask.index], mask.offsets[self.mask.index + 1]), a, self.mask.color)
+
+        for child in mask.children:
+            self.__artists[child] = ArtistProxy(mask=child)
+
     def create_segmentation_artist(self, mask, color=None):
         segmentation_alpha = 0.7
 
@@ -238,11 +347,13 @@ class FrameViewCanvas(CanvasBase):
         with self.draw_on_exit():
             # create an artist based on the type of roi
             from samuroi.masks.segmentation import Segmentation
+            from samuroi.masks.pixel import PixelMaskCollection
             mapping = {
                 CircleMask: self.create_circle_artist,
                 BranchMask: self.create_outlined_artist,
                 PolygonMask: self.create_outlined_artist,
                 PixelMask: self.create_pixel_artist,
+                PixelMaskCollection: self.create_pixel_collection_artist,
                 Segmentation: self.create_segmentation_artist
             }
             func = mapping[type(mask)]
@@ -298,13 +409,19 @@ class FrameViewCanvas(CanvasBase):
         self.show_overlay = not self.show_overlay
 
     def on_active_frame_cahnged(self):
-        self.frameimg.set_data(self.segmentation.data[..., self.segmentation.active_frame])
-        self.draw()
+        self.__set_frame()
+        self.blit_frame()
 
     def onpick(self, event):
+        if event.button != 1 or event.inaxes is not self.axes or event.xdata is None:
+            return
+        # the artists are drawn shifted by half a pixel, such that the mask outlines align with the pixel borders
+        masks = self.segmentation.spatial_index.at(event.xdata + 0.5, event.ydata + 0.5)
+        if len(masks) == 0:
+            return
         with self.draw_on_exit():
-            # get the mask from the event
-            mask = event.artist.mask
+            # take the most specific mask, e.g. the segment rather than its branch
+            mask = masks[0]
             # get the model underlying the selection
             model = self.selectionmodel.model()
 
@@ -312,10 +429,25 @@ class FrameViewCanvas(CanvasBase):
             index = model.find(mask)
 
             # if shift key is not pressed clear selection
-            if not (event.guiEvent.modifiers() and QtCore.Qt.ShiftModifier):
+            if not (event.guiEvent.modifiers() & QtCore.Qt.ShiftModifier):
                 self.selectionmodel.clear()
             self.selectionmodel.select(index, QItemSelectionModel.Select)
 
+    def select_region(self, x0, y0, x1, y1, add=False):
+        """
+        Select all masks whose bounding box lies within the given region of the image.
+
+        :param x0, y0, x1, y1: the corners of the region in data coordinates of the axes.
+        :param add: flag whether the masks should be added to the present selection.
+        """
+        masks = self.segmentation.spatial_index.region(x0 + 0.5, y0 + 0.5, x1 + 0.5, y1 + 0.5, inside=True)
+        with self.draw_on_exit():
+            model = self.selectionmodel.model()
+            if not add:
+                self.selectionmodel.clear()
+            for mask in masks:
+                self.selectionmodel.select(model.find(mask), QItemSelectionModel.Select)
+
 
 class FrameViewWidget(QWidget):
     def __init__(self, parent, segmentation, selectionmodel):
@@ -340,9 +472,32 @@ class FrameViewWidget(QWidget):
         self.frame_slider.setPageStep(self.segmentation.data.shape[2] / 10)
         self.frame_slider.valueChanged.connect(self.on_slider_changed)
 
+        # playback of the video, advanced by a timer with frames loaded ahead by a ring buffer
+        self.play_button = QToolButton()
+        self.play_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
+        self.play_button.setCheckable(True)
+        self.play_button.setToolTip("Play the video")
+        self.play_button.toggled.connect(self.on_play_toggled)
+
+        self.fps_spin_box = QDoubleSpinBox(value=25.)
+        self.fps_spin_box.setRange(0.1, 1000.)
+        self.fps_spin_box.setSuffix(" fps")
+        self.fps_spin_box.setToolTip("The target frame rate of the playback")
+        self.fps_spin_box.valueChanged.connect(self.on_fps_changed)
+
+        self.fps_label = QLabel()
+        self.fps_label.setToolTip("The achieved frame rate of the playback")
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.on_timer)
+        self.__ringbuffer = None
+
         self.toollayout = QHBoxLayout()
 
         self.toollayout.addWidget(self.toolbar_navigation)
+        self.toollayout.addWidget(self.play_button)
+        self.toollayout.addWidget(self.fps_spin_box)
+        self.toollayout.addWidget(self.fps_label)
         self.toollayout.addWidget(self.frame_slider)
 
         self.vbl.addLayout(self.toollayout)
@@ -350,8 +505,91 @@ class FrameViewWidget(QWidget):
 
         self.segmentation.active_frame_changed.append(self.on_active_frame_changed)
 
+    @property
+    def playing(self):
+        """True while the video is being played."""
+        return self.__ringbuffer is not None
+
+    def play(self):
+        """Start the playback at the active frame."""
+        if self.playing:
+            return
+        from ...util.framecache import FrameRingBuffer
+        if self.segmentation.active_frame == self.segmentation.data.shape[2] - 1:
+            self.segmentation.active_frame = 0
+        canvas = self.canvas
+        # load via the frame cache of the canvas, such that displaying a buffered frame does not load it again
+        self.__ringbuffer = FrameRingBuffer(lambda i: canvas.frame_cache.get(i, canvas.level),
+                                            length=self.segmentation.data.shape[2],
+                                            size=min(32, canvas.frame_cache.capacity // 2))
+        self.__restart(self.segmentation.active_frame)
+        self.timer.start(max(1, int(1000. / self.fps_spin_box.value())))
+        self.play_button.setChecked(True)
+
+    def pause(self):
+        """Stop the playback at the present frame."""
+        if not self.playing:
+            return
+        self.timer.stop()
+        self.__ringbuffer.stop()
+        self.__ringbuffer = None
+        self.fps_label.setText("")
+        self.play_button.setChecked(False)
+
+    def __restart(self, frame):
+        """(Re)start the playback clock at the given frame."""
+        import time
+        from collections import deque
+        self.__start_time = time.time()
+        self.__start_frame = frame
+        self.__shown = frame
+        self.__shown_times = deque()
+        self.__ringbuffer.seek(frame + 1)
+
+    def on_play_toggled(self, checked):
+        self.play_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPause if checked else QStyle.SP_MediaPlay))
+        if checked:
+            self.play()
+        else:
+            self.pause()
+
+    def on_fps_changed(self, fps):
+        if self.playing:
+            self.__restart(self.__shown)
+            self.timer.setInterval(max(1, int(1000. / fps)))
+
+    def on_timer(self):
+        """
+        Show the most recent buffered frame up to the frame which is due according to the target frame rate. If that
+        frame is not loaded yet, the present frame stays, i.e. frames get dropped instead of delaying the playback.
+        """
+        import time
+        now = time.time()
+        last = self.segmentation.data.shape[2] - 1
+        due = min(last, self.__start_frame + int((now - self.__start_time) * self.fps_spin_box.value()))
+        if due > self.__shown:
+            found = self.__ringbuffer.latest(self.__shown + 1, due)
+            if found is not None:
+                self.__shown = found[0]
+                self.segmentation.active_frame = found[0]
+                self.__shown_times.append(now)
+
+        # report the number of frames shown within the last second
+        while len(self.__shown_times) > 0 and self.__shown_times[0] < now - 1.:
+            self.__shown_times.popleft()
+        if now - self.__start_time >= 1.:
+            self.fps_label.setText("{:.1f} fps".format(len(self.__shown_times)))
+
+        if self.__shown >= last:
+            self.pause()
+
     def on_active_frame_changed(self):
         self.frame_slider.setValue(self.segmentation.active_frame)
 
     def on_slider_changed(self, value):
+        # the slider follows the active frame, only frames selected by the user need to be set
+        if value == self.segmentation.active_frame:
+            return
+        if self.playing:
+            self.__restart(value)
         self.segmentation.active_frame = value
@@ -13,9 +13,9 @@ class RasterViewCanvas(CanvasBase):
     this yields a nice "spatial" y axis :-).
     """
 
-    def __init__(self, segmentation, selectionmodel):
+    def __init__(self, segmentation, selectionmodel, scheduler=None):
         # initialize the canvas where the Figure renders into
-        super(RasterViewCanvas, self).__init__()
+        super(RasterViewCanvas, self).__init__(scheduler=scheduler)
         self.segmentation = segmentation
         self.selectionmodel = selectionmodel
         self.parent_mask = None
@@ -31,9 +31,7 @@ class RasterViewCanvas(CanvasBase):
         self.segmentation.overlay_changed.append(self.on_overlay_change)
         self.segmentation.data_changed.append(self.on_data_change)
         self.segmentation.postprocessor_changed.append(self.on_data_change)
-
-        # cache calculated line scans in dictionary having the branch mask as key
-        self.__linescans = {}
+        self.segmentation.events_changed.append(self.on_events_change)
 
     def on_active_frame_change(self):
         if hasattr(self, "active_frame_line"):
@@ -42,17 +40,19 @@ class RasterViewCanvas(CanvasBase):
         self.draw()
 
     def on_overlay_change(self):
-        self.__linescans.clear()
         # force update
         if self.parent_mask is not None:
             self.redraw()
 
     def on_data_change(self):
-        self.__linescans.clear()
         # force update
         if self.parent_mask is not None:
             self.redraw()
 
+    def on_events_change(self, masks):
+        if self.parent_mask is not None and any(m in self.parent_mask.children for m in masks):
+            self.redraw()
+
     def set_mask(self, branch):
         if self.parent_mask is branch:
             return
@@ -66,6 +66,16 @@ class RasterViewCanvas(CanvasBase):
         self.redraw()
 
     def redraw(self):
+        """Calculate the linescan of the parent mask in the background and plot it once it is available."""
+        parent_mask = self.parent_mask
+        children = list(parent_mask.children)
+        self.submit("linescan", lambda: self.segmentation.traces(children),
+                    lambda linescan: self.__plot(parent_mask, children, linescan))
+
+    def __plot(self, parent_mask, children, linescan):
+        if parent_mask is not self.parent_mask:
+            # the parent mask was replaced while the linescan was calculated
+            return
         with self.draw_on_exit():
             # remove the old linescan image
             if self.imglinescan is not None:
@@ -75,10 +85,10 @@ class RasterViewCanvas(CanvasBase):
                 self.scatterevents.remove()
                 self.scatterevents = None
 
-            if len(self.parent_mask.children) > 0:
+            if len(linescan) > 0:
                 tmax = self.segmentation.data.shape[-1]
-                nsegments = len(self.parent_mask.children)
-                self.imglinescan = self.axes.imshow(self.linescan, interpolation='nearest', aspect='auto',
+                nsegments = len(linescan)
+                self.imglinescan = self.axes.imshow(linescan, interpolation='nearest', aspect='auto',
                                                     cmap='viridis', extent=(0, tmax, nsegments, 0))
                 self.axes.set_ylim(nsegments, 0)
 
@@ -87,7 +97,7 @@ class RasterViewCanvas(CanvasBase):
                 eventsx = []
                 eventsy = []
                 colors = []
-                for i, child in enumerate(self.parent_mask.children):
+                for i, child in enumerate(children):
                     if hasattr(child, "events"):
                         if not hasattr(child, "color"):
                             child.color = cycol()
@@ -101,24 +111,15 @@ class RasterViewCanvas(CanvasBase):
 
     def on_mask_change(self, branch):
         """Will be called when the parent masks number of children changes."""
-        if branch in self.__linescans:
-            del self.__linescans[branch]
         self.redraw()
 
     @property
     def linescan(self):
         """
         Calculate the trace for all children and return a 2D array aka linescan for that branch roi.
+        The traces are cached by :py:meth:`samuroi.SamuROIData.traces`.
         """
-        if self.parent_mask in self.__linescans:
-            return self.__linescans[self.parent_mask]
-        import numpy
-        data = self.segmentation.data
-        overlay = self.segmentation.overlay
-        postprocessor = self.segmentation.postprocessor
-        self.__linescans[self.parent_mask] = numpy.row_stack(
-            (postprocessor(child(data, overlay)) for child in self.parent_mask.children))
-        return self.__linescans[self.parent_mask]
+        return self.segmentation.traces(self.parent_mask.children)
 
     def onclick(self, event):
         if self.parent_mask is not None and event.ydata is not None:
@@ -136,10 +137,11 @@ class RasterViewCanvas(CanvasBase):
 
 
 class RasterViewDockWidget(QDockWidget):
-    def __init__(self, name, parent, segmentation):
+    def __init__(self, name, parent, segmentation, scheduler=None):
         super(RasterViewDockWidget, self).__init__(name, parent)
 
-        self.canvas = RasterViewCanvas(segmentation=segmentation, selectionmodel=parent.roiselectionmodel)
+        self.canvas = RasterViewCanvas(segmentation=segmentation, selectionmodel=parent.roiselectionmodel,
+                                       scheduler=scheduler)
 
         from PyQt5 import QtCore
         from matplotlib.backends.backend_qt4agg import NavigationToolbar2QT
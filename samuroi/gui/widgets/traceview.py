@@ -9,9 +9,9 @@ from .canvasbase import CanvasBase
 class TraceViewCanvas(CanvasBase):
     """Plot a set of traces for a selection defined by a QtSelectionModel"""
 
-    def __init__(self, segmentation, selectionmodel):
+    def __init__(self, segmentation, selectionmodel, scheduler=None):
         # initialize the canvas where the Figure renders into
-        super(TraceViewCanvas, self).__init__()
+        super(TraceViewCanvas, self).__init__(scheduler=scheduler)
 
         self.segmentation = segmentation
         self.selectionmodel = selectionmodel
@@ -24,6 +24,8 @@ class TraceViewCanvas(CanvasBase):
         self.__artist = {}
         # a dictionary mapping from mask to trace line artist
         self.__traces = {}
+        # the selected masks whose traces are still being calculated
+        self.__pending = []
 
         self.segmentation.active_frame_changed.append(self.on_active_frame_change)
 
@@ -32,6 +34,7 @@ class TraceViewCanvas(CanvasBase):
         self.segmentation.overlay_changed.append(self.update_traces)
         self.segmentation.data_changed.append(self.update_traces)
         self.segmentation.postprocessor_changed.append(self.update_traces)
+        self.segmentation.events_changed.append(self.on_events_changed)
 
         self.mpl_connect('button_press_event', self.onclick)
 
@@ -43,11 +46,16 @@ class TraceViewCanvas(CanvasBase):
         return next(artist for artist in self.axes.artists if artist.mask is mask)
 
     def update_traces(self):
+        masks = list(self.__traces.keys())
+        self.submit("update", lambda: self.segmentation.traces(masks), lambda traces: self.__set_traces(masks, traces))
+
+    def __set_traces(self, masks, traces):
         tmax = self.segmentation.data.shape[-1]
         x = numpy.linspace(0, tmax, tmax, False, dtype=int)
-        for mask, line in self.__traces.items():
-            tracedata = self.segmentation.postprocessor(mask(self.segmentation.data, self.segmentation.overlay))
-            line.set_data(x, tracedata)
+        for mask, tracedata in zip(masks, traces):
+            # the mask might have been deselected while its trace was calculated
+            if mask in self.__traces:
+                self.__traces[mask].set_data(x, tracedata)
         self.axes.relim()
         self.axes.autoscale_view(scalex=False)
         self.draw()
@@ -55,10 +63,30 @@ class TraceViewCanvas(CanvasBase):
     def on_mask_change(self, modified_mask):
         self.update_traces()
 
+    def on_events_changed(self, masks):
+        for mask in masks:
+            if mask in self.__artist:
+                # keep the trace line, but replace the event lines
+                for artist in self.__artist[mask][1:]:
+                    artist.remove()
+                self.__artist[mask] = [self.__traces[mask]] + self.__plot_events(mask)
+        self.draw()
+
+    def __plot_events(self, mask):
+        lines = []
+        if hasattr(mask, "events"):
+            for x in mask.events.indices:
+                line = self.axes.axvline(x=x - len(mask.events.kernel) / 2, c=mask.color, lw=2)
+                lines.append(line)
+        return lines
+
     def on_selection_changed(self, selected, deselected):
+        removed = False
         for range in deselected:
             for index in range.indexes():
                 item = index.internalPointer()
+                if item.mask is not None and item.mask in self.__pending:
+                    self.__pending.remove(item.mask)
                 # the selection could also be a whole tree of e.g. BranchMasks
                 if item.mask is not None and item.mask in self.__artist:
                     # disconnect from the artist change slot
@@ -69,31 +97,42 @@ class TraceViewCanvas(CanvasBase):
                         artist.remove()
                     del self.__artist[item.mask]
                     del self.__traces[item.mask]
-        from itertools import cycle
-        cycol = cycle('bgrcmk').__next__
+                    removed = True
 
+        # gather all newly selected masks, such that their traces can be calculated in one go. the masks of a
+        # superseded job are still pending and get calculated together with the new ones.
         for range in selected:
             for index in range.indexes():
                 item = index.internalPointer()
-                if item.mask is not None and item.mask not in self.__artist:
-                    # connect to the masks changed slot
-                    if (hasattr(item.mask, "changed")):
-                        item.mask.changed.append(self.on_mask_change)
-                    artists = []
-                    if not hasattr(item.mask, "color"):
-                        item.mask.color = cycol()
-                    tracedata = self.segmentation.postprocessor(
-                        item.mask(self.segmentation.data, self.segmentation.overlay))
-                    line, = self.axes.plot(tracedata, color=item.mask.color)
-                    self.__traces[item.mask] = line
-                    # put a handle of the mask on the artist
-                    line.mask = item.mask
-                    artists.append(line)
-                    if hasattr(item.mask, "events"):
-                        for x in item.mask.events.indices:
-                            line = self.axes.axvline(x=x - len(item.mask.events.kernel) / 2, c=item.mask.color, lw=2)
-                            artists.append(line)
-                    self.__artist[item.mask] = artists
+                if item.mask is not None and item.mask not in self.__artist and item.mask not in self.__pending:
+                    self.__pending.append(item.mask)
+
+        if removed:
+            self.draw()
+
+        masks = list(self.__pending)
+        if len(masks) > 0:
+            self.submit("select", lambda: self.segmentation.traces(masks), lambda traces: self.__add_traces(masks, traces))
+
+    def __add_traces(self, masks, traces):
+        from itertools import cycle
+        cycol = cycle('bgrcmk').__next__
+
+        for mask, tracedata in zip(masks, traces):
+            # skip masks which got deselected in the meantime
+            if mask not in self.__pending:
+                continue
+            self.__pending.remove(mask)
+            # connect to the masks changed slot
+            if (hasattr(mask, "changed")):
+                mask.changed.append(self.on_mask_change)
+            if not hasattr(mask, "color"):
+                mask.color = cycol()
+            line, = self.axes.plot(tracedata, color=mask.color)
+            self.__traces[mask] = line
+            # put a handle of the mask on the artist
+            line.mask = mask
+            self.__artist[mask] = [line] + self.__plot_events(mask)
 
         self.draw()
 
@@ -109,10 +148,10 @@ class TraceViewCanvas(CanvasBase):
 
 
 class TraceViewDockWidget(QDockWidget):
-    def __init__(self, name, parent, segmentation, selectionmodel):
+    def __init__(self, name, parent, segmentation, selectionmodel, scheduler=None):
         super(TraceViewDockWidget, self).__init__(name, parent)
 
-        self.canvas = TraceViewCanvas(segmentation=segmentation, selectionmodel=selectionmodel)
+        self.canvas = TraceViewCanvas(segmentation=segmentation, selectionmodel=selectionmodel, scheduler=scheduler)
 
         from PyQt5 import QtCore
         from matplotlib.backends.backend_qt4agg import NavigationToolbar2QT
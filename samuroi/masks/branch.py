@@ -57,9 +57,20 @@ class BranchMask(Mask):
     def __call__(self, data, mask):
         return self.__polygon(data, mask)
 
+    def sparse_weights(self, shape, mask):
+        return self.__polygon.sparse_weights(shape, mask)
+
+    @classmethod
+    def rasterize_many(cls, masks):
+        """Rasterize the polygons of many branches in one batched pass, see :py:meth:`samuroi.masks.polygon.PolygonMask.rasterize_many`."""
+        from .polygon import PolygonMask
+        PolygonMask.rasterize_many([m.__polygon for m in masks])
+
     def to_hdf5(self, f):
         if 'branches' not in f:
             f.create_group('branches')
+        # replace a previously stored version of this branch
+        BranchMask.remove_hdf5(f, [self.name])
         f.create_group('branches/' + self.name)
         f.create_dataset('branches/' + self.name + '/data', data=self.data)
         f.create_dataset('branches/' + self.name + '/outline', data=self.outline)
@@ -71,16 +82,22 @@ class BranchMask(Mask):
                 f.create_dataset('branches/{}/segments/{}/data'.format(self.name, s.name), data=s.data)
                 f.create_dataset('branches/{}/segments/{}/outline'.format(self.name, s.name), data=s.outline)
 
+    @classmethod
+    def remove_hdf5(cls, f, names):
+        for name in names:
+            if 'branches/' + name in f:
+                del f['branches/' + name]
+
     @staticmethod
     def from_hdf5(f):
         if 'branches' in f:
             for name in list(f['branches'].keys()):
-                data = f['branches/' + name + '/data'].value
+                data = f['branches/' + name + '/data'][()]
                 branch = BranchMask(name=name, data=data)
                 if 'segments' in f['branches/' + name]:
                     for childname in list(f['branches/' + name + '/segments'].keys()):
                         child = SegmentMask(parent=branch,
-                                            data=f['branches/' + name + '/segments/' + childname + '/data'].value)
+                                            data=f['branches/' + name + '/segments/' + childname + '/data'][()])
                         child.name = childname
                         branch.children.append(child)
                 yield branch
@@ -88,11 +105,7 @@ class BranchMask(Mask):
     def move(self, offset):
         """Move the branch and all its children."""
 
-        new_x = self.data['x'] + offset[0]
-        new_y = self.data['y'] + offset[1]
-
-        dtype = [('x', float), ('y', float), ('z', float), ('radius', float)]
-        self.branch.data = numpy.rec.fromarrays([new_x, new_y, self.data['z'], self.data['radius']], dtype=dtype)
+        self.branch = self.branch.moved(offset)
 
         from .polygon import PolygonMask
         self.__polygon = PolygonMask(outline=self.outline)
@@ -121,6 +134,26 @@ class BranchMask(Mask):
         self.segments = [SegmentMask(data=b.data, parent=self) for b in branches]
         self.changed(self)
 
+    @classmethod
+    def split_many(cls, masks, nsegments=2, length=None):
+        """
+        Split many branches at once via :py:func:`samuroi.util.branch.split_branches` and rasterize all resulting
+        segments in one batched pass. The result is the same as calling
+        :py:meth:`samuroi.masks.branch.BranchMask.split` with `k=1` and `s=0` on each mask.
+
+        :param masks: list of :py:class:`samuroi.masks.branch.BranchMask`.
+        :param nsegments: the number of segments per branch.
+        :param length: the length of each segment (the last segment will have the remainder of modulo division).
+        """
+        from ..util.branch import split_branches
+        masks = list(masks)
+        splits = split_branches([m.branch for m in masks], nsegments=nsegments, length=length)
+        for m, branches in zip(masks, splits):
+            m.segments = [SegmentMask(data=b.data, parent=m) for b in branches]
+        SegmentMask.rasterize_many([s for m in masks for s in m.segments])
+        for m in masks:
+            m.changed(m)
+
     def linescan(self, data, mask):
         """
         Calculate the trace for all children and return a 2D array of traces.
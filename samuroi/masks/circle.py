@@ -44,19 +44,65 @@ class CircleMask(Mask):
 
         self.changed(self)
 
+    @classmethod
+    def rasterize_many(cls, masks):
+        """Rasterize the polygons of many circles in one batched pass, see :py:meth:`samuroi.masks.polygon.PolygonMask.rasterize_many`."""
+        from .polygon import PolygonMask
+        PolygonMask.rasterize_many([m.__polygon for m in masks])
+
     def to_hdf5(self, f):
+        CircleMask.to_hdf5_many(f, [self])
+
+    @classmethod
+    def to_hdf5_many(cls, f, masks):
+        """
+        Store all circles in the table 'circles' with columns x, y and radius. Circles that were stored before and are
+        not among the given masks are kept.
+        """
+        import numpy
+        from ..util.hdf5 import write_table
+        masks = list(masks)
+        names = [m.name for m in masks]
+        known = set(names)
+        rows = [[m.center[0], m.center[1], m.radius] for m in masks]
+        for name, center, radius in CircleMask.__stored(f):
+            if name not in known:
+                names.append(name)
+                rows.append([center[0], center[1], radius])
+        write_table(f, 'circles', names, columns={'table': numpy.array(rows, dtype=float).reshape(-1, 3)})
+
+    @classmethod
+    def remove_hdf5(cls, f, names):
+        from ..util.hdf5 import is_table, remove_from_table
+        if 'circles' in f and is_table(f['circles']):
+            remove_from_table(f, 'circles', names)
+        elif 'circles' in f:
+            for name in names:
+                if name in f['circles']:
+                    del f['circles/' + name]
+
+    @staticmethod
+    def __stored(f):
         if 'circles' not in f:
-            f.create_group('circles')
-        data = [self.center[0], self.center[1], self.radius]
-        f.create_dataset('circles/' + self.name, data=data)
+            return
+        from ..util.hdf5 import is_table, read_table
+        if is_table(f['circles']):
+            names, columns, ragged = read_table(f, 'circles', columns=['table'])
+            for name, row in zip(names, columns['table']):
+                yield name, row[0:2], row[2]
+        else:
+            # the layout of older files with one dataset per circle
+            for name, dataset in f['circles'].items():
+                value = dataset[()]
+                yield name, value[0:2], value[2]
 
     @staticmethod
     def from_hdf5(f):
-        if 'circles' in f:
-            for name, dataset in f['circles'].items():
-                center = dataset.value[0:2]
-                radius = dataset.value[2]
-                yield CircleMask(name=name, center=center, radius=radius)
+        for name, center, radius in CircleMask.__stored(f):
+            yield CircleMask(name=name, center=center, radius=radius)
 
     def __call__(self, data, mask):
         return self.__polygon(data, mask)
+
+    def sparse_weights(self, shape, mask):
+        return self.__polygon.sparse_weights(shape, mask)
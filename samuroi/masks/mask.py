@@ -1,5 +1,17 @@
 from abc import abstractmethod
 
+import numpy
+
+
+def normalized(indices, weights, total):
+    """
+    Normalize the weights of :py:meth:`samuroi.masks.mask.Mask.sparse_weights` by the given total.
+    If the total is zero the trace becomes nan, just as the division by zero in the respective `__call__` would yield.
+    """
+    if total == 0:
+        return numpy.zeros(1, dtype=int), numpy.full(1, numpy.nan)
+    return indices, weights / float(total)
+
 
 class Mask(object):
     """If a mask is mutable, it needs to provide a changed signal, which is supposed to be triggered upon modification."""
@@ -26,6 +38,22 @@ class Mask(object):
         """
         raise NotImplementedError()
 
+    def sparse_weights(self, shape, mask):
+        """
+        Get the linear weights which turn the video data into the time trace of this mask. The trace is the weighted sum
+        over the selected pixels of the flattened video, i.e. the same as
+        `(data.reshape(-1, T)[indices] * weights[:, numpy.newaxis]).sum(axis=0)`.
+        This allows to calculate the traces of many masks within a single pass over the data
+        (see :py:func:`samuroi.util.traces.weight_matrix`).
+        Masks which can not be expressed by linear weights don't need to implement this function, their traces will
+        be calculated with :py:meth:`samuroi.masks.mask.Mask.__call__` instead.
+
+        :param shape: the image shape (Y,X) of the video data.
+        :param mask: a 2D mask array with the given shape.
+        :return: tuple (indices, weights) of 1D arrays, where indices are the flat indices of the pixels.
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     def to_hdf5(self, f):
         """
@@ -34,6 +62,29 @@ class Mask(object):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def to_hdf5_many(cls, f, masks):
+        """
+        Save many masks of this type to an opened hd5 file. Mask types which store all their masks in one consolidated
+        table (see :py:func:`samuroi.util.hdf5.write_table`) override this to write the table just once.
+
+        :param f: the hd5 file handle.
+        :param masks: iterable of masks of this type.
+        """
+        for m in masks:
+            m.to_hdf5(f)
+
+    @classmethod
+    def remove_hdf5(cls, f, names):
+        """
+        Remove the stored masks of this type with the given names from an opened hd5 file. This allows to update a
+        file incrementally (see :py:meth:`samuroi.SamuROIData.save_hdf5`). Names which are not stored are ignored.
+
+        :param f: the hd5 file handle.
+        :param names: iterable of mask names.
+        """
+        pass
+
     def __suffix(self):
         if type(self) not in Mask.__count:
             Mask.__count[type(self)] = -1
@@ -1,4 +1,5 @@
-from .mask import Mask
+from .mask import Mask, normalized
+from ..util.video import pixels
 
 
 class PixelMask(Mask):
@@ -20,21 +21,231 @@ class PixelMask(Mask):
         return self.__y
 
     def to_hdf5(self, f):
+        PixelMask.to_hdf5_many(f, [self])
+
+    @classmethod
+    def to_hdf5_many(cls, f, masks):
+        """
+        Store all pixel masks in the table 'pixels', where the (x,y) coordinates of all masks are concatenated into
+        the ragged column 'xy'. Pixel masks that were stored before and are not among the given masks are kept.
+        """
         import numpy
+        from ..util.hdf5 import write_table
+        masks = list(masks)
+        names = [m.name for m in masks]
+        known = set(names)
+        xy = [numpy.column_stack((m.x, m.y)) for m in masks]
+        for name, x, y in PixelMask.__stored(f):
+            if name not in known:
+                names.append(name)
+                xy.append(numpy.column_stack((x, y)))
+        write_table(f, 'pixels', names, ragged={'xy': xy})
+
+    @classmethod
+    def remove_hdf5(cls, f, names):
+        from ..util.hdf5 import is_table, remove_from_table
+        if 'pixels' in f and is_table(f['pixels']):
+            remove_from_table(f, 'pixels', names)
+        elif 'pixels' in f:
+            for name in names:
+                if name in f['pixels']:
+                    del f['pixels/' + name]
+
+    @staticmethod
+    def __stored(f):
         if 'pixels' not in f:
-            f.create_group('pixels')
-        f.create_dataset('pixels/' + self.name, data=numpy.column_stack((self.__x, self.__y)))
+            return
+        from ..util.hdf5 import is_table, read_table
+        if is_table(f['pixels']):
+            names, columns, ragged = read_table(f, 'pixels', ragged=['xy'])
+            for name, xy in zip(names, ragged['xy']):
+                yield name, xy[:, 0], xy[:, 1]
+        else:
+            # the layout of older files with one dataset per mask
+            for name, dataset in f['pixels'].items():
+                value = dataset[()]
+                yield name, value[:, 0], value[:, 1]
 
     @staticmethod
     def from_hdf5(f):
-        if 'pixels' in f:
-            for name, dataset in f['pixels'].items():
-                yield PixelMask(name=name, x=dataset.value[:, 0], y=dataset.value[:, 1])
+        for name, x, y in PixelMask.__stored(f):
+            yield PixelMask(name=name, x=x, y=y)
 
     def __call__(self, data, mask):
-        # get a view on the data for own pixels. shape N x T where N is number of pixels
-        data_p = data[self.__y, self.__x, :]
+        # get the data for own pixels. shape N x T where N is number of pixels
+        data_p = pixels(data, self.__y, self.__x)
         # get a view on the mask for own pixels. shape N x 1 for broadcasting
         mask_p = mask[self.__y, self.__x].reshape(-1, 1)
 
         return (data_p * mask_p).mean(axis=0)
+
+    def sparse_weights(self, shape, mask):
+        import numpy
+        y, x = numpy.asarray(self.__y, dtype=int), numpy.asarray(self.__x, dtype=int)
+        return normalized(numpy.ravel_multi_index((y, x), shape), mask[y, x].astype(float), len(y))
+
+
+class PixelMaskCollection(Mask):
+    """
+    Many pixel masks stored in compressed sparse row form: the coordinates of all pixels are concatenated into the
+    arrays `y` and `x`, the pixels of child i are `y[offsets[i]:offsets[i+1]]` and `x[offsets[i]:offsets[i+1]]`.
+
+    The children implement the mask interface and get listed in the :py:class:`samuroi.maskset.MaskSet` like the
+    children of a :py:class:`samuroi.masks.segmentation.Segmentation`, but the traces of all children are calculated
+    at once by :py:meth:`samuroi.masks.pixel.PixelMaskCollection.linescan`, with a single gather over the video and a
+    segmented sum.
+    """
+
+    class Child(Mask):
+        """A proxy object that implements the mask interface but is just a facade around one row of the collection."""
+
+        def __init__(self, parent, index, name=None):
+            Mask.__init__(self, name=parent.name + ": " + str(index) if name is None else name)
+            self.__parent = parent
+            self.__index = index
+
+        @property
+        def parent(self):
+            return self.__parent
+
+        @property
+        def collection(self):
+            """The collection which calculates the traces of all its children at once."""
+            return self.__parent
+
+        @property
+        def index(self):
+            """The row of this child within the collection."""
+            return self.__index
+
+        @property
+        def x(self):
+            return self.__parent.x[self.__parent.offsets[self.__index]:self.__parent.offsets[self.__index + 1]]
+
+        @property
+        def y(self):
+            return self.__parent.y[self.__parent.offsets[self.__index]:self.__parent.offsets[self.__index + 1]]
+
+        def __call__(self, data, mask):
+            return self.__parent.linescan(data, mask, [self.__index])[0]
+
+        def sparse_weights(self, shape, mask):
+            import numpy
+            y, x = self.y, self.x
+            return normalized(numpy.ravel_multi_index((y, x), shape), mask[y, x].astype(float), len(y))
+
+    def __init__(self, offsets, y, x, name=None, names=None):
+        """
+        :param offsets: 1D int array with one entry more than there are children, starting with 0.
+        :param y: 1D int array with the row indices of all pixels.
+        :param x: 1D int array with the column indices of all pixels.
+        :param name: the name of the collection.
+        :param names: optional list with the names of the children.
+        """
+        import numpy
+        Mask.__init__(self, name=name)
+        self.__offsets = numpy.asarray(offsets, dtype=int)
+        self.__y = numpy.asarray(y, dtype=int)
+        self.__x = numpy.asarray(x, dtype=int)
+        if len(self.__offsets) == 0 or self.__offsets[0] != 0 or self.__offsets[-1] != len(self.__y) \
+                or len(self.__y) != len(self.__x) or numpy.any(numpy.diff(self.__offsets) < 0):
+            raise Exception("Offsets need to be increasing from 0 to the number of pixels.")
+        if names is None:
+            names = [None] * (len(self.__offsets) - 1)
+        self.__children = [PixelMaskCollection.Child(self, i, name=n) for i, n in enumerate(names)]
+
+    @classmethod
+    def from_masks(cls, masks, name=None):
+        """
+        Create a collection holding the pixels of the given masks, e.g. a list of :py:class:`samuroi.masks.pixel.PixelMask`.
+        The children get the names of the masks.
+        """
+        import numpy
+        masks = list(masks)
+        offsets = numpy.zeros(len(masks) + 1, dtype=int)
+        offsets[1:] = numpy.cumsum([len(m.y) for m in masks])
+        y = numpy.concatenate([numpy.asarray(m.y, dtype=int) for m in masks] + [numpy.zeros(0, dtype=int)])
+        x = numpy.concatenate([numpy.asarray(m.x, dtype=int) for m in masks] + [numpy.zeros(0, dtype=int)])
+        return cls(offsets, y, x, name=name, names=[m.name for m in masks])
+
+    @property
+    def offsets(self):
+        return self.__offsets
+
+    @property
+    def x(self):
+        return self.__x
+
+    @property
+    def y(self):
+        return self.__y
+
+    @property
+    def children(self):
+        return self.__children
+
+    def linescan(self, data, mask, indices=None):
+        """
+        Calculate the traces of the children, i.e. the mean over the masked pixels of each child. The pixels of all
+        requested children are gathered with a single indexing of the video and summed per child with
+        :py:func:`numpy.add.reduceat`.
+
+        :param data: the data to apply on.
+        :param mask: some additional overlay mask.
+        :param indices: optional list with the rows of the children, defaults to all children.
+        :return: 2D numpy array holding one trace per child, children without pixels get nan traces.
+        """
+        import numpy
+        starts, stops = self.__offsets[:-1], self.__offsets[1:]
+        if indices is not None:
+            starts, stops = starts[indices], stops[indices]
+        counts = stops - starts
+        traces = numpy.full((len(starts), data.shape[-1]), numpy.nan)
+        nonempty = numpy.flatnonzero(counts > 0)
+        if len(nonempty) == 0:
+            return traces
+
+        # the positions of the requested pixels within the concatenated coordinates
+        counts = counts[nonempty]
+        segments = numpy.r_[0, numpy.cumsum(counts)[:-1]]
+        positions = numpy.arange(counts.sum()) - numpy.repeat(segments - starts[nonempty], counts)
+        y, x = self.__y[positions], self.__x[positions]
+
+        data_p = pixels(data, y, x) * mask[y, x].reshape(-1, 1)
+        traces[nonempty] = numpy.add.reduceat(data_p, segments, axis=0) / counts.reshape(-1, 1)
+        return traces
+
+    def __call__(self, data, mask):
+        import numpy
+        return numpy.zeros(dtype=float, shape=[data.shape[-1]])
+
+    def sparse_weights(self, shape, mask):
+        import numpy
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=float)
+
+    def to_hdf5(self, f):
+        from ..util.hdf5 import write_names
+        if 'pixelcollections' not in f:
+            f.create_group('pixelcollections')
+        # replace a previously stored version of this collection
+        PixelMaskCollection.remove_hdf5(f, [self.name])
+        group = f.create_group('pixelcollections/' + self.name)
+        group.create_dataset('offsets', data=self.offsets)
+        group.create_dataset('y', data=self.y)
+        group.create_dataset('x', data=self.x)
+        write_names(group, [c.name for c in self.children])
+
+    @classmethod
+    def remove_hdf5(cls, f, names):
+        for name in names:
+            if 'pixelcollections/' + name in f:
+                del f['pixelcollections/' + name]
+
+    @staticmethod
+    def from_hdf5(f):
+        from ..util.hdf5 import read_names
+        if 'pixelcollections' in f:
+            for name in list(f['pixelcollections'].keys()):
+                group = f['pixelcollections/' + name]
+                yield PixelMaskCollection(offsets=group['offsets'][()], y=group['y'][()], x=group['x'][()], name=name,
+                                          names=read_names(group))
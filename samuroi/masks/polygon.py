@@ -1,6 +1,6 @@
 import numpy
 
-from .mask import Mask
+from .mask import Mask, normalized
 from ..util.event import Event
 
 class PolygonMask(Mask):
@@ -11,6 +11,10 @@ class PolygonMask(Mask):
     def __init__(self, outline, name=None):
         super(PolygonMask, self).__init__(name=name)
         self.__outline = outline
+        # the rasterized polygon, see coverage
+        self.__coverage = None
+        # the rasterized polygon clipped to the last used image shape
+        self.__clipped = None
         self.changed = Event()
 
     @property
@@ -19,63 +23,137 @@ class PolygonMask(Mask):
 
     @property
     def lowerleft(self):
-        return numpy.min(self.outline, axis=0).astype(int)
+        # floor like polygon_coverage, truncating would cut off pixels at negative coordinates
+        return numpy.floor(numpy.min(self.outline, axis=0)).astype(int)
 
     @property
     def upperright(self):
-        return numpy.max(self.outline, axis=0).astype(int) + 1
+        return numpy.floor(numpy.max(self.outline, axis=0)).astype(int) + 1
 
     def move(self, offset):
         self.__outline[:, 0] += offset[0]
         self.__outline[:, 1] += offset[1]
+        self.__coverage = None
+        self.__clipped = None
         self.changed(self)
 
     def to_hdf5(self, f):
+        PolygonMask.to_hdf5_many(f, [self])
+
+    @classmethod
+    def to_hdf5_many(cls, f, masks):
+        """
+        Store all polygons in the table 'polygons', where the outlines of all polygons are concatenated into the ragged
+        column 'outline'. Polygons that were stored before and are not among the given masks are kept.
+        """
+        from ..util.hdf5 import write_table
+        masks = list(masks)
+        names = [m.name for m in masks]
+        known = set(names)
+        outlines = [m.outline for m in masks]
+        for name, outline in PolygonMask.__stored(f):
+            if name not in known:
+                names.append(name)
+                outlines.append(outline)
+        write_table(f, 'polygons', names, ragged={'outline': outlines})
+
+    @classmethod
+    def remove_hdf5(cls, f, names):
+        from ..util.hdf5 import is_table, remove_from_table
+        if 'polygons' in f and is_table(f['polygons']):
+            remove_from_table(f, 'polygons', names)
+        elif 'polygons' in f:
+            for name in names:
+                if name in f['polygons']:
+                    del f['polygons/' + name]
+
+    @staticmethod
+    def __stored(f):
         if 'polygons' not in f:
-            f.create_group('polygons')
-        f.create_dataset('polygons/' + self.name, data=self.outline)
+            return
+        from ..util.hdf5 import is_table, read_table
+        if is_table(f['polygons']):
+            names, columns, ragged = read_table(f, 'polygons', ragged=['outline'])
+            for name, outline in zip(names, ragged['outline']):
+                yield name, outline
+        else:
+            # the layout of older files with one dataset per polygon
+            for name, dataset in f['polygons'].items():
+                yield name, dataset[()]
 
     @staticmethod
     def from_hdf5(f):
-        if 'polygons' in f:
-            for name, dataset in f['polygons'].items():
-                yield PolygonMask(name=name, outline=dataset.value)
+        for name, outline in PolygonMask.__stored(f):
+            yield PolygonMask(name=name, outline=outline)
+
+    @property
+    def coverage(self):
+        """
+        The rasterized polygon in compact form. The rasterization is only calculated once and reused until the polygon
+        gets moved.
+
+        :return: tuple (rows, cols, coverage) of 1D arrays, holding the coordinates of all pixels touched by the polygon
+            and the fraction of each pixel that is covered by the polygon.
+        """
+        if self.__coverage is None:
+            PolygonMask.rasterize_many([self])
+        return self.__coverage
+
+    @classmethod
+    def rasterize_many(cls, masks):
+        """
+        Calculate the :py:attr:`samuroi.masks.polygon.PolygonMask.coverage` of many polygons in one batched pass, see
+        :py:func:`samuroi.util.rasterize.polygon_coverage`. Polygons whose coverage is known already are skipped.
+
+        :param masks: list of :py:class:`samuroi.masks.polygon.PolygonMask`.
+        """
+        from ..util.rasterize import polygon_coverage
+        masks = [m for m in masks if m.__coverage is None]
+        for m, coverage in zip(masks, polygon_coverage([m.outline for m in masks])):
+            m.__coverage = coverage
 
     @property
     def weights(self):
         """Generate the weight mask of the rectangular area covering the given polygon."""
-        # shift the polygon such that ll is the new origin
-        spoly = self.outline - self.lowerleft
-
-        # width and height of roi
+        rows, cols, coverage = self.coverage
+        Cl, Rl = self.lowerleft
         W, H = (self.upperright - self.lowerleft)
-
-        from PIL import Image, ImageDraw
-        mimg = Image.new('I', (W * 10, H * 10), 0)
-        l = [(r[0] * 10, r[1] * 10) for r in spoly]
-        ImageDraw.Draw(mimg).polygon(xy=l, outline=False, fill=1)
-
-        # create a numpy array of the image where the extra resolution pixels are wrapped into extra dimensions
-        mimg = numpy.array(mimg).reshape((H, 10, W, 10))
-
-        return mimg.sum(axis=1).sum(axis=-1).astype(float) / 100.
+        weights = numpy.zeros(shape=(H, W), dtype=float)
+        weights[rows - Rl, cols - Cl] = coverage
+        return weights
+
+    def clipped_coverage(self, shape):
+        """
+        Same as :py:attr:`samuroi.masks.polygon.PolygonMask.coverage` but without the pixels outside of an image with
+        given shape. The result for the last used shape is cached.
+
+        :param shape: the image shape (Y,X)
+        """
+        shape = tuple(shape)
+        if self.__clipped is None or self.__clipped[0] != shape:
+            rows, cols, coverage = self.coverage
+            inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+            self.__clipped = (shape, rows[inside], cols[inside], coverage[inside])
+        return self.__clipped[1:]
 
     def __call__(self, data, mask=None):
-        # get the rectangular fov that fully covers a polygon
+        rows, cols, weights = self.clipped_coverage(data.shape[0:2])
+
+        # get a view on the rectangular fov that fully covers the polygon, slicing also works for non numpy data
         rowslice = slice(max(self.lowerleft[1], 0), min(self.upperright[1], data.shape[0]))
         colslice = slice(max(self.lowerleft[0], 0), min(self.upperright[0], data.shape[1]))
-        # get a view on the data of interest
-        dataview = data[rowslice, colslice]
-        Cs, Rs = (self.upperright - self.lowerleft)
-        Cl, Rl = self.lowerleft
-        weightmask = self.weights[max(-Rl, 0):min(Rs, data.shape[0] - Rl), max(-Cl, 0):min(Cs, data.shape[1] - Cl)]
+        dataview = numpy.asarray(data[rowslice, colslice])
 
-        if mask is None:
-            doi = weightmask[..., numpy.newaxis] * dataview
-            weight = weightmask.sum()
-        else:
-            mask = mask[rowslice, colslice]
-            doi = weightmask[..., numpy.newaxis] * mask[..., numpy.newaxis] * dataview
-            weight = (weightmask * mask).sum()
+        if mask is not None:
+            weights = weights * mask[rows, cols]
+
+        doi = weights[:, numpy.newaxis] * dataview[rows - rowslice.start, cols - colslice.start]
+        return doi.sum(axis=0) / weights.sum()
+
+    def sparse_weights(self, shape, mask=None):
+        rows, cols, weights = self.clipped_coverage(shape)
+
+        if mask is not None:
+            weights = weights * mask[rows, cols]
 
-        return doi.sum(axis=0).sum(axis=0) / weight
+        return normalized(numpy.ravel_multi_index((rows, cols), shape), weights, weights.sum())
@@ -29,13 +29,18 @@ class SegmentMask(Mask):
     def __call__(self, data, mask):
         return self.__polygon(data, mask)
 
+    def sparse_weights(self, shape, mask):
+        return self.__polygon.sparse_weights(shape, mask)
+
+    @classmethod
+    def rasterize_many(cls, segments):
+        """Rasterize the polygons of many segments in one batched pass, see :py:meth:`samuroi.masks.polygon.PolygonMask.rasterize_many`."""
+        from .polygon import PolygonMask
+        PolygonMask.rasterize_many([s.__polygon for s in segments])
+
     def move(self, offset):
         """Move the segment don't trigger any event since this will be handled by the parent branch object."""
-        new_x = self.data['x'] + offset[0]
-        new_y = self.data['y'] + offset[1]
-        import numpy
-        dtype = [('x', float), ('y', float), ('z', float), ('radius', float)]
-        self.branch.data = numpy.rec.fromarrays([new_x, new_y, self.data['z'], self.data['radius']], dtype=dtype)
+        self.branch = self.branch.moved(offset)
 
         from .polygon import PolygonMask
         self.__polygon = PolygonMask(outline=self.outline)
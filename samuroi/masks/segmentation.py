@@ -1,6 +1,7 @@
 import numpy
 
-from .mask import Mask
+from .mask import Mask, normalized
+from ..util.video import pixels
 
 
 class Segmentation(Mask):
@@ -12,20 +13,32 @@ class Segmentation(Mask):
     class Child(Mask):
         """A proxy object that implements the mask interface but is just a facade around one index of the segmentation"""
 
-        def __init__(self, parent, index):
+        def __init__(self, parent, index, y=None, x=None):
+            """
+            :param parent: the segmentation.
+            :param index: the label of this child within the segmentation data.
+            :param y: optional precomputed row indices of all pixels with the given label.
+            :param x: optional precomputed column indices of all pixels with the given label.
+            """
             Mask.__init__(self, name=parent.name + ": " + str(index))
             self.__index = index
             self.__parent = parent
-            self.__y, self.__x = numpy.where(parent.data == index)
+            if y is None or x is None:
+                y, x = numpy.where(parent.data == index)
+            self.__y, self.__x = y, x
 
         def __call__(self, data, mask):
-            # get a view on the data for own pixels. shape N x T where N is number of pixels
-            data_p = data[self.__y, self.__x, :]
+            # get the data for own pixels. shape N x T where N is number of pixels
+            data_p = pixels(data, self.__y, self.__x)
             # get a view on the mask for own pixels. shape N x 1 for broadcasting
             mask_p = mask[self.__y, self.__x].reshape(-1, 1)
 
             return (data_p * mask_p).mean(axis=0)
 
+        def sparse_weights(self, shape, mask):
+            indices = numpy.ravel_multi_index((self.__y, self.__x), shape)
+            return normalized(indices, mask[self.__y, self.__x].astype(float), len(self.__y))
+
         @property
         def x(self):
             return self.__x
@@ -45,9 +58,15 @@ class Segmentation(Mask):
 
         self.__data = data
 
-        indices = numpy.unique(data)
+        # sort the pixels by label once, such that the pixels of each label form a consecutive range
+        labels = numpy.asarray(data).ravel()
+        order = numpy.argsort(labels, kind='stable')
+        indices, starts = numpy.unique(labels[order], return_index=True)
+        stops = numpy.append(starts[1:], len(order))
+        y, x = numpy.unravel_index(order, numpy.shape(data))
 
-        self.__children = [Segmentation.Child(self, i) for i in indices if not i == 0]
+        self.__children = [Segmentation.Child(self, i, y[start:stop], x[start:stop])
+                           for i, start, stop in zip(indices, starts, stops) if not i == 0]
 
     @property
     def children(self):
@@ -60,17 +79,28 @@ class Segmentation(Mask):
     def __call__(self, data, mask):
         return numpy.zeros(dtype=float, shape=[data.shape[-1]])
 
+    def sparse_weights(self, shape, mask):
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=float)
+
     def to_hdf5(self, f):
         if 'segmentations' not in f:
             f.create_group('segmentations')
+        # replace a previously stored version of this segmentation
+        Segmentation.remove_hdf5(f, [self.name])
         f.create_group('segmentations/' + self.name)
         f.create_dataset('segmentations/' + self.name + '/data', data=self.data)
 
+    @classmethod
+    def remove_hdf5(cls, f, names):
+        for name in names:
+            if 'segmentations/' + name in f:
+                del f['segmentations/' + name]
+
     @staticmethod
     def from_hdf5(f):
         if 'segmentations' in f:
             for name in list(f['segmentations'].keys()):
-                data = f['segmentations/' + name + '/data'].value
+                data = f['segmentations/' + name + '/data'][()]
                 seg = Segmentation(name=name, data=data)
                 yield seg
 
@@ -1,6 +1,6 @@
 import numpy
-import scipy
-import scipy.signal
+
+from ..util.video import chunk_budget, frame_chunks, frames_per_chunk
 
 
 def F0(data, mode, **kwargs):
@@ -10,19 +10,78 @@ def F0(data, mode, **kwargs):
         return median_F0(data)
     if mode == "linear_bleech":
         return linbleeched_F0(data)
+    if mode == "rolling":
+        return rolling_F0(data, **kwargs)
     raise Exception("Unknown mode: " + mode)
 
 
 def deltaF(data, mode, windows=None, F0=None, **kwargs):
+    """
+    Calculate dF/F0 with the baseline of the given mode. Additional keyword arguments (e.g. `out`, `dtype` or
+    `threads`) are forwarded to :py:func:`samuroi.plugins.baseline.apply_deltaF`.
+    """
     if mode == "stdv":
-        return stdv_deltaF(data, F0=F0, **kwargs)
+        return stdv_deltaF(data, F0=F0, windows=windows, **kwargs)
     if mode == "median":
-        return median_deltaF(data)
+        return median_deltaF(data, F0=F0, **kwargs)
     if mode == "linear_bleech":
-        return linbleeched_deltaF(data, F0=F0)
+        return linbleeched_deltaF(data, F0=F0, **kwargs)
+    if mode == "rolling":
+        return rolling_deltaF(data, F0=F0, **kwargs)
     raise Exception("Unknown mode: " + mode)
 
 
+def apply_deltaF(data, f0, out=None, dtype=numpy.float32, threads=None, budget=None):
+    """
+    Calculate :math:`(F-F_0)/F_0` tile by tile. The video is split into spatial tiles of whole rows, which get processed
+    in parallel by a thread pool (numpy releases the gil for the arithmetic) and are written in place into the output
+    buffer. Hence, apart from the output, only the tiles which are currently processed need to be held in memory.
+
+    :param data: The video data of shape (M,N,T), either a numpy array or a lazy :py:class:`samuroi.util.video.Video`.
+    :param f0: A function f0(r0, r1) that returns the baseline for the rows `[r0,r1(` of the video, which needs to be
+        broadcastable to the shape (r1-r0,N,T).
+    :param out: optional buffer with shape (M,N,T) to write the result into, e.g. a numpy memmap.
+    :param dtype: The data type of the result if no output buffer is given.
+    :param threads: The number of threads, defaults to the number of cpus.
+    :param budget: The number of bytes all tiles processed at the same time may occupy (counting double precision
+        intermediates), defaults to a quarter of :py:data:`samuroi.util.video.chunk_budget`.
+    :return: the output buffer holding dF/F0.
+    """
+    if out is None:
+        out = numpy.empty(shape=data.shape, dtype=dtype)
+
+    def tile(r0, r1):
+        o = out[r0:r1]
+        o[...] = data[r0:r1]
+        f = f0(r0, r1)
+        numpy.subtract(o, f, out=o)
+        numpy.divide(o, f, out=o)
+
+    _parallel_tiles(tile, data.shape, threads, budget)
+    return out
+
+
+def _parallel_tiles(tile, shape, threads=None, budget=None):
+    """
+    Split the video of given shape into tiles of whole rows and call tile(r0, r1) for each of them in a thread pool.
+    The arguments threads and budget are as in :py:func:`samuroi.plugins.baseline.apply_deltaF`.
+    """
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+
+    Y, X, T = shape
+    threads = os.cpu_count() if threads is None else threads
+    budget = chunk_budget // 4 if budget is None else budget
+
+    # split into tiles of whole rows, such that there are enough tiles to keep all threads busy
+    rows = max(1, min(int(budget // (threads * X * T * 8)), -(-Y // threads)))
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        jobs = [pool.submit(tile, r0, min(r0 + rows, Y)) for r0 in range(0, Y, rows)]
+        for job in jobs:
+            job.result()
+
+
 def stdv_F0(data, windows=None):
     """
     Calculate the baseline for each pixel of data.
@@ -30,6 +89,7 @@ def stdv_F0(data, windows=None):
     Then takes the block with minimum standard deviation and calculate the mean of that block.
     The above is done on a per pixel basis. I.e. different pixels can have the mean calculated for
     different blocks.
+    The data is read in chunks of whole blocks, hence it may also be a lazy :py:class:`samuroi.util.video.Video`.
 
     :param data: NxMxF array, where F is number of frames and NxM is image shape.
     :param windows: The number of windows to use. Default: split the data in blocks of 100 frames. If data.shape[2] mod 100 != 0 drop the frames that are remaining.
@@ -39,32 +99,41 @@ def stdv_F0(data, windows=None):
 
     # default behaviour, cut of overhanging frames
     if windows is None:
-        mod = T % 100
-        windows = T / 100
-        data = data[..., :windows * 100]
+        windows = T // 100
         T = windows * 100
     elif T % windows != 0:
         raise ValueError("Cannot split data with {} frames into {} equally sized blocks".format(T, windows))
 
-    windowed = numpy.reshape(data, newshape=(X, Y, windows, T / windows))
+    # the block size
+    B = T // windows
 
-    # calculate stdv over each block for each pixel
-    stdvs = numpy.std(windowed, axis=3)
+    # the minimal stdv so far and the mean of the respective block
+    minstdvs = numpy.full(shape=(X, Y), fill_value=numpy.inf)
+    means = numpy.zeros(shape=(X, Y))
 
-    # find the block where the stdv is minimal
-    minblocks = numpy.argmin(stdvs, axis=2)
+    # read as many whole blocks at once as the chunk budget allows
+    n = max(1, frames_per_chunk(data) // B) * B
+    for start in range(0, T, n):
+        chunk = numpy.asarray(data[:, :, start:min(start + n, T)])
+        windowed = numpy.reshape(chunk, (X, Y, chunk.shape[-1] // B, B))
 
-    # select mean from window with lowes stdv
-    # wee need fancy indexing here to get numpy to accept he index array
-    # returned by numpy.argmin
-    k, j = numpy.meshgrid(numpy.arange(Y), numpy.arange(X))
+        # calculate stdv over each block for each pixel
+        stdvs = numpy.std(windowed, axis=3)
 
-    means = windowed[j, k, minblocks, :].mean(axis=2)
+        # find the block where the stdv is minimal
+        minblocks = numpy.argmin(stdvs, axis=2)
+        stdvs = numpy.take_along_axis(stdvs, minblocks[..., numpy.newaxis], axis=2)[..., 0]
+
+        # select mean from window with lowest stdv
+        blockmeans = numpy.take_along_axis(windowed, minblocks[..., numpy.newaxis, numpy.newaxis], axis=2)
+        better = stdvs < minstdvs
+        minstdvs[better] = stdvs[better]
+        means[better] = blockmeans[..., 0, :].mean(axis=-1)[better]
 
     return means
 
 
-def stdv_deltaF(data, F0=None, windows=None):
+def stdv_deltaF(data, F0=None, windows=None, **kwargs):
     """
     Calculate the fraction dF/F0 for each pixel. F0 is assumed to not depend on time, but on spatial coordinates.
     for the definition of F0 see :py:func:`samuroi.plugins.baseline.stdv_F0`.
@@ -72,14 +141,13 @@ def stdv_deltaF(data, F0=None, windows=None):
     :param data: The video data, shape M,N,T
     :param F0: precalculated F0 or None(default calculate F0 internally)
     :param windows: The number of windows, forwarded to stdv_F0
+    :param kwargs: forwarded to :py:func:`samuroi.plugins.baseline.apply_deltaF`, e.g. `out` or `threads`.
     :return:  numpy.array with shape M,N,T with values :math:`(F(x,y,t)-F0(x,y))/F0(x,y)`
     """
     if F0 is None:
         F0 = stdv_F0(data=data, windows=windows)
-    # use numpy broadcasting to do the calculation
-    data = (data - F0[..., numpy.newaxis]) / F0[..., numpy.newaxis]
 
-    return data
+    return apply_deltaF(data, lambda r0, r1: F0[r0:r1, :, numpy.newaxis], **kwargs)
 
 
 def power_spectrum(data, fs):
@@ -112,6 +180,7 @@ def bandstop(data, fs, start, stop, order = 3):
     high = stop / nyq
     low = start / nyq
     order = order
+    import scipy.signal
     b, a = scipy.signal.butter(order, [low, high], btype='bandstop')
     # zi = scipy.signal.lfiltic(b, a, y=[0.])
     dataf = scipy.signal.lfilter(b, a, data)
@@ -121,29 +190,43 @@ def bandstop(data, fs, start, stop, order = 3):
 def linbleeched_F0(data):
     """
     Calculate a linear fit (:math:`y(t)=m t+y_0)` for each pixel, which is assumed to correct for bleeching effects.
+    The data is read in chunks of frames, hence it may also be a lazy :py:class:`samuroi.util.video.Video`.
 
     :param data: he video data of shape (M,N,T).
     :return: tuple (m,y0) with two images each with shape (M,N).
     """
+    # accumulate the sums required for the least squares fit chunk by chunk
+    T = data.shape[-1]
+    sum_y = numpy.zeros(shape=data.shape[0:2])
+    sum_xy = numpy.zeros(shape=data.shape[0:2])
+    for start, stop, chunk in frame_chunks(data):
+        # generate c coordinates
+        x = numpy.arange(start, stop, dtype=float)
+        sum_y += chunk.sum(axis=-1)
+        # row by row, such that the chunk never gets converted to float as a whole
+        for r in range(chunk.shape[0]):
+            sum_xy[r] += numpy.dot(chunk[r], x)
+
+    # the sums over the x coordinates
+    x = numpy.arange(T, dtype=float)
+    sum_x = x.sum()
+    sum_xx = (x * x).sum()
 
-    # generate c coordinates
-    x = numpy.arange(data.shape[-1])
-    # reshape the data to two d array, first dimension is pixel index, second dimension is time
-    d = numpy.reshape(data, (data.shape[0] * data.shape[1], data.shape[-1]))
     # find fit parameters
-    m, y0 = numpy.polyfit(x, d.T, 1)
-    # reshape fit parameters back to image shape
-    return m.reshape(data.shape[0:2]), y0.reshape(data.shape[0:2])
+    m = (T * sum_xy - sum_x * sum_y) / (T * sum_xx - sum_x ** 2)
+    y0 = (sum_y - m * sum_x) / T
+    return m, y0
 
 
-def linbleeched_deltaF(data, F0=None):
+def linbleeched_deltaF(data, F0=None, **kwargs):
     """
     Assumes that the fluorescence F0 follows linear bleeching (see  :py:func:`samuroi.plugins.baseline.linbleeched_F0`).
     Determines the linear fit parameters m,y0 for :math:`F_0(t) = m f(t)+y_0`. Then uses :math:`F_0(t)` to calculate
     :math:`(F(t)-F_0(t))/F_0(t)`.
 
     :param data:  The video data of shape (M,N,T).
-    :param F0:
+    :param F0: precalculated fit parameters (m,y0) or None(default calculate F0 internally)
+    :param kwargs: forwarded to :py:func:`samuroi.plugins.baseline.apply_deltaF`, e.g. `out` or `threads`.
     :return: deltaF/F0 for bleech corrected :math:`F_0(t)`.
     """
     # get fit parameters
@@ -154,10 +237,13 @@ def linbleeched_deltaF(data, F0=None):
 
     # get x coordinates
     x = numpy.arange(data.shape[-1])
-    # do outer product to apply linear drift, then add offset values with new axis, because they don't depend on time
-    f0 = numpy.multiply.outer(m, x) + y0[:, :, numpy.newaxis]
-    # return deltaF/F0
-    return (data - f0) / f0
+
+    def f0(r0, r1):
+        # do outer product to apply linear drift, then add offset values with new axis, because they don't depend on
+        # time. only done for the rows of one tile, such that the baseline never needs the size of the whole video.
+        return numpy.multiply.outer(m[r0:r1], x) + y0[r0:r1, :, numpy.newaxis]
+
+    return apply_deltaF(data, f0, **kwargs)
 
 
 def median_F0(data):
@@ -166,19 +252,92 @@ def median_F0(data):
     The definition is as follows:
     :math:`F_0(t)` = median(:math:`F(x,y,t)` for all x,y)
 
+    The data is read in chunks of frames, hence it may also be a lazy :py:class:`samuroi.util.video.Video`.
+
     :param data: The video data of shape (M,N,T).
     :return: F0 array of shape (T,).
     """
-    return numpy.median(data.reshape(data.shape[0] * data.shape[1], data.shape[-1]), axis=0)
+    f0 = numpy.empty(shape=data.shape[-1])
+    for start, stop, chunk in frame_chunks(data):
+        f0[start:stop] = numpy.median(chunk.reshape(data.shape[0] * data.shape[1], stop - start), axis=0)
+    return f0
 
 
-def median_deltaF(data):
+def median_deltaF(data, F0=None, **kwargs):
     """
     Apply the deltaF/F transformation with :math:`F_0` defined as in :py:func:`samuroi.plugins.baseline.median_F0`.
 
     :param data: The video data of shape (M,N,T).
+    :param F0: precalculated F0 or None(default calculate F0 internally)
+    :param kwargs: forwarded to :py:func:`samuroi.plugins.baseline.apply_deltaF`, e.g. `out` or `threads`.
     :return: deltaF/F0 for median :math:`F_0(t)`.
     """
+    f0 = median_F0(data) if F0 is None else F0
+    return apply_deltaF(data, lambda r0, r1: f0[numpy.newaxis, numpy.newaxis, :], **kwargs)
+
+
+def _rolling_baseline(tile, window, percentile, smooth):
+    import scipy.ndimage
+    T = tile.shape[-1]
+    window = min(window, T)
+    if percentile is None:
+        # running minimum of the smoothed traces followed by a running maximum, such that the baseline does not get
+        # biased towards the minimum. all three filters take amortised O(1) per sample, independent of the window.
+        f = scipy.ndimage.uniform_filter1d(tile, size=smooth, axis=-1, mode='nearest', output=numpy.float32)
+        f = scipy.ndimage.minimum_filter1d(f, size=window, axis=-1, mode='nearest')
+        return scipy.ndimage.maximum_filter1d(f, size=window, axis=-1, mode='nearest')
+
+    # the one dimensional rank filter keeps a sorted window, i.e. each sample takes O(log w)
+    f = numpy.empty(shape=tile.shape, dtype=numpy.float32)
+    lines = tile.reshape(-1, T)
+    for i, line in enumerate(lines):
+        f.reshape(-1, T)[i] = scipy.ndimage.percentile_filter(line, percentile, size=window, mode='nearest')
+    return f
+
+
+def rolling_F0(data, window=1000, percentile=None, smooth=10, out=None, threads=None, budget=None):
+    """
+    Calculate a time dependent F0 for each pixel, which follows slow drifts of the fluorescence over long recordings.
+    F0 is defined by a sliding window of the given size around each frame: if percentile is None, it is the running
+    maximum of the running minimum of the (slightly smoothed) trace, otherwise the given percentile within the window.
+    The video is processed in spatial tiles like in :py:func:`samuroi.plugins.baseline.apply_deltaF`.
+
+    :param data: The video data of shape (M,N,T).
+    :param window: The number of frames of the sliding window.
+    :param percentile: The percentile (0-100) of the window to use as F0, or None to use the running minimum/maximum.
+    :param smooth: The number of frames of the moving average applied before taking the running minimum.
+    :param out: optional buffer with shape (M,N,T) to write F0 into.
+    :param threads: The number of threads, defaults to the number of cpus.
+    :param budget: The number of bytes all tiles processed at the same time may occupy.
+    :return: float32 array with shape (M,N,T).
+    """
+    if out is None:
+        out = numpy.empty(shape=data.shape, dtype=numpy.float32)
+
+    def tile(r0, r1):
+        out[r0:r1] = _rolling_baseline(numpy.asarray(data[r0:r1]), window, percentile, smooth)
+
+    _parallel_tiles(tile, data.shape, threads, budget)
+    return out
+
+
+def rolling_deltaF(data, F0=None, window=1000, percentile=None, smooth=10, **kwargs):
+    """
+    Apply the deltaF/F transformation with :math:`F_0` defined as in :py:func:`samuroi.plugins.baseline.rolling_F0`.
+    If F0 is not given, it is calculated tile by tile and never held in memory as a whole.
 
-    f0 = median_F0(data)
-    return (data - f0[numpy.newaxis, numpy.newaxis, :]) / f0[numpy.newaxis, numpy.newaxis, :]
+    :param data: The video data of shape (M,N,T).
+    :param F0: precalculated F0 or None(default calculate F0 internally)
+    :param window: forwarded to :py:func:`samuroi.plugins.baseline.rolling_F0`.
+    :param percentile: forwarded to :py:func:`samuroi.plugins.baseline.rolling_F0`.
+    :param smooth: forwarded to :py:func:`samuroi.plugins.baseline.rolling_F0`.
+    :param kwargs: forwarded to :py:func:`samuroi.plugins.baseline.apply_deltaF`, e.g. `out` or `threads`.
+    :return: deltaF/F0 for the rolling :math:`F_0(x,y,t)`.
+    """
+    if F0 is None:
+        def f0(r0, r1):
+            return _rolling_baseline(numpy.asarray(data[r0:r1]), window, percentile, smooth)
+    else:
+        def f0(r0, r1):
+            return F0[r0:r1]
+    return apply_deltaF(data, f0, **kwargs)
@@ -1,20 +1,26 @@
 import numpy
 
-try:
-    import cv2
-except ImportError as e:
-    print("WARNING: Importing opencv (cv2) failed.")
-    print("Without opencv image stabilization is not supported.")
-    print("If you are on windows you can try to install opencv with:")
-    print(" conda install -c menpo opencv=2.4.11")
-    print("On linux/mac try:")
-    print(" conda install opencv=2.4.11")
-    raise e
-
-
-lk_params = dict( winSize  = (50, 50),
-                  maxLevel = 3,
-                  criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+def _import_cv2():
+    """Import opencv on first use, such that this module can be imported without it."""
+    try:
+        import cv2
+    except ImportError as e:
+        print("WARNING: Importing opencv (cv2) failed.")
+        print("Without opencv image stabilization is not supported.")
+        print("If you are on windows you can try to install opencv with:")
+        print(" conda install -c menpo opencv=2.4.11")
+        print("On linux/mac try:")
+        print(" conda install opencv=2.4.11")
+        raise e
+    return cv2
+
+
+def lk_params():
+    cv2 = _import_cv2()
+    return dict( winSize  = (50, 50),
+                 maxLevel = 3,
+                 criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
 
 feature_params = dict(maxCorners=300,
                        qualityLevel=0.01,
@@ -22,6 +28,7 @@ feature_params = dict(maxCorners=300,
                        blockSize=30)
 
 def draw_str(dst, xy, s):
+    cv2 = _import_cv2()
     (x, y) = xy
     cv2.putText(dst, s, (x+1, y+1), cv2.FONT_HERSHEY_PLAIN, .5, (0, 0, 0), thickness = 2)
     cv2.putText(dst, s, (x, y), cv2.FONT_HERSHEY_PLAIN, .5, (255, 255, 255))
@@ -33,6 +40,7 @@ class Stabilization(object):
             self.run(data)
 
     def run(self, data, reference = None):
+        cv2 = _import_cv2()
         if data.dtype != '>u1':
             data = (data > numpy.median(data)*1.3).astype('>u1')*255
 
@@ -54,8 +62,8 @@ class Stabilization(object):
         for i in range(1, data.shape[2]):
             img1 = data[:, :, i]
 
-            p1, st, err = cv2.calcOpticalFlowPyrLK(img0, img1, p0, None, **lk_params)
-            p0r, st, err = cv2.calcOpticalFlowPyrLK(img1, img0, p1, None, **lk_params)
+            p1, st, err = cv2.calcOpticalFlowPyrLK(img0, img1, p0, None, **lk_params())
+            p0r, st, err = cv2.calcOpticalFlowPyrLK(img1, img0, p1, None, **lk_params())
 
             shift = (p0-p0r).reshape(-1, 2)
             d = (shift*shift).sum(axis=-1)
@@ -100,6 +108,7 @@ class Stabilization(object):
             self.datashape = datashape
         """apply the found transformations to other data data wont be modified"""
         assert(data.shape == self.datashape)
+        cv2 = _import_cv2()
 
         copy = data.astype(float)
 
@@ -6,9 +6,62 @@ def load_swc(filename):
     return SWCFile(filename)
 
 
+def open_text(filename):
+    """
+    Open a text file for reading, which may be compressed with gzip, bzip2 or xz. The compression is detected from the
+    first bytes of the file, not from the file extension.
+
+    :param filename: the path/filename to open.
+    :return: a file object in text mode.
+    """
+    with open(filename, 'rb') as f:
+        magic = f.read(6)
+    if magic.startswith(b'\x1f\x8b'):
+        import gzip
+        return gzip.open(filename, 'rt')
+    if magic.startswith(b'BZh'):
+        import bz2
+        return bz2.open(filename, 'rt')
+    if magic.startswith(b'\xfd7zXZ\x00'):
+        import lzma
+        return lzma.open(filename, 'rt')
+    return open(filename, 'r')
+
+
+def parse_swc(source):
+    """
+    Parse the content of a swc file into a 2D array with one row per node and the 7 columns id, kind, x, y, z, radius
+    and parent_id. Comments (starting with '#') and empty lines are skipped. Each line needs exactly 7 values, the numbers
+    of all lines are then converted within a single call to numpy.
+
+    :param source: a filename (optionally compressed, see :py:func:`samuroi.plugins.swc.open_text`) or an opened file.
+    :return: 2D float array with shape (N,7).
+    """
+    if isinstance(source, str):
+        with open_text(source) as f:
+            text = f.read()
+    else:
+        text = source.read()
+        if isinstance(text, bytes):
+            text = text.decode()
+
+    rows = [line.partition('#')[0].split() for line in text.splitlines()]
+    rows = [r for r in rows if len(r) > 0]
+    for r in rows:
+        if len(r) != 7:
+            raise Exception("SWC files need to have 7 columns: id, kind, x, y, z, radius and parent_id, got line '{}'."
+                            .format(' '.join(r)))
+    return numpy.array(rows, dtype=float).reshape(-1, 7)
+
+
 class SWCFile(numpy.recarray):
     """
     Subclass of numpy.recarray for swc files.
+
+    Besides the nodes, the topology of the reconstruction is provided as arrays: the row of the parent of each node
+    (:py:attr:`samuroi.plugins.swc.SWCFile.parent_index`) and the branches, i.e. the runs of nodes where each node is
+    the child of its predecessor (:py:attr:`samuroi.plugins.swc.SWCFile.branch_starts`,
+    :py:attr:`samuroi.plugins.swc.SWCFile.branch_parent`).
     """
 
     swcformat = [('id',int),('kind',int),('x',float),('y',float),('z',float),
@@ -18,21 +71,26 @@ class SWCFile(numpy.recarray):
         # if no argument is given, create zero sized recarray
         if len(args) == 0:
             args = (0,)
-        elif type(args[0]) is int:
+        if type(args[0]) is int:
             # create empty recarray
             d = numpy.recarray(args[0], dtype = SWCFile.swcformat)
         else:
             # create from file or filename
-            d = numpy.recfromtxt(args[0], dtype = SWCFile.swcformat)
+            values = parse_swc(args[0])
+            d = numpy.recarray(len(values), dtype = SWCFile.swcformat)
+            for i, (name, dtype) in enumerate(SWCFile.swcformat):
+                d[name] = values[:, i]
 
         return d.view(SWCFile)
 
     def __init__(self,filename = None):
         """
         Create a numpy recarray for given swc file.
-        :param filename (str): the path/filename to load.
+        :param filename (str): the path/filename to load, the file may be compressed with gzip, bzip2 or xz.
         """
-        self.filename = filename
+        self.filename = filename if not isinstance(filename, int) else None
+        if len(self) == 0:
+            return
         if self['id'][0] != 1:
             raise Exception("SWC id ordering needs to start with 1.")
         if not (self['id'][1:] - self['id'][:-1] == 1).all():
@@ -51,15 +109,82 @@ class SWCFile(numpy.recarray):
         """
         return (self['parent_id'] == -1).sum()
 
+    @property
+    def parent_index(self):
+        """
+        :return: 1D int array holding the row of the parent of each node, -1 for root nodes.
+        """
+        parent = numpy.asarray(self['parent_id']) - 1
+        parent[parent < 0] = -1
+        return parent
+
+    @property
+    def nchildren(self):
+        """
+        :return: 1D int array holding the number of children of each node.
+        """
+        parent = self.parent_index
+        return numpy.bincount(parent[parent >= 0], minlength=len(self))
+
+    @property
+    def branch_starts(self):
+        """
+        :return: 1D int array holding the first row of each branch. A branch ends where the next node is not the child
+            of its predecessor.
+        """
+        if len(self) == 0:
+            return numpy.zeros(0, dtype=int)
+        starts = numpy.flatnonzero(numpy.asarray(self['id']) != numpy.asarray(self['parent_id']) + 1)
+        if len(starts) == 0 or starts[0] != 0:
+            starts = numpy.r_[0, starts]
+        return starts
+
+    @property
+    def branch_ends(self):
+        """
+        :return: 1D int array holding the row after the last node of each branch.
+        """
+        return numpy.r_[self.branch_starts[1:], len(self)].astype(int)
+
+    @property
+    def branch_parent(self):
+        """
+        :return: 1D int array holding the index of the branch which contains the parent of the first node of each branch,
+            -1 for branches that start at a root node.
+        """
+        starts = self.branch_starts
+        parent = self.parent_index[starts]
+        # the branch of a node is the last branch starting at or before the node
+        return numpy.where(parent >= 0, numpy.searchsorted(starts, parent, side='right') - 1, -1)
+
     @property
     def branches(self):
         """
         :return: A generator object that allows to iterate over all branches.
         """
-        last_index = 0
-        for index in numpy.flatnonzero(self['id'] != self['parent_id'] + 1):
-            if last_index == index: continue
-            yield Branch(self[last_index:index][['x','y','z','radius']])
-            last_index = index
-        # yield the last branch
-        yield Branch(self[last_index:])
+        # convert the coordinates of all nodes at once, the branches are views on it
+        dtype = [('x', float), ('y', float), ('z', float), ('radius', float)]
+        data = numpy.rec.fromarrays([self['x'], self['y'], self['z'], self['radius']], dtype=dtype)
+        for start, end in zip(self.branch_starts, self.branch_ends):
+            yield Branch(data[start:end])
+
+    def masks(self):
+        """
+        Create the masks for the whole reconstruction in one pass. Branches with only a single coordinate become
+        :py:class:`samuroi.masks.circle.CircleMask`, branches with more than one coordinate
+        :py:class:`samuroi.masks.branch.BranchMask`. The polygons of all branches are rasterized in one batched pass, as
+        are the polygons of all circles.
+
+        :return: list of masks, in the order of the branches.
+        """
+        from samuroi.masks.branch import BranchMask
+        from samuroi.masks.circle import CircleMask
+        masks = []
+        for b in self.branches:
+            if len(b) > 1:
+                masks.append(BranchMask(data=b.data))
+            else:
+                masks.append(CircleMask(center=(b['x'][0], b['y'][0]), radius=b['radius'][0]))
+        BranchMask.rasterize_many([m for m in masks if isinstance(m, BranchMask)])
+        CircleMask.rasterize_many([m for m in masks if isinstance(m, CircleMask)])
+        return masks
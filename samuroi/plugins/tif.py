@@ -1,16 +1,236 @@
-import PIL
+import struct
+
 import numpy
 
-def load_tif(filename):
-    img = PIL.Image.open(filename)
-    X,Y = img.size
-    T = img.n_frames
+# the tiff tags that are required for reading the image data
+_tags = {256: 'width', 257: 'height', 258: 'bits', 259: 'compression', 273: 'offsets', 277: 'samples',
+         279: 'bytecounts', 317: 'predictor', 322: 'tilewidth', 339: 'sampleformat'}
+
+# format characters of the tiff field types, see tiff specification
+_types = {1: 'B', 3: 'H', 4: 'I', 6: 'b', 8: 'h', 9: 'i', 16: 'Q', 17: 'q'}
+
+# numpy dtype kinds for the tiff SampleFormat tag
+_kinds = {1: 'u', 2: 'i', 3: 'f'}
+
+
+class TiffStack(object):
+    """
+    The table of image file directories (IFD) of a multi page tiff file. The table is read only once, afterwards pages
+    can be decoded directly into preallocated buffers without seeking through the file page by page.
+    All pages need to have the same shape and data type.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: The filename/path of the tif file.
+        """
+        self.filename = filename
+
+        import mmap
+        with open(filename, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.pages = self.__read_ifds(buf)
+        finally:
+            buf.close()
+
+        if len(self.pages) == 0:
+            raise Exception("No pages found in tif file: " + filename)
+
+        first = self.pages[0]
+        for page in self.pages:
+            for key in ['width', 'height', 'bits', 'samples', 'sampleformat']:
+                if page[key] != first[key]:
+                    raise Exception("All pages of the tif file need to have the same {}.".format(key))
+        if first['samples'] != 1:
+            raise Exception("Only single channel tif files are supported.")
+
+        self.dtype = numpy.dtype(self.byteorder + _kinds[first['sampleformat']] + str(first['bits'] // 8))
+        """The numpy dtype of the pixel values."""
+
+    def __read_ifds(self, buf):
+        if buf[0:2] == b'II':
+            self.byteorder = '<'
+        elif buf[0:2] == b'MM':
+            self.byteorder = '>'
+        else:
+            raise Exception("Not a tif file: " + self.filename)
+
+        bo = self.byteorder
+        version, = struct.unpack_from(bo + 'H', buf, 2)
+        if version == 42:
+            offset, = struct.unpack_from(bo + 'I', buf, 4)
+            countfmt, entryfmt, offsetfmt, entrysize = 'H', 'HHI4s', 'I', 12
+        elif version == 43:
+            # big tiff
+            offset, = struct.unpack_from(bo + 'Q', buf, 8)
+            countfmt, entryfmt, offsetfmt, entrysize = 'Q', 'HHQ8s', 'Q', 20
+        else:
+            raise Exception("Unknown tif version {} in file: {}".format(version, self.filename))
+
+        pages = []
+        while offset != 0:
+            n, = struct.unpack_from(bo + countfmt, buf, offset)
+            offset += struct.calcsize(countfmt)
+            page = {'compression': 1, 'predictor': 1, 'samples': 1, 'sampleformat': 1, 'bits': 1, 'tilewidth': None}
+            for i in range(n):
+                tag, type, count, value = struct.unpack_from(bo + entryfmt, buf, offset + i * entrysize)
+                if tag not in _tags or type not in _types:
+                    continue
+                fmt = bo + str(count) + _types[type]
+                size = struct.calcsize(fmt)
+                if size <= len(value):
+                    values = struct.unpack_from(fmt, value)
+                else:
+                    # the value does not fit into the entry, hence it holds an offset to the actual values
+                    values = struct.unpack_from(fmt, buf, struct.unpack(bo + offsetfmt, value)[0])
+                if tag in (273, 279):
+                    page[_tags[tag]] = numpy.array(values, dtype=numpy.int64)
+                else:
+                    page[_tags[tag]] = values[0]
+            if page['tilewidth'] is not None:
+                raise Exception("Tiled tif files are not supported.")
+            pages.append(page)
+            offset, = struct.unpack_from(bo + offsetfmt, buf, offset + n * entrysize)
+        return pages
+
+    @property
+    def shape(self):
+        """The shape (Y,X,T) of the stack."""
+        return self.pages[0]['height'], self.pages[0]['width'], len(self.pages)
+
+    def __len__(self):
+        return len(self.pages)
+
+    @property
+    def compressed(self):
+        """Flag whether any page of the stack is compressed."""
+        return any(p['compression'] != 1 for p in self.pages)
+
+    @property
+    def contiguous(self):
+        """
+        Flag whether the pixel data of all pages is uncompressed and stored at a constant stride in the file,
+        such that the whole stack can be memory mapped.
+        """
+        if self.compressed:
+            return False
+        Y, X, T = self.shape
+        pagesize = Y * X * self.dtype.itemsize
+        starts = numpy.array([p['offsets'][0] for p in self.pages])
+        for p in self.pages:
+            # the strips of each page need to follow each other
+            if not (p['offsets'][1:] == p['offsets'][:-1] + p['bytecounts'][:-1]).all() or \
+                    p['bytecounts'].sum() != pagesize:
+                return False
+        return len(starts) < 2 or ((starts[1:] - starts[:-1]) == starts[1] - starts[0]).all()
+
+    def memmap(self):
+        """
+        Map the stack into memory without reading or copying any data. Requires
+        :py:attr:`samuroi.plugins.tif.TiffStack.contiguous` to be True.
+
+        :return: read only numpy array with shape (Y,X,T), the frames are stored time major.
+        """
+        if not self.contiguous:
+            raise Exception("Only uncompressed tif files with evenly spaced pages can be memory mapped.")
+        Y, X, T = self.shape
+        first = int(self.pages[0]['offsets'][0])
+        stride = int(self.pages[1]['offsets'][0]) - first if T > 1 else Y * X * self.dtype.itemsize
+        buf = numpy.memmap(self.filename, dtype=numpy.uint8, mode='r')
+        frames = numpy.ndarray(shape=(T, Y, X), dtype=self.dtype, buffer=buf, offset=first,
+                               strides=(stride, X * self.dtype.itemsize, self.dtype.itemsize))
+        return frames.transpose(1, 2, 0)
+
+    def read(self, start=0, stop=None, out=None, threads=None):
+        """
+        Decode a range of pages in parallel.
+
+        :param start: first page to read.
+        :param stop: page after the last one to read, defaults to the number of pages.
+        :param out: optional buffer with shape (stop-start,Y,X) to decode the frames into.
+        :param threads: the number of threads used for decoding, defaults to the number of cpus.
+        :return: numpy array with shape (stop-start,Y,X), i.e. one contiguous frame per page.
+        """
+        stop = len(self) if stop is None else stop
+        Y, X, T = self.shape
+        if out is None:
+            out = numpy.empty(shape=(stop - start, Y, X), dtype=self.dtype)
+
+        import os
+        from concurrent.futures import ThreadPoolExecutor
+        threads = os.cpu_count() if threads is None else threads
+        # each worker decodes a consecutive range of pages, which allows pillow to seek forward only
+        bounds = numpy.linspace(start, stop, max(1, min(threads, stop - start)) + 1).astype(int)
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            jobs = [pool.submit(self.__decode, i0, i1, out[i0 - start:i1 - start])
+                    for i0, i1 in zip(bounds[:-1], bounds[1:]) if i1 > i0]
+            for job in jobs:
+                job.result()
+        return out
+
+    def __decode(self, start, stop, out):
+        import zlib
+        img = None
+        with open(self.filename, 'rb') as f:
+            for i, page in enumerate(self.pages[start:stop]):
+                view = memoryview(out[i].view(numpy.uint8).reshape(-1))
+                position = 0
+                if page['compression'] == 1:
+                    # uncompressed pages can directly be read from the file into the buffer
+                    for offset, count in zip(page['offsets'], page['bytecounts']):
+                        f.seek(offset)
+                        f.readinto(view[position:position + count])
+                        position += count
+                elif page['compression'] in (8, 32946) and page['predictor'] == 1:
+                    # deflate compressed strips, zlib releases the gil while decoding
+                    for offset, count in zip(page['offsets'], page['bytecounts']):
+                        f.seek(offset)
+                        strip = zlib.decompress(f.read(count))
+                        view[position:position + len(strip)] = strip
+                        position += len(strip)
+                else:
+                    # fall back to pillow for all other compressions
+                    if img is None:
+                        from PIL import Image
+                        img = Image.open(self.filename)
+                    img.seek(start + i)
+                    out[i] = numpy.asarray(img)
+        if img is not None:
+            img.close()
+
+
+def load_tif(filename, mmap=False, threads=None):
+    """
+    Load a multi page tif file. The pages get decoded in parallel into one preallocated buffer where each frame is
+    contiguous in memory.
+
+    :param filename: The filename/path of the tif file.
+    :param mmap: If True and the tif file is uncompressed, memory map the file instead of reading it.
+    :param threads: the number of threads used for decoding, defaults to the number of cpus.
+    :return: numpy array with shape (Y,X,T)
+    """
+    stack = TiffStack(filename)
+    if mmap and stack.contiguous:
+        return stack.memmap()
+    return stack.read(threads=threads).transpose(1, 2, 0)
+
 
-    # workaround to get the dtype
-    foo = numpy.array(img)
+def iter_tif(filename, frames=None, threads=None):
+    """
+    Read a multi page tif file in chunks of consecutive frames, such that only one chunk needs to be held in memory.
 
-    data = numpy.ndarray(shape=(Y, X, T), dtype=foo.dtype)
-    for i in range(T):
-        img.seek(i)
-        data[:, :, i] = numpy.array(img)
-    return data
+    :param filename: The filename/path of the tif file.
+    :param frames: The number of frames per chunk, defaults to the number of frames that fit into
+        :py:data:`samuroi.util.video.chunk_budget`.
+    :param threads: the number of threads used for decoding, defaults to the number of cpus.
+    :return: A generator object yielding tuples (start, stop, chunk), where chunk is a numpy array with shape (Y,X,T)
+        holding the frames in range `[start,stop(`, just as :py:func:`samuroi.util.video.frame_chunks`.
+    """
+    stack = TiffStack(filename)
+    if frames is None:
+        from ..util.video import frames_per_chunk
+        frames = frames_per_chunk(stack)
+    for start in range(0, len(stack), frames):
+        stop = min(start + frames, len(stack))
+        yield start, stop, stack.read(start, stop, threads=threads).transpose(1, 2, 0)
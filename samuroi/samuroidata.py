@@ -1,8 +1,6 @@
-import numpy
-import skimage
+import threading
 
-import skimage.filters
-import skimage.morphology
+import numpy
 
 from cached_property import cached_property
 from .maskset import MaskSet
@@ -43,20 +41,42 @@ class SamuROIData(object):
     In this manner GUI updates and other custom tasks can be completely separated from the data structure.
     """
 
-    def __init__(self, data, morphology=None):
+    def __init__(self, data, morphology=None, layout=None):
         """
         This function will set up the underlying data structure. If no morphology is provided, the morphology array will
         be generated as `numpy.max(data,axis=-1)`, i.e. a maximum projection over data along the time axis.
-        :param data:
+        :param data: The 3D video data, either a numpy array or a lazy :py:class:`samuroi.util.video.Video`.
         :param morphology: This can either be a 2D numpy array with the same shape as the video, or None.
-        """
+        :param layout: The memory layout in which the data will be stored, see :py:attr:`samuroi.SamuROIData.layout`.
+        """
+        # keep track of modifications by version counters, such that cached traces can be invalidated.
+        # connect before anybody else, such that the versions are up to date when other listeners get notified.
+        self.__versions = {}
+        self.__mask_callbacks = {}
+        self.__threshold_lock = threading.Lock()
+        # the morphology whose threshold hierarchy is being built, see threshold_overlay
+        self.__hierarchy_building = None
+        self.__approximate_threshold = False
+        # keep track of the masks which were modified since the last call of save_hdf5, see save_hdf5(incremental=True)
+        self.__dirty = set()
+        self.__removed = {}
+        self.__saved = None
+        self.data_changed.append(lambda: self.__bump('data'))
+        self.overlay_changed.append(lambda: self.__bump('overlay'))
+        self.postprocessor_changed.append(lambda: self.__bump('postprocessor'))
+        self.masks.added.append(self.__on_mask_added)
+        self.masks.removed.append(self.__on_mask_removed)
+
         self.postprocessor = self.no_postprocessor
 
+        self.__layout = layout
+
         # call the property setter which will initialize the mean data and threshold value
         self.data = data
 
         if morphology is None:
-            self.morphology = numpy.max(data, axis=-1)
+            from .util.video import max_projection
+            self.morphology = max_projection(data)
         else:
             self.morphology = morphology
 
@@ -72,6 +92,26 @@ class SamuROIData(object):
         """
         return MaskSet()
 
+    @cached_property
+    def trace_cache(self):
+        """
+        The cache of type :py:class:`samuroi.util.tracecache.TraceCache` used by :py:meth:`samuroi.SamuROIData.traces`.
+        Cached traces stay valid until the data, the overlay, the postprocessor or the mask itself changed.
+        Use `trace_cache.budget` to control its memory usage.
+        """
+        from .util.tracecache import TraceCache
+        return TraceCache()
+
+    @cached_property
+    def spatial_index(self):
+        """
+        The :py:class:`samuroi.util.spatialindex.SpatialIndex` over the bounding boxes of all masks and their children.
+        It is kept up to date upon insertion, removal and modification of masks and allows to quickly find the masks at
+        some pixel, within some region or overlapping with some other mask.
+        """
+        from .util.spatialindex import SpatialIndex
+        return SpatialIndex(self.masks)
+
     @cached_property
     def data_changed(self):
         """This is a signal which should be triggered whenever the underlying 3D numpy data has changed."""
@@ -102,6 +142,45 @@ class SamuROIData(object):
         """This signal will be triggered when the morphology image changed."""
         return Event()
 
+    @cached_property
+    def events_changed(self):
+        """This signal will be triggered when the detected events of some masks changed, it takes the list of masks."""
+        return Event()
+
+    def __bump(self, key):
+        self.__versions[key] = self.__versions.get(key, 0) + 1
+
+    def __on_mask_added(self, mask):
+        self.__dirty.add(mask)
+        if hasattr(mask, "changed"):
+            # keep the callback, such that it can be disconnected upon removal
+            callback = lambda *args: self.__on_mask_changed(mask)
+            self.__mask_callbacks[mask] = callback
+            mask.changed.append(callback)
+
+    def __on_mask_changed(self, mask):
+        self.__dirty.add(mask)
+        # children may have been moved together with their parent
+        for m in [mask] + list(getattr(mask, "children", [])):
+            self.__bump(m)
+
+    def __on_mask_removed(self, mask):
+        self.__dirty.discard(mask)
+        self.__removed.setdefault(type(mask), set()).add(mask.name)
+        if mask in self.__mask_callbacks:
+            mask.changed.remove(self.__mask_callbacks.pop(mask))
+        for m in [mask] + list(getattr(mask, "children", [])):
+            self.__versions.pop(m, None)
+            self.trace_cache.discard((m, True))
+            self.trace_cache.discard((m, False))
+
+    def __trace_version(self, mask, postprocess):
+        """The versions of everything the trace of given mask depends on."""
+        versions = self.__versions
+        return (versions.get('data', 0), versions.get('overlay', 0),
+                versions.get('postprocessor', 0) if postprocess else None,
+                versions.get(mask, 0))
+
     @property
     def active_frame(self):
         """
@@ -175,6 +254,17 @@ class SamuROIData(object):
         for i in self.masks[Segmentation]:
             yield i
 
+    @property
+    def pixelmaskcollections(self):
+        """
+        :return: A generator object that allows iteration over all pixel mask collections in the document.
+        """
+        from .masks.pixel import PixelMaskCollection
+        if PixelMaskCollection not in self.masks.types():
+            return
+        for i in self.masks[PixelMaskCollection]:
+            yield i
+
     @property
     def data(self):
         """
@@ -182,16 +272,70 @@ class SamuROIData(object):
 
         :getter: Get the present video data.
         :setter: Change to some other video data. Changing the data will trigger the :py:attr:`samuroi.SamuROIData.data_changed` event.
-        :type: 3d numpy array dtype should be float or int
+        :type: 3d numpy array dtype should be float or int. For videos which do not fit into memory use a lazy video
+            object like :py:class:`samuroi.util.video.HDF5Video` or :py:class:`samuroi.util.video.RawVideo`, which will
+            be read chunk by chunk.
         """
         return self.__data
 
     @data.setter
     def data(self, d):
+        if self.__layout is not None:
+            from .util.video import to_layout
+            d = to_layout(d, self.__layout)
         self.__data = d
 
         self.data_changed()
 
+    @property
+    def layout(self):
+        """
+        The memory layout in which the video data is stored. The shape of :py:attr:`samuroi.SamuROIData.data` is (Y,X,T)
+        independent of the layout, only the order of the values in memory differs:
+
+        - 'pixel': the time series of each pixel is contiguous. This is fastest for gathering the traces of single
+          pixels, see :py:meth:`samuroi.SamuROIData.pixels`.
+        - 'time': each frame is contiguous, i.e. the data is stored as (T,Y,X) array. This is fastest for displaying and
+          streaming frames (see :py:meth:`samuroi.SamuROIData.frame`) and for extracting many traces at once.
+        - None: keep the data as it was provided.
+
+        :getter: Get the layout. If no layout was requested, return the detected layout of the present data or None if
+            it is unknown.
+        :setter: Convert the present data and all data set afterwards into the given layout. Since the values of the
+            data do not change, no event will be triggered. Lazy video data will not be converted.
+        :type: str or None
+        """
+        if self.__layout is not None:
+            return self.__layout
+        from .util.video import memory_layout
+        return memory_layout(self.data)
+
+    @layout.setter
+    def layout(self, layout):
+        from .util.video import to_layout
+        self.__layout = layout
+        if layout is not None:
+            self.__data = to_layout(self.__data, layout)
+
+    def frame(self, i):
+        """
+        :param i: the frame number.
+        :return: 2D numpy array holding the i-th frame of the video data.
+        """
+        from .util.video import frame
+        return frame(self.data, i)
+
+    def pixels(self, y, x):
+        """
+        Get the time series of individual pixels, using the access pattern that suits the layout of the data.
+
+        :param y: 1D array with the row indices of the pixels.
+        :param x: 1D array with the column indices of the pixels.
+        :return: 2D numpy array with shape (N,T), where N is the number of pixels.
+        """
+        from .util.video import pixels
+        return pixels(self.data, y, x)
+
     @property
     def morphology(self):
         """
@@ -207,7 +351,12 @@ class SamuROIData(object):
     def morphology(self, morphology):
         if (morphology.shape != self.data.shape[0:2]):
             raise Exception("Invalid morphology shape.")
-        self.__morphology = morphology
+        with self.__threshold_lock:
+            self.__morphology = morphology
+            # the elevation map and the watershed hierarchy depend on the morphology only
+            self.__elevation_map = None
+            self.__threshold_hierarchy = None
+            self.__threshold_updates = 0
         # choose some appropriate new threshold value
         self.threshold = numpy.percentile(self.morphology.flatten(), q=90)
         self.morphology_changed()
@@ -244,23 +393,102 @@ class SamuROIData(object):
 
         :getter: Get the present threshold value
         :setter: Set the threshold value. This will trigger a recalculation of :py:attr:`samuroi.SamuROIData.overlay` which in
-                    turn will trigger overlay_changed.
+                    turn will trigger overlay_changed. The overlay is the watershed of the morphology, unless
+                    :py:attr:`samuroi.SamuROIData.approximate_threshold` is enabled.
         :type: float
         """
         return self.__threshold
 
+    @property
+    def approximate_threshold(self):
+        """
+        If enabled, a :py:class:`samuroi.util.watershed.ThresholdHierarchy` is built in a background thread once the
+        threshold of the same morphology gets changed a second time. Afterwards the overlay of every threshold is a
+        single comparison instead of a watershed, but a small fraction of the pixels may differ from the watershed.
+        Building the hierarchy costs about 20 watersheds, until it is done the watershed is used.
+
+        :type: bool, disabled by default
+        """
+        return self.__approximate_threshold
+
+    @approximate_threshold.setter
+    def approximate_threshold(self, enabled):
+        self.__approximate_threshold = bool(enabled)
+
     @threshold.setter
     def threshold(self, t):
+        self.set_threshold(t)
+
+    def set_threshold(self, t, overlay=None):
+        """
+        Set the threshold value, see :py:attr:`samuroi.SamuROIData.threshold`.
+
+        :param t: the new threshold value.
+        :param overlay: the overlay for the threshold as calculated by :py:meth:`samuroi.SamuROIData.threshold_overlay`.
+            If None, the overlay will be calculated.
+        """
+        if overlay is None:
+            overlay = self.threshold_overlay(t)
         self.__threshold = t
         self.threshold_changed()
-        elevation_map = skimage.filters.sobel(self.morphology)
-
-        markers = numpy.zeros_like(self.morphology)
-        markers[self.morphology < self.threshold] = 1
-        markers[self.morphology > self.threshold * 1.1] = 2
+        self.overlay = overlay
+
+    def threshold_overlay(self, t):
+        """
+        Calculate the overlay for the given threshold value without changing any state of the document. This is the
+        expensive part of setting the :py:attr:`samuroi.SamuROIData.threshold`, and it may be called from a worker
+        thread.
+
+        :param t: the threshold value.
+        :return: boolean 2D array with the image shape of the data.
+        """
+        # skimage takes long to import, hence only import it once needed
+        import skimage.filters
+        import skimage.morphology
+
+        with self.__threshold_lock:
+            morphology = self.morphology
+            if self.__elevation_map is None:
+                self.__elevation_map = skimage.filters.sobel(morphology)
+
+            # the first threshold is usually set just once upon initialization. repeated changes of the threshold
+            # (e.g. from the gui) pay off the costs of building the hierarchy.
+            build = self.__approximate_threshold and self.__threshold_hierarchy is None and \
+                    self.__hierarchy_building is not morphology and self.__threshold_updates > 0
+            if build:
+                self.__hierarchy_building = morphology
+            self.__threshold_updates += 1
+            hierarchy, elevation_map = self.__threshold_hierarchy, self.__elevation_map
+
+        if build:
+            # build the hierarchy in the background, this and all other threshold updates use the watershed meanwhile
+            thread = threading.Thread(target=self.__build_threshold_hierarchy, args=(morphology, elevation_map))
+            thread.daemon = True
+            thread.start()
+
+        if self.__approximate_threshold and hierarchy is not None and t > 0:
+            return hierarchy.overlay(t)
+
+        markers = numpy.zeros_like(morphology)
+        markers[morphology < t] = 1
+        markers[morphology > t * 1.1] = 2
         segmentation = skimage.morphology.watershed(elevation_map, markers)
 
-        self.overlay = segmentation == 2
+        return segmentation == 2
+
+    def __build_threshold_hierarchy(self, morphology, elevation_map):
+        """Build the threshold hierarchy of the given morphology, see :py:attr:`samuroi.SamuROIData.approximate_threshold`."""
+        from .util.watershed import ThresholdHierarchy
+        hierarchy = None
+        try:
+            hierarchy = ThresholdHierarchy(morphology, elevation_map)
+        finally:
+            with self.__threshold_lock:
+                if self.__hierarchy_building is morphology:
+                    self.__hierarchy_building = None
+                # drop the hierarchy if the morphology was replaced while it was built
+                if hierarchy is not None and self.__morphology is morphology:
+                    self.__threshold_hierarchy = hierarchy
 
     @property
     def no_postprocessor(self):
@@ -291,15 +519,77 @@ class SamuROIData(object):
         self.__postprocessor = pp
         self.postprocessor_changed()
 
+    def traces(self, masks=None, postprocess=True):
+        """
+        Calculate the traces of many masks at once. The weights of all masks get compiled into one sparse matrix, such
+        that all traces can be obtained with a single pass over the video data
+        (see :py:func:`samuroi.util.traces.extract_traces`).
+        Calculated traces are stored in the :py:attr:`samuroi.SamuROIData.trace_cache` and only get recalculated if
+        the data, the overlay, the postprocessor or the mask have changed since.
+        It is safe to call this function from a worker thread, as long as the masks are not modified concurrently.
+
+        :param masks: iterable of masks, defaults to all masks (including children) in :py:attr:`samuroi.SamuROIData.masks`.
+        :param postprocess: flag whether the :py:attr:`samuroi.SamuROIData.postprocessor` should be applied on the traces.
+        :return: 2D numpy array with shape (len(masks),T), the rows are in the same order as the masks.
+        """
+        from .util.traces import extract_traces
+        masks = list(self.masks) if masks is None else list(masks)
+        traces = numpy.empty(shape=(len(masks), self.data.shape[-1]), dtype=float)
+
+        # take the versions before calculating anything, such that traces which get outdated while they are calculated
+        # in a worker thread are stored with their outdated version.
+        raw_versions = [self.__trace_version(mask, False) for mask in masks]
+        versions = [self.__trace_version(mask, True) for mask in masks] if postprocess else raw_versions
+        data, overlay, postprocessor = self.data, self.overlay, self.postprocessor
+
+        # look up the cache and remember which traces are missing
+        missing = []
+        for i, mask in enumerate(masks):
+            trace = self.trace_cache.get((mask, postprocess), versions[i])
+            if trace is None and postprocess:
+                # maybe only the postprocessing is outdated
+                raw = self.trace_cache.get((mask, False), raw_versions[i])
+                if raw is not None:
+                    trace = postprocessor(raw)
+                    self.trace_cache.put((mask, True), versions[i], trace)
+            if trace is None:
+                missing.append(i)
+            else:
+                traces[i] = trace
+
+        if len(missing) > 0:
+            computed = extract_traces([masks[i] for i in missing], data, overlay)
+            for i, raw in zip(missing, computed):
+                mask = masks[i]
+                self.trace_cache.put((mask, False), raw_versions[i], raw)
+                traces[i] = raw
+                if postprocess:
+                    traces[i] = postprocessor(raw)
+                    self.trace_cache.put((mask, True), versions[i], traces[i])
+        return traces
+
+    def trace(self, mask, postprocess=True):
+        """
+        Calculate the trace of a single mask, see :py:meth:`samuroi.SamuROIData.traces`.
+
+        :return: 1D numpy array holding the trace.
+        """
+        return self.traces([mask], postprocess=postprocess)[0]
+
     def save_hdf5(self, filename, mask=True, pixels=True, branches=True, circles=True, polygons=True, data=False,
-                  traces=True, segmentations=True):
+                  traces=True, segmentations=True, incremental=False):
         """
         The structure of the hdf5 file will be as follows:
 
         - overlay (dataset, optional, binary mask defined by threshold value, threshold is stored as attribute)
-        - data (dataset, optional, the full 3D dataset from which the traces were generated)
-        - branches/circles... (groups holding different kinds of datasets for masks)
-        - traces (group that holds a hierarchy for the traces.)
+        - data (dataset, optional, the full 3D dataset from which the traces were generated, chunked in spatial tiles of
+          a few frames and compressed, see :py:func:`samuroi.util.hdf5.write_video`)
+        - circles/pixels/polygons (groups holding one table for all masks of the respective type, see
+          :py:func:`samuroi.util.hdf5.write_table`)
+        - branches/segmentations/pixelcollections (groups holding one group per mask)
+        - traces (group holding the traces of all masks as one matrix 'matrix', the mask names in 'names' and the row of
+          the parent mask in 'parent', see :py:func:`samuroi.util.hdf5.write_traces`. Single traces can be read with
+          :py:func:`samuroi.util.hdf5.read_traces`.)
 
         :param filename: filename to use, suffix ".h5" will be added if missing.
         :param mask: flag whether mask should be stored in file.
@@ -310,8 +600,40 @@ class SamuROIData(object):
         :param data: flag whether data should be stored in file.
         :param traces:
         :param segmentations:
+        :param incremental: flag whether only the changes since the last call of save_hdf5 with the same filename should
+            be written, e.g. for autosaving. Only masks that were added, removed or triggered their changed event get
+            written, the overlay, the data and the traces of all other masks only if they changed. Falls back to
+            writing the whole file if it was not saved before.
         :return:
         """
+        import os
+        filename = os.path.abspath(filename)
+        if incremental and self.__saved is not None and self.__saved[0] == filename and os.path.exists(filename):
+            self.__save_hdf5_incremental(filename, mask=mask, pixels=pixels, branches=branches, circles=circles,
+                                         polygons=polygons, data=data, traces=traces, segmentations=segmentations)
+        else:
+            self.__save_hdf5_full(filename, mask=mask, pixels=pixels, branches=branches, circles=circles,
+                                  polygons=polygons, data=data, traces=traces, segmentations=segmentations)
+        self.__dirty.clear()
+        self.__removed.clear()
+        self.__saved = (filename, self.__global_versions())
+
+    def __global_versions(self):
+        return {key: self.__versions.get(key, 0) for key in ['data', 'overlay', 'postprocessor']}
+
+    @staticmethod
+    def __mask_types(pixels, branches, circles, polygons, segmentations):
+        from .masks.pixel import PixelMask, PixelMaskCollection
+        from .masks.branch import BranchMask
+        from .masks.circle import CircleMask
+        from .masks.polygon import PolygonMask
+        from .masks.segmentation import Segmentation
+        flags = [(PixelMask, pixels), (PixelMaskCollection, pixels), (PolygonMask, polygons), (CircleMask, circles),
+                 (BranchMask, branches), (Segmentation, segmentations)]
+        return [t for t, flag in flags if flag]
+
+    def __save_hdf5_full(self, filename, mask, pixels, branches, circles, polygons, data, traces, segmentations):
+        from .util import hdf5
 
         import h5py
         f = h5py.File(filename, mode='w')
@@ -321,43 +643,57 @@ class SamuROIData(object):
             f['overlay'].attrs['threshold'] = self.threshold
 
         if data:
-            f.create_dataset('data', data=self.data)
-
-        if pixels:
-            for m in self.pixelmasks:
-                m.to_hdf5(f)
+            hdf5.write_video(f, 'data', self.data)
 
-        if polygons:
-            for m in self.polymasks:
-                m.to_hdf5(f)
+        for t in self.__mask_types(pixels, branches, circles, polygons, segmentations):
+            if t in self.masks.types():
+                t.to_hdf5_many(f, self.masks[t])
 
-        if circles:
-            for m in self.circlemasks:
-                m.to_hdf5(f)
+        if traces:
+            masks = list(self.masks)
+            hdf5.write_traces(f, masks, self.traces(masks))
+        # write stuff to disc
+        f.close()
 
-        if branches:
-            for m in self.branchmasks:
-                m.to_hdf5(f)
+    def __save_hdf5_incremental(self, filename, mask, pixels, branches, circles, polygons, data, traces,
+                                segmentations):
+        from .util import hdf5
 
-        if segmentations:
-            for m in self.segmentationmasks:
-                m.to_hdf5(f)
+        saved = self.__saved[1]
+        changed = {key: v != saved[key] for key, v in self.__global_versions().items()}
 
-        if traces:
-            f.create_group('traces')
-            for m in self.masks:
-                trace = self.postprocessor(m(self.data, self.overlay))
-                if hasattr(m, "children"):
-                    if 'traces/' + m.name not in f:
-                        f.create_group('traces/' + m.name)
-                    f.create_dataset('traces/' + m.name + '/trace', data=trace)
+        import h5py
+        with h5py.File(filename, mode='a') as f:
+            if mask:
+                if changed['overlay'] or 'overlay' not in f:
+                    if 'overlay' in f:
+                        del f['overlay']
+                    f.create_dataset('overlay', data=self.overlay)
+                f['overlay'].attrs['threshold'] = self.threshold
+
+            if data and (changed['data'] or 'data' not in f):
+                if 'data' in f:
+                    del f['data']
+                hdf5.write_video(f, 'data', self.data)
+
+            dirty = [m for m in self.__dirty if m in self.masks]
+            for t in self.__mask_types(pixels, branches, circles, polygons, segmentations):
+                removed = self.__removed.get(t, set())
+                if len(removed) > 0:
+                    t.remove_hdf5(f, removed)
+                modified = [m for m in dirty if type(m) is t]
+                if len(modified) > 0:
+                    t.to_hdf5_many(f, modified)
+
+            if traces:
+                if 'traces' not in f or changed['data'] or changed['overlay'] or changed['postprocessor']:
+                    # all traces changed
+                    masks = list(self.masks)
+                    hdf5.write_traces(f, masks, self.traces(masks))
                 else:
-                    f.create_dataset('traces/' + m.name, data=trace)
-            for m in self.branchmasks:
-                if len(m.children) > 0:
-                    f.create_dataset('traces/' + m.name + '/linescan', data=m.linescan(self.data, self.overlay))
-        # write stuff to disc
-        f.close()
+                    masks = [c for m in dirty for c in [m] + list(getattr(m, "children", []))]
+                    removed = set(name for names in self.__removed.values() for name in names)
+                    hdf5.update_traces(f, masks, self.traces(masks), removed=removed)
 
     def load_swc(self, swc):
         """
@@ -368,30 +704,28 @@ class SamuROIData(object):
 
         :param swc: A object of type :py:class:`samuroi.plugins.swc.SWCFile`.
         """
-        # get all parts from the swc file that have at least one segment
-        from .masks.circle import CircleMask
-        from .masks.branch import BranchMask
-        for b in swc.branches:
-            if len(b) > 1:
-                mask = BranchMask(data=b)
-            else:
-                mask = CircleMask(center=b[['x', 'y']][0], radius=b['radius'][0])
+        # the masks of all branches are created in one pass over the swc file
+        for mask in swc.masks():
             self.masks.add(mask)
 
-    def load_hdf5(self, filename, mask=True, pixels=True, branches=True, circles=True, polygons=True, data=True, segmentations=True):
+    def load_hdf5(self, filename, mask=True, pixels=True, branches=True, circles=True, polygons=True, data=True,
+                  segmentations=True, lazy=False):
         """
         Load data that from hd5 file.
 
         :param filename: The filename/path to read from (include extension)
         :param mask: flag whether to read the mask if it is stored in file.
-        :param pixels: flag whether to read the pixel masks if some are stored in file.
+        :param pixels: flag whether to read the pixel masks and pixel mask collections if some are stored in file.
         :param branches: flag whether to read the branch masks if some are stored in file.
         :param circles: flag whether to read the circle masks if some are stored in file.
         :param polygons: flag whether to read the polygon masks if some are stored in file.
         :param data: flag whether to read the data if it is stored in file.
         :param segmentations: flag whether to read the segmentations if it is stored in file.
+        :param lazy: flag whether the data should be read lazily via :py:class:`samuroi.util.video.HDF5Video`
+            instead of reading it into memory. Since the data is stored in compressed chunks of spatial tiles, only the
+            chunks of the displayed frames or extracted traces will be read and decompressed.
         """
-        from .masks.pixel import PixelMask
+        from .masks.pixel import PixelMask, PixelMaskCollection
         from .masks.branch import BranchMask
         from .masks.circle import CircleMask
         from .masks.polygon import PolygonMask
@@ -402,19 +736,23 @@ class SamuROIData(object):
             if mask:
                 if 'overlay' not in f:
                     raise Exception("Overlay data not stored in given hd5 file.")
-                self.threshold = f['overlay'].attrs['threshold']
-                if (self.overlay != f['overlay']).any():
-                    print("Warning: overlay threshold does not match with stored binary mask!")
-                self.overlay = f['overlay'].value
+                # use the stored overlay instead of recalculating it from the threshold
+                self.set_threshold(f['overlay'].attrs['threshold'], f['overlay'][()])
 
             if data:
                 if 'data' not in f:
                     raise Exception("Data not stored in given hd5 file.")
-                self.data = f['data'].value
+                if lazy:
+                    from .util.video import HDF5Video
+                    self.data = HDF5Video(filename, 'data')
+                else:
+                    self.data = f['data'][()]
 
             if pixels:
                 for m in PixelMask.from_hdf5(f):
                     self.masks.add(m)
+                for m in PixelMaskCollection.from_hdf5(f):
+                    self.masks.add(m)
 
             if polygons:
                 for m in PolygonMask.from_hdf5(f):
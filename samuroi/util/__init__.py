@@ -15,6 +15,16 @@
     :undoc-members:
     :show-inheritance:
 
+.. automodule:: samuroi.util.framecache
+    :members:
+    :undoc-members:
+    :show-inheritance:
+
+.. automodule:: samuroi.util.hdf5
+    :members:
+    :undoc-members:
+    :show-inheritance:
+
 .. automodule:: samuroi.util.maskcreator
     :members:
     :undoc-members:
@@ -35,4 +45,34 @@
     :undoc-members:
     :show-inheritance:
 
+.. automodule:: samuroi.util.rasterize
+    :members:
+    :undoc-members:
+    :show-inheritance:
+
+.. automodule:: samuroi.util.spatialindex
+    :members:
+    :undoc-members:
+    :show-inheritance:
+
+.. automodule:: samuroi.util.tracecache
+    :members:
+    :undoc-members:
+    :show-inheritance:
+
+.. automodule:: samuroi.util.traces
+    :members:
+    :undoc-members:
+    :show-inheritance:
+
+.. automodule:: samuroi.util.video
+    :members:
+    :undoc-members:
+    :show-inheritance:
+
+.. automodule:: samuroi.util.watershed
+    :members:
+    :undoc-members:
+    :show-inheritance:
+
 """
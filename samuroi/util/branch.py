@@ -11,6 +11,86 @@ def normalize(v):
     return v / numpy.linalg.norm(v)
 
 
+def split_branches(branches, nsegments=2, length=None):
+    """
+    Split many branches into segments at once. The split points of all branches are inserted into the anchor points
+    via a single :py:func:`numpy.lexsort` by branch and arc length. The arc length and the split points are calculated
+    within each branch and the anchor points at the split points are linearly interpolated, hence the result for each
+    branch is the same as of :py:meth:`samuroi.util.branch.Branch.split` with `k=1` and `s=0`, independent of the other
+    branches.
+
+    :param branches: list of :py:class:`samuroi.util.branch.Branch`.
+    :param nsegments: the number of segments per branch.
+    :param length: the length of each segment (the last segment will have the remainder of modulo division). If given,
+        nsegments is ignored.
+    :return: list holding the list of segments (:py:class:`samuroi.util.branch.Branch`) for each branch. Branches with
+        zero length are not split.
+    """
+    branches = list(branches)
+    if len(branches) == 0:
+        return []
+    sizes = numpy.array([len(b) for b in branches], dtype=int)
+    columns = [numpy.concatenate([numpy.asarray(b[key], dtype=float) for b in branches])
+               for key in ('x', 'y', 'z', 'radius')]
+    x, y = columns[0], columns[1]
+    starts = numpy.r_[0, numpy.cumsum(sizes)[:-1]]
+    ends = starts + sizes
+
+    # the arc length of each branch. the cumulative sum is taken per branch, a cumulative sum over all branches would
+    # round differently depending on the preceding branches.
+    steps = numpy.r_[0., numpy.sqrt(numpy.diff(x) ** 2 + numpy.diff(y) ** 2)]
+    steps[starts[sizes > 0]] = 0.
+    t = numpy.concatenate([numpy.cumsum(steps[s:e]) for s, e in zip(starts, ends)])
+    lengths = numpy.where(sizes > 0, t[numpy.maximum(ends - 1, 0)], 0.)
+
+    # the split points of all branches, in the arc length of their branch
+    sublength = lengths / nsegments if length is None else numpy.full(len(branches), float(length))
+    splittable = (lengths > 0) & (sublength > 0)
+    counts = numpy.zeros(len(branches), dtype=int)
+    counts[splittable] = (lengths[splittable] / sublength[splittable]).astype(int)
+    owner = numpy.repeat(numpy.arange(len(branches)), counts)
+    first = numpy.r_[0, numpy.cumsum(counts)[:-1]]
+    n = numpy.arange(counts.sum()) - first[owner] + 1
+    cuts = n * sublength[owner]
+
+    # the positions where the split points get inserted into the anchor points, like bisect.bisect_left within each
+    # branch: sort by branch, then arc length, then split points before anchors of the same arc length. the rank of
+    # the k-th split point counts the k split points sorted before it.
+    keys = (numpy.r_[numpy.ones(len(t)), numpy.zeros(len(cuts))],
+            numpy.r_[t, cuts],
+            numpy.r_[numpy.repeat(numpy.arange(len(branches)), sizes), owner])
+    rank = numpy.empty(len(t) + len(cuts), dtype=int)
+    rank[numpy.lexsort(keys)] = numpy.arange(len(rank))
+    position = rank[len(t):] - numpy.arange(len(cuts))
+    # interpolate between the anchors around the split points. due to rounding, the last split point of a branch may
+    # lie slightly behind its last anchor, hence only anchors of the same branch are used.
+    hi = numpy.minimum(position, ends[owner] - 1)
+    lo = hi - 1
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        fraction = numpy.nan_to_num((cuts - t[lo]) / (t[hi] - t[lo]))
+    merged = [numpy.insert(c, position, c[lo] + fraction * (c[hi] - c[lo])) for c in columns + [t]]
+    t = merged[-1]
+    dtype = [('x', float), ('y', float), ('z', float), ('radius', float)]
+    data = numpy.rec.fromarrays(merged[:-1], dtype=dtype)
+
+    # the positions of the split points and of the branches in the merged arrays
+    positions = position + numpy.arange(len(cuts))
+    mstarts = starts + first
+    mends = ends + first + counts
+
+    result = []
+    for b, branch in enumerate(branches):
+        if not splittable[b]:
+            result.append([branch])
+            continue
+        indices = [mstarts[b]] + positions[first[b]:first[b] + counts[b]].tolist()
+        # append the end index for the last segment if last segment size is larger than eps
+        if t[mends[b] - 1] - t[mends[b] - 2] > 0.01:
+            indices.append(mends[b] - 1)
+        result.append([Branch(data=data[i0:i1 + 1]) for i0, i1 in zip(indices[:-1], indices[1:])])
+    return result
+
+
 class Branch(object):
     """
     Represent a dendrite branch, or part of a dendrite branch.
@@ -29,6 +109,23 @@ class Branch(object):
         else:
             self.data = data
 
+    @property
+    def data(self):
+        """
+        The record array with the fields x, y, z and radius of all anchor points.
+
+        .. note::
+            Replace the data instead of modifying it in place, otherwise the memoized corners and outline are not
+            updated.
+        """
+        return self.__data
+
+    @data.setter
+    def data(self, data):
+        self.__data = data
+        self.__corners = None
+        self.__outline = None
+
     def __getitem__(self, item):
         return self.data[item]
 
@@ -53,46 +150,63 @@ class Branch(object):
         Nx2x2 array, where N is the number of corners.
         The second dimension is for left and right corner.
         The last dimension holds x,y values.
+
+        The corners are calculated once for all anchors and reused until :py:attr:`samuroi.util.branch.Branch.data`
+        gets replaced. The returned array is read only.
         """
+        if self.__corners is None:
+            self.__corners = self.__calculate_corners()
+        return self.__corners
 
+    def __calculate_corners(self):
         if self.nquadrilaterals == 0:
             raise Exception("Corners can only be calculated for branches with at least 1 segment.")
-        # the corners of the polygons for each element of the segment
-        corners = numpy.empty(shape=(len(self), 2, 2), dtype=float)
-
-        # handle first and last element
-        c0 = numpy.array((self['x'][0], self['y'][0]))
-        c1 = numpy.array((self['x'][1], self['y'][1]))
-
-        corners[0, 0] = c0 + perpedndicular1(c1 - c0) * self['radius'][0]
-        corners[0, 1] = c0 - perpedndicular1(c1 - c0) * self['radius'][0]
-
-        c0 = numpy.array((self['x'][-1], self['y'][-1]))
-        c1 = numpy.array((self['x'][-2], self['y'][-2]))
-
-        corners[-1, 0] = c0 + perpedndicular1(-c1 + c0) * self['radius'][-1]
-        corners[-1, 1] = c0 - perpedndicular1(-c1 + c0) * self['radius'][-1]
-
-        # handle the intermediate segments
-        for i, (s0, s1, s2) in enumerate(zip(self[0:-2], self[1:-1], self[2:])):
-            c0 = numpy.array((s0['x'], s0['y']))
-            c1 = numpy.array((s1['x'], s1['y']))
-            c2 = numpy.array((s2['x'], s2['y']))
-
-            # perpendicular unit vectors
-            pv01 = perpedndicular1(c1 - c0)
-            pv12 = perpedndicular1(c2 - c1)
-
-            corners[i + 1, 0] = c1 + s1['radius'] * normalize((pv01 + pv12) / 2.)
-            corners[i + 1, 1] = c1 - s1['radius'] * normalize((pv01 + pv12) / 2.)
+        centers = numpy.column_stack((self['x'], self['y'])).astype(float)
+
+        # perpendicular unit vectors of all quadrilaterals
+        d = numpy.diff(centers, axis=0)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            perpendicular = numpy.column_stack((-d[:, 1], d[:, 0]))
+            perpendicular /= numpy.linalg.norm(perpendicular, axis=1)[:, numpy.newaxis]
+
+            # the first and last anchor use the direction of their quadrilateral, intermediate anchors the mean
+            # direction of both adjacent quadrilaterals
+            directions = numpy.empty_like(centers)
+            directions[0] = perpendicular[0]
+            directions[-1] = perpendicular[-1]
+            mean = (perpendicular[:-1] + perpendicular[1:]) / 2.
+            directions[1:-1] = mean / numpy.linalg.norm(mean, axis=1)[:, numpy.newaxis]
+
+        offsets = directions * numpy.asarray(self['radius'], dtype=float)[:, numpy.newaxis]
+        corners = numpy.stack((centers + offsets, centers - offsets), axis=1)
+        corners.setflags(write=False)
         return corners
 
     @property
     def outline(self):
         """
-        Return the corners of the branch in such order that they encode a polygon.
+        Return the corners of the branch in such order that they encode a polygon. Like the corners, the outline is
+        only calculated once and read only.
         """
-        return numpy.row_stack((self.corners[:, 0, :], self.corners[::-1, 1, :]))
+        if self.__outline is None:
+            corners = self.corners
+            self.__outline = numpy.row_stack((corners[:, 0, :], corners[::-1, 1, :]))
+            self.__outline.setflags(write=False)
+        return self.__outline
+
+    def moved(self, offset):
+        """
+        :param offset: the (x,y) offset.
+        :return: a new branch moved by the offset. Its corners and outline are shifted instead of recalculated.
+        """
+        x = self['x'] + offset[0]
+        y = self['y'] + offset[1]
+        branch = Branch(x=x, y=y, z=self['z'], r=self['radius'])
+        if self.__corners is not None:
+            corners = self.__corners + numpy.asarray(offset[0:2], dtype=float)
+            corners.setflags(write=False)
+            branch.__corners = corners
+        return branch
 
     @property
     def length(self):
@@ -104,7 +218,13 @@ class Branch(object):
         return len(self.data)
 
     def split(self, nsegments=2, length=None, k=1, s=0):
-        """Split the branch into segments"""
+        """
+        Split the branch into segments. For linear interpolation (`k=1` and `s=0`) this is done by
+        :py:func:`samuroi.util.branch.split_branches`, otherwise by spline interpolation of the anchor points.
+        """
+        if k == 1 and s == 0:
+            return split_branches([self], nsegments=nsegments, length=length)[0]
+
         if length is None:
             sublength = self.length / nsegments  # the target length of the segments
         else:
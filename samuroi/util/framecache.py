@@ -0,0 +1,199 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+
+import numpy
+
+
+def downsample(frame, level):
+    """
+    Reduce the resolution of a frame by averaging blocks of `2**level x 2**level` pixels. Rows and columns which do not
+    fill a whole block are dropped.
+
+    :param frame: 2D numpy array.
+    :param level: the level within the resolution pyramid, 0 is the full resolution.
+    :return: 2D float32 array with shape (Y // 2**level, X // 2**level).
+    """
+    if level == 0:
+        return frame
+    f = 2 ** level
+    Y, X = frame.shape[0] // f, frame.shape[1] // f
+    blocks = numpy.asarray(frame[:Y * f, :X * f], dtype=numpy.float32).reshape(Y, f, X, f)
+    return blocks.mean(axis=(1, 3), dtype=numpy.float32)
+
+
+def pyramid_level(span, pixels, maxlevel=4):
+    """
+    Choose the pyramid level for displaying an image of which `span` data pixels are visible on `pixels` screen pixels,
+    such that no level is used whose resolution is lower than the screen resolution.
+
+    :return: int in range [0,maxlevel]
+    """
+    if pixels <= 0 or span <= pixels:
+        return 0
+    return int(min(maxlevel, numpy.floor(numpy.log2(span / float(pixels)))))
+
+
+class FrameCache(object):
+    """
+    A least recently used cache of frames at different levels of the resolution pyramid (see
+    :py:func:`samuroi.util.framecache.downsample`). Frames can be prefetched by background threads, e.g. the
+    neighbours of the displayed frame, such that stepping through a lazy video does not wait for the disc.
+    """
+
+    def __init__(self, frame, capacity=64, threads=2):
+        """
+        :param frame: function taking the frame number and returning the frame as 2D array, e.g.
+            :py:meth:`samuroi.SamuROIData.frame`.
+        :param capacity: the maximum number of cached frames.
+        :param threads: the number of threads used for prefetching.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        self.__frame = frame
+        self.__items = OrderedDict()
+        self.__pending = {}
+        self.__lock = threading.Lock()
+        self.__generation = 0
+        self.__executor = ThreadPoolExecutor(max_workers=threads)
+        self.capacity = capacity
+
+    def __load(self, i, level, generation):
+        image = downsample(self.__frame(i), level)
+        with self.__lock:
+            # drop frames which were loaded before the cache got cleared
+            if generation == self.__generation:
+                self.__pending.pop((i, level), None)
+                self.__items[(i, level)] = image
+                self.__items.move_to_end((i, level))
+                while len(self.__items) > self.capacity:
+                    self.__items.popitem(last=False)
+        return image
+
+    def get(self, i, level=0):
+        """
+        :return: the frame i at the given pyramid level. If it is not cached yet, it is loaded in the calling thread,
+            unless it is already being prefetched, in which case its loading is awaited.
+        """
+        key = (i, level)
+        with self.__lock:
+            if key in self.__items:
+                self.__items.move_to_end(key)
+                return self.__items[key]
+            future = self.__pending.get(key)
+            generation = self.__generation
+        if future is not None:
+            try:
+                return future.result()
+            except CancelledError:
+                pass
+        return self.__load(i, level, generation)
+
+    def cached(self, i, level=0):
+        """:return: True if the frame is available without waiting."""
+        with self.__lock:
+            return (i, level) in self.__items
+
+    def prefetch(self, indices, level=0):
+        """Load the given frames in the background, frames which are cached or already being loaded are skipped."""
+        with self.__lock:
+            generation = self.__generation
+            for i in indices:
+                key = (i, level)
+                if key in self.__items or key in self.__pending:
+                    continue
+                self.__pending[key] = self.__executor.submit(self.__load, i, level, generation)
+
+    def clear(self):
+        """Drop all cached frames, e.g. after the data changed. Frames which are being loaded will be discarded."""
+        with self.__lock:
+            self.__generation += 1
+            self.__items.clear()
+            for future in self.__pending.values():
+                future.cancel()
+            self.__pending.clear()
+
+    def shutdown(self):
+        """Stop the prefetching threads."""
+        self.clear()
+        self.__executor.shutdown(wait=False)
+
+
+class FrameRingBuffer(object):
+    """
+    A ring buffer of consecutive frames which are loaded ahead of the playback position by a background thread.
+
+    The consumer never waits for a frame: :py:meth:`samuroi.util.framecache.FrameRingBuffer.latest` returns the most
+    recent frame which is ready, and frames the playback has already passed are not loaded anymore. Hence, if loading
+    or rendering falls behind, frames get dropped instead of slowing down the playback.
+    """
+
+    def __init__(self, frame, length, size=32):
+        """
+        :param frame: function taking the frame number and returning the frame, e.g.
+            :py:meth:`samuroi.util.framecache.FrameCache.get`.
+        :param length: the number of frames of the video, loading stops at the last frame.
+        :param size: the number of slots, i.e. how many frames get loaded ahead of the playback position.
+        """
+        self.__frame = frame
+        self.length = length
+        self.size = size
+        self.__slots = [None] * size
+        self.__keys = [-1] * size
+        # the playback position and the next frame to load
+        self.__head = 0
+        self.__tail = 0
+        self.__running = True
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, name="FrameRingBuffer")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while self.__running and (self.__tail >= self.length or self.__tail - self.__head >= self.size):
+                    self.__condition.wait()
+                if not self.__running:
+                    return
+                i = self.__tail
+            image = self.__frame(i)
+            with self.__condition:
+                # the buffer may have been restarted while the frame was loaded
+                if self.__tail == i:
+                    self.__slots[i % self.size] = image
+                    self.__keys[i % self.size] = i
+                    self.__tail = i + 1
+
+    def seek(self, i):
+        """Discard all buffered frames and continue loading at frame i."""
+        with self.__condition:
+            self.__keys = [-1] * self.size
+            self.__slots = [None] * self.size
+            self.__head = self.__tail = i
+            self.__condition.notify()
+
+    def latest(self, first, last):
+        """
+        Find the most recent buffered frame in the range [first,last]. Frames before last are not needed anymore, so
+        their slots are released for loading further frames, and frames which have not been loaded yet are skipped.
+
+        :return: tuple (i, frame) or None if no frame of the range is ready.
+        """
+        with self.__condition:
+            result = None
+            for i in range(last, first - 1, -1):
+                if self.__keys[i % self.size] == i:
+                    result = i, self.__slots[i % self.size]
+                    break
+            self.__head = max(self.__head, last)
+            # drop the frames which the playback passed already and continue at the playback position
+            if self.__tail < self.__head:
+                self.__tail = self.__head
+            self.__condition.notify()
+            return result
+
+    def stop(self):
+        """Stop the loading thread."""
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify()
@@ -0,0 +1,248 @@
+"""
+Helpers for the storage layout of :py:meth:`samuroi.SamuROIData.save_hdf5`.
+
+Large datasets (the video and the traces) are stored chunked and compressed. Masks of the same type and all traces are
+consolidated into a few datasets together with a table of names, instead of one tiny dataset per mask, which is
+very slow to write and read for thousands of masks.
+"""
+import numpy
+
+compression = 'gzip'
+"""The compression filter used for large datasets, 'gzip' is available in every hdf5 installation."""
+
+
+def video_chunks(shape, itemsize, tile=64, budget=2 ** 20):
+    """
+    The chunk shape of a video dataset: spatial tiles of a few frames each, such that reading single frames, regions
+    of interest as well as consecutive frames only decompresses chunks which overlap the requested data.
+
+    :param shape: the shape (Y,X,T) of the video.
+    :param itemsize: the number of bytes per value.
+    :param tile: the edge length of the spatial tiles.
+    :param budget: the approximate number of bytes of one chunk.
+    :return: tuple (tile_y, tile_x, frames)
+    """
+    Y, X, T = shape
+    ty, tx = min(Y, tile), min(X, tile)
+    frames = max(1, min(T, int(budget // (ty * tx * itemsize))))
+    return ty, tx, frames
+
+
+def write_video(f, name, data):
+    """
+    Write the video data chunked and compressed. The data is written in chunks of frames, hence it may also be a lazy
+    :py:class:`samuroi.util.video.Video`.
+
+    :param f: the opened hdf5 file or group.
+    :param name: the name of the dataset.
+    :param data: the video data with shape (Y,X,T).
+    """
+    from .video import frame_chunks
+    dtype = numpy.dtype(data.dtype)
+    dataset = f.create_dataset(name, shape=data.shape, dtype=dtype, chunks=video_chunks(data.shape, dtype.itemsize),
+                               compression=compression, shuffle=True)
+    for start, stop, chunk in frame_chunks(data):
+        dataset[:, :, start:stop] = chunk
+    return dataset
+
+
+def write_names(group, names, name='names'):
+    """Store a list of strings as a single variable length string dataset."""
+    import h5py
+    if name in group:
+        del group[name]
+    group.create_dataset(name, data=numpy.array(list(names), dtype=object), dtype=h5py.special_dtype(vlen=str))
+
+
+def read_names(group, name='names'):
+    """Read a list of strings stored by :py:func:`samuroi.util.hdf5.write_names`."""
+    return [n.decode() if isinstance(n, bytes) else n for n in group[name][()]]
+
+
+def is_table(group):
+    """:return: True if the group holds consolidated masks as written by :py:func:`samuroi.util.hdf5.write_table`."""
+    return group.attrs.get('layout', None) == 'table'
+
+
+def write_table(f, path, names, columns=None, ragged=None):
+    """
+    (Re)write a table of masks of one type into the group at path. Each row of the table belongs to one mask.
+
+    :param f: the opened hdf5 file.
+    :param path: the path of the group, e.g. 'circles'.
+    :param names: list of the names of the masks.
+    :param columns: dictionary mapping dataset names to arrays whose first axis has the length of names.
+    :param ragged: dictionary mapping dataset names to lists of arrays with one array per mask and varying length.
+        Each column is stored as concatenation of all arrays plus a dataset '<name>_offsets', such that the array of
+        mask i is `data[offsets[i]:offsets[i+1]]`.
+    """
+    if path in f:
+        del f[path]
+    group = f.create_group(path)
+    group.attrs['layout'] = 'table'
+    write_names(group, names)
+    for key, values in (columns or {}).items():
+        group.create_dataset(key, data=numpy.asarray(values))
+    for key, arrays in (ragged or {}).items():
+        offsets = numpy.zeros(len(arrays) + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum([len(a) for a in arrays])
+        group.create_dataset(key + '_offsets', data=offsets)
+        if len(arrays) > 0:
+            group.create_dataset(key, data=numpy.concatenate([numpy.asarray(a) for a in arrays]))
+        else:
+            group.create_dataset(key, data=numpy.zeros(0))
+    return group
+
+
+def read_table(f, path, columns=(), ragged=()):
+    """
+    Read a table written by :py:func:`samuroi.util.hdf5.write_table`.
+
+    :return: tuple (names, columns, ragged) with the list of names and dictionaries holding the requested columns.
+    """
+    group = f[path]
+    names = read_names(group)
+    values = {key: group[key][()] for key in columns}
+    arrays = {}
+    for key in ragged:
+        offsets, data = group[key + '_offsets'][()], group[key][()]
+        arrays[key] = [data[offsets[i]:offsets[i + 1]] for i in range(len(names))]
+    return names, values, arrays
+
+
+def remove_from_table(f, path, names):
+    """
+    Remove the rows of the given masks from a table written by :py:func:`samuroi.util.hdf5.write_table`. Names which
+    are not stored are ignored.
+
+    :param f: the opened hdf5 file.
+    :param path: the path of the group, e.g. 'circles'.
+    :param names: iterable of the names of the masks to remove.
+    """
+    names = set(names)
+    if path not in f or len(names) == 0:
+        return
+    group = f[path]
+    stored = read_names(group)
+    keep = [i for i, n in enumerate(stored) if n not in names]
+    if len(keep) == len(stored):
+        return
+    keys = [k for k in group.keys() if k != 'names' and not k.endswith('_offsets')]
+    raggedkeys = [k for k in keys if k + '_offsets' in group]
+    columnkeys = [k for k in keys if k not in raggedkeys]
+    names, columns, ragged = read_table(f, path, columns=columnkeys, ragged=raggedkeys)
+    write_table(f, path, [names[i] for i in keep],
+                columns={k: v[keep] for k, v in columns.items()},
+                ragged={k: [v[i] for i in keep] for k, v in ragged.items()})
+
+
+def write_traces(f, masks, traces, path='traces'):
+    """
+    Store the traces of all masks as one chunked and compressed matrix, with one row per mask, and a table which maps
+    the rows to the names of the masks and the row of the parent mask (-1 for masks without parent).
+
+    :param f: the opened hdf5 file.
+    :param masks: list of masks.
+    :param traces: 2D array with one row per mask.
+    :param path: the path of the group.
+    """
+    if path in f:
+        del f[path]
+    group = f.create_group(path)
+    group.attrs['layout'] = 'matrix'
+    write_names(group, [m.name for m in masks])
+    row = {m: i for i, m in enumerate(masks)}
+    group.create_dataset('parent', data=numpy.array([row.get(getattr(m, 'parent', None), -1) for m in masks],
+                                                    dtype=numpy.int64))
+    n, T = traces.shape
+    group.create_dataset('matrix', data=traces, chunks=(max(1, min(n, 2 ** 16 // max(T, 1))), T) if n > 0 else None,
+                         maxshape=(None, T), compression=compression, shuffle=True)
+    return group
+
+
+def read_traces(filename, names=None, path='traces'):
+    """
+    Read stored traces without loading the whole trace matrix, only the rows of the requested masks are read.
+
+    :param filename: the hdf5 file written by :py:meth:`samuroi.SamuROIData.save_hdf5`.
+    :param names: the names of the masks whose traces should be read, defaults to all.
+    :param path: the path of the trace group.
+    :return: tuple (names, traces) where traces is a 2D array with one row per name.
+    """
+    import h5py
+    with h5py.File(filename, mode='r') as f:
+        group = f[path]
+        stored = read_names(group)
+        if names is None:
+            return stored, group['matrix'][()]
+        index = {n: i for i, n in enumerate(stored)}
+        rows = numpy.array([index[n] for n in names], dtype=numpy.int64)
+        # hdf5 requires increasing indices for point selections
+        order = numpy.argsort(rows)
+        traces = numpy.empty(shape=(len(rows), group['matrix'].shape[1]), dtype=group['matrix'].dtype)
+        if len(rows) > 0:
+            unique, inverse = numpy.unique(rows[order], return_inverse=True)
+            traces[order] = group['matrix'][unique.tolist()][inverse]
+        return list(names), traces
+
+
+def update_traces(f, masks, traces, removed=(), path='traces'):
+    """
+    Update the trace matrix written by :py:func:`samuroi.util.hdf5.write_traces` in place, such that only the rows of
+    the given masks need to be written. Rows of removed masks get replaced by rows from the end of the matrix, hence
+    the matrix never needs to be rewritten as a whole.
+
+    :param f: the opened hdf5 file.
+    :param masks: list of added or modified masks, including their children.
+    :param traces: 2D array with one row per mask.
+    :param removed: names of removed masks. The children of removed and modified masks are removed as well.
+    :param path: the path of the group.
+    """
+    group = f[path]
+    matrix = group['matrix']
+    names = read_names(group)
+    parent = group['parent'][()]
+    row = {n: i for i, n in enumerate(names)}
+
+    # drop removed masks and all children of removed or modified masks, the latter are contained in masks again
+    updated = set(m.name for m in masks)
+    parents = set(row[n] for n in updated.union(removed) if n in row)
+    drop = set(row[n] for n in removed if n in row)
+    drop.update(i for i, p in enumerate(parent) if p in parents)
+
+    # fill the holes with kept rows from the end of the matrix
+    n = len(names) - len(drop)
+    holes = sorted(i for i in drop if i < n)
+    tail = [i for i in range(n, len(names)) if i not in drop]
+    moved = dict(zip(tail, holes))
+    for src, dst in moved.items():
+        matrix[dst] = matrix[src]
+    mapping = numpy.full(len(names) + 1, -1, dtype=numpy.int64)
+    for i in range(len(names)):
+        if i not in drop:
+            mapping[i] = moved.get(i, i)
+    order = numpy.argsort(numpy.where(mapping[:-1] >= 0, mapping[:-1], len(names)), kind='stable')[:n]
+    names = [names[i] for i in order]
+    # parents which got dropped map to -1 via the last entry of mapping
+    parent = mapping[numpy.where(parent[order] >= 0, parent[order], len(mapping) - 1)]
+
+    # overwrite the rows of modified masks in place and append the new ones
+    row = {name: i for i, name in enumerate(names)}
+    new = [i for i, m in enumerate(masks) if m.name not in row]
+    matrix.resize((n + len(new), matrix.shape[1]))
+    for i, m in enumerate(masks):
+        if m.name in row:
+            matrix[row[m.name]] = traces[i]
+    if len(new) > 0:
+        matrix[n:] = traces[new]
+    for i in new:
+        row[masks[i].name] = len(names)
+        names.append(masks[i].name)
+    parent = numpy.append(parent, numpy.full(len(new), -1, dtype=numpy.int64))
+    for m in masks:
+        p = getattr(m, 'parent', None)
+        parent[row[m.name]] = row.get(p.name, -1) if p is not None else -1
+
+    write_names(group, names)
+    del group['parent']
+    group.create_dataset('parent', data=parent)
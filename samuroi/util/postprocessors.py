@@ -1,5 +1,4 @@
 import numpy
-import scipy.signal
 
 
 class DetrendPostProcessor(object):
@@ -7,6 +6,7 @@ class DetrendPostProcessor(object):
 
     def __call__(self, trace):
         if not numpy.isinf(trace).any() and not numpy.isnan(trace).any():
+            import scipy.signal
             return scipy.signal.detrend(trace)
         return trace
 
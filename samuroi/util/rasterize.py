@@ -0,0 +1,58 @@
+import numpy
+
+
+def polygon_coverage(outlines, oversampling=10, budget=2 ** 24):
+    """
+    Rasterize many polygons at once. The polygons are drawn side by side into one oversampled image per batch, which is
+    reduced to the pixel coverage in a single array operation, instead of creating and reducing one image per polygon.
+
+    :param outlines: list of (N,2) arrays holding the x,y coordinates of the corners of each polygon.
+    :param oversampling: the number of subpixels per pixel along each axis.
+    :param budget: the maximal number of subpixels of the image of one batch.
+    :return: list of tuples (rows, cols, coverage) of 1D arrays, one per polygon, see
+        :py:attr:`samuroi.masks.polygon.PolygonMask.coverage`.
+    """
+    from PIL import Image, ImageDraw
+    s = oversampling
+    outlines = [numpy.asarray(o, dtype=float)[:, 0:2] for o in outlines]
+    # floor instead of truncating towards zero, such that polygons at negative coordinates are not cut off
+    lower = [numpy.floor(numpy.min(o, axis=0)).astype(int) for o in outlines]
+    sizes = [numpy.floor(numpy.max(o, axis=0)).astype(int) + 1 - l for o, l in zip(outlines, lower)]
+    # the width of the batch images in pixels, each tile is surrounded by a gap of one pixel, which keeps neighbouring
+    # polygons apart.
+    width = max([256] + [W + 2 for W, H in sizes])
+
+    results = [None] * len(outlines)
+    start = 0
+    while start < len(outlines):
+        # pack the tiles of the batch row by row
+        placements = []
+        x = y = shelf = 0
+        for k in range(start, len(outlines)):
+            W, H = sizes[k]
+            if x + W + 1 > width:
+                x, y, shelf = 0, y + shelf, 0
+            if len(placements) > 0 and (y + max(shelf, H + 1) + 1) * width * s * s > budget:
+                break
+            placements.append((k, x + 1, y + 1))
+            x += W + 1
+            shelf = max(shelf, H + 1)
+        height = y + shelf + 1
+        start += len(placements)
+
+        image = Image.new('I', (width * s, height * s), 0)
+        draw = ImageDraw.Draw(image)
+        for k, X, Y in placements:
+            spoly = outlines[k] - lower[k] + (X, Y)
+            draw.polygon(xy=[(p[0] * s, p[1] * s) for p in spoly], outline=False, fill=1)
+
+        # create a numpy array of the image where the extra resolution pixels are wrapped into extra dimensions
+        coverage = numpy.array(image).reshape((height, s, width, s)).sum(axis=(1, 3)).astype(float) / (s * s)
+
+        for k, X, Y in placements:
+            W, H = sizes[k]
+            weights = coverage[Y:Y + H, X:X + W]
+            rows, cols = numpy.nonzero(weights)
+            Cl, Rl = lower[k]
+            results[k] = (rows + Rl, cols + Cl, weights[rows, cols])
+    return results
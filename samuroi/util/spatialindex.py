@@ -0,0 +1,226 @@
+import numpy
+
+
+def bounding_box(mask):
+    """
+    The bounding box of a mask in the coordinates of the mask outlines, i.e. the pixel in row r and column c covers
+    the square `[c,c+1(x[r,r+1(`.
+
+    :param mask: any mask type of :py:mod:`samuroi.masks`.
+    :return: tuple (x0,y0,x1,y1).
+    """
+    if hasattr(mask, "radius") and hasattr(mask, "center"):
+        (x, y), r = mask.center, mask.radius
+        return x - r, y - r, x + r, y + r
+    if hasattr(mask, "outline"):
+        outline = numpy.asarray(mask.outline)
+        x0, y0 = outline.min(axis=0)[0:2]
+        x1, y1 = outline.max(axis=0)[0:2]
+        return x0, y0, x1, y1
+    if hasattr(mask, "x") and hasattr(mask, "y"):
+        x, y = numpy.asarray(mask.x), numpy.asarray(mask.y)
+        if len(x) == 0:
+            return None
+        return x.min(), y.min(), x.max() + 1, y.max() + 1
+    if hasattr(mask, "data") and numpy.ndim(mask.data) == 2:
+        # a segmentation covering the whole image
+        Y, X = numpy.shape(mask.data)
+        return 0, 0, X, Y
+    return None
+
+
+def contains(mask, x, y):
+    """
+    Exact test whether the point (x,y) lies within the mask, using the same coordinates as
+    :py:func:`samuroi.util.spatialindex.bounding_box`.
+    """
+    if hasattr(mask, "radius") and hasattr(mask, "center"):
+        (cx, cy), r = mask.center, mask.radius
+        return (x - cx) ** 2 + (y - cy) ** 2 <= r ** 2
+    if hasattr(mask, "outline"):
+        return point_in_polygon(numpy.asarray(mask.outline)[:, 0:2], x, y)
+    if hasattr(mask, "x") and hasattr(mask, "y"):
+        return bool(numpy.any((numpy.asarray(mask.x) == numpy.floor(x)) & (numpy.asarray(mask.y) == numpy.floor(y))))
+    if hasattr(mask, "data") and numpy.ndim(mask.data) == 2:
+        r, c = int(numpy.floor(y)), int(numpy.floor(x))
+        return 0 <= r < mask.data.shape[0] and 0 <= c < mask.data.shape[1] and mask.data[r, c] != 0
+    return True
+
+
+def point_in_polygon(outline, x, y):
+    """Even-odd rule test whether the point (x,y) lies within the polygon given by its corners (N,2)."""
+    x0, y0 = outline[:, 0], outline[:, 1]
+    x1, y1 = numpy.roll(x0, -1), numpy.roll(y0, -1)
+    crosses = (y0 > y) != (y1 > y)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        xcross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return bool(numpy.count_nonzero(crosses & (x < xcross)) % 2)
+
+
+class SpatialIndex(object):
+    """
+    A grid of buckets over the image plane, each bucket holds the masks whose bounding box overlaps the bucket. Hence,
+    finding the masks at some pixel or within some region only needs to look at the masks of a few buckets instead of
+    all masks.
+
+    If constructed with a :py:class:`samuroi.maskset.MaskSet`, the index follows the `added` and `removed` events of the
+    set and the `changed` events of the masks. The children of all masks are indexed as well.
+    """
+
+    def __init__(self, masks=None, cell=32):
+        """
+        :param masks: optional :py:class:`samuroi.maskset.MaskSet` to index and keep track of.
+        :param cell: the edge length of the buckets in pixels.
+        """
+        self.cell = cell
+        # mapping from bucket (cx,cy) to the set of masks overlapping the bucket
+        self.__buckets = {}
+        # mapping from mask to its bounding box
+        self.__boxes = {}
+        # mapping from mask to the children which were indexed together with it
+        self.__children = {}
+        self.__callbacks = {}
+
+        if masks is not None:
+            for t in masks.types():
+                for m in masks[t]:
+                    self.add(m)
+            masks.added.append(self.add)
+            masks.removed.append(self.remove)
+
+    def __len__(self):
+        return len(self.__boxes)
+
+    def __contains__(self, mask):
+        return mask in self.__boxes
+
+    def __cells(self, box):
+        x0, y0, x1, y1 = box
+        c = self.cell
+        for cx in range(int(numpy.floor(x0 / c)), int(numpy.floor(x1 / c)) + 1):
+            for cy in range(int(numpy.floor(y0 / c)), int(numpy.floor(y1 / c)) + 1):
+                yield cx, cy
+
+    def insert(self, mask):
+        """Insert a single mask (without its children) into the index, or update its bounding box."""
+        self.discard(mask)
+        box = bounding_box(mask)
+        if box is None:
+            return
+        self.__boxes[mask] = box
+        for key in self.__cells(box):
+            self.__buckets.setdefault(key, set()).add(mask)
+
+    def discard(self, mask):
+        """Remove a single mask (without its children) from the index. If it is not indexed do nothing."""
+        box = self.__boxes.pop(mask, None)
+        if box is None:
+            return
+        for key in self.__cells(box):
+            bucket = self.__buckets[key]
+            bucket.discard(mask)
+            if len(bucket) == 0:
+                del self.__buckets[key]
+
+    def add(self, mask):
+        """Insert the mask and all its children and keep them up to date upon `changed` events of the mask."""
+        self.insert(mask)
+        children = list(getattr(mask, "children", []))
+        for child in children:
+            self.insert(child)
+        self.__children[mask] = children
+        if hasattr(mask, "changed") and mask not in self.__callbacks:
+            callback = lambda *args: self.update(mask)
+            self.__callbacks[mask] = callback
+            mask.changed.append(callback)
+
+    def remove(self, mask):
+        """Remove the mask and all its children which were inserted by :py:meth:`samuroi.util.spatialindex.SpatialIndex.add`."""
+        if mask in self.__callbacks:
+            mask.changed.remove(self.__callbacks.pop(mask))
+        for child in self.__children.pop(mask, []):
+            self.discard(child)
+        self.discard(mask)
+
+    def update(self, mask):
+        """Reindex the mask and its children, e.g. after it was moved or split."""
+        for child in self.__children.get(mask, []):
+            self.discard(child)
+        self.insert(mask)
+        children = list(getattr(mask, "children", []))
+        for child in children:
+            self.insert(child)
+        self.__children[mask] = children
+
+    def bounding_box(self, mask):
+        """:return: the indexed bounding box (x0,y0,x1,y1) of the mask."""
+        return self.__boxes[mask]
+
+    def region(self, x0, y0, x1, y1, inside=False):
+        """
+        Find the masks in a rectangular region.
+
+        :param x0, y0, x1, y1: the corners of the region.
+        :param inside: if True, only return masks whose bounding box lies completely within the region, otherwise all
+            masks whose bounding box intersects the region.
+        :return: set of masks.
+        """
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        result = set()
+        for key in self.__cells((x0, y0, x1, y1)):
+            for m in self.__buckets.get(key, ()):
+                bx0, by0, bx1, by1 = self.__boxes[m]
+                if inside:
+                    hit = bx0 >= x0 and by0 >= y0 and bx1 <= x1 and by1 <= y1
+                else:
+                    hit = bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0
+                if hit:
+                    result.add(m)
+        return result
+
+    def at(self, x, y, exact=True):
+        """
+        Find the masks at the given point.
+
+        :param x, y: the point in the coordinates of :py:func:`samuroi.util.spatialindex.bounding_box`.
+        :param exact: if True, test whether the point lies within the mask and not only within its bounding box.
+        :return: list of masks, sorted by the area of their bounding box, i.e. the most specific mask comes first.
+        """
+        c = self.cell
+        candidates = [m for m in self.__buckets.get((int(numpy.floor(x / c)), int(numpy.floor(y / c))), ())
+                      if self.__boxes[m][0] <= x <= self.__boxes[m][2] and self.__boxes[m][1] <= y <= self.__boxes[m][3]]
+        if exact:
+            candidates = [m for m in candidates if contains(m, x, y)]
+
+        def area(m):
+            x0, y0, x1, y1 = self.__boxes[m]
+            return (x1 - x0) * (y1 - y0)
+
+        return sorted(candidates, key=area)
+
+    def overlapping(self, mask, shape=None):
+        """
+        Find the masks which overlap with the given mask.
+
+        :param mask: the mask, it does not need to be indexed.
+        :param shape: optional image shape (Y,X). If given, the masks are compared pixel by pixel via
+            :py:meth:`samuroi.masks.mask.Mask.sparse_weights`, otherwise only their bounding boxes.
+        :return: set of masks, without the mask itself.
+        """
+        box = bounding_box(mask)
+        if box is None:
+            return set()
+        candidates = self.region(*box)
+        candidates.discard(mask)
+        if shape is None:
+            return candidates
+
+        everything = numpy.ones(shape, dtype=bool)
+
+        def pixels(m):
+            indices, weights = m.sparse_weights(shape, everything)
+            return indices[numpy.isfinite(weights) & (weights != 0)]
+
+        own = pixels(mask)
+        return set(m for m in candidates if len(numpy.intersect1d(own, pixels(m), assume_unique=False)) > 0)
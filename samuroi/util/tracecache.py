@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+
+
+class TraceCache(object):
+    """
+    A least recently used cache for traces, which is limited by a memory budget.
+    Each entry is stored together with a version. Looking up an entry with a different version will drop the outdated
+    entry, such that the owner of the cache only needs to provide the present version of the things the trace depends
+    on (see :py:meth:`samuroi.SamuROIData.traces`).
+    All methods are thread safe, such that traces can be calculated in worker threads
+    (see :py:class:`samuroi.gui.scheduler.JobScheduler`).
+    """
+
+    def __init__(self, budget=256 * 2 ** 20):
+        """
+        :param budget: The maximum number of bytes that the cached traces may occupy. Defaults to 256MB.
+        """
+        self.__items = OrderedDict()
+        self.__nbytes = 0
+        self.__lock = threading.RLock()
+        self.budget = budget
+
+    @property
+    def budget(self):
+        """
+        The maximum number of bytes that the cached traces may occupy.
+        If the budget is exceeded, the least recently used traces get dropped.
+
+        :type: int
+        """
+        return self.__budget
+
+    @budget.setter
+    def budget(self, b):
+        with self.__lock:
+            self.__budget = b
+            self.__shrink()
+
+    @property
+    def nbytes(self):
+        """The number of bytes occupied by the cached traces."""
+        return self.__nbytes
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __contains__(self, key):
+        return key in self.__items
+
+    def get(self, key, version):
+        """
+        Get the trace stored for the given key.
+
+        :param key: the key to look up.
+        :param version: the present version of the trace, entries with another version are outdated.
+        :return: the cached trace or None if there is no valid entry.
+        """
+        with self.__lock:
+            if key not in self.__items:
+                return None
+            cached_version, trace = self.__items[key]
+            if cached_version != version:
+                self.discard(key)
+                return None
+            self.__items.move_to_end(key)
+            return trace
+
+    def put(self, key, version, trace):
+        """
+        Store a copy of the trace with the given version. The copy will be read only.
+
+        :param key: the key to store the trace for.
+        :param version: the version of the trace.
+        :param trace: 1D numpy array.
+        """
+        trace = trace.copy()
+        trace.flags.writeable = False
+        with self.__lock:
+            self.discard(key)
+            self.__items[key] = (version, trace)
+            self.__nbytes += trace.nbytes
+            self.__shrink()
+
+    def discard(self, key):
+        """Remove the entry for the given key. If there is no such entry do nothing."""
+        with self.__lock:
+            if key in self.__items:
+                version, trace = self.__items.pop(key)
+                self.__nbytes -= trace.nbytes
+
+    def clear(self):
+        """Remove all entries."""
+        with self.__lock:
+            self.__items.clear()
+            self.__nbytes = 0
+
+    def __shrink(self):
+        while self.__nbytes > self.__budget and len(self.__items) > 0:
+            self.discard(next(iter(self.__items)))
@@ -0,0 +1,142 @@
+import numpy
+
+
+def compile_weights(weights, shape):
+    """
+    Stack the sparse weights of several masks into one sparse matrix.
+
+    :param weights: a list of tuples (indices, weights) as returned by :py:meth:`samuroi.masks.mask.Mask.sparse_weights`
+    :param shape: the image shape (Y,X) of the video data.
+    :return: scipy.sparse.csr_matrix with shape (len(weights), Y*X)
+    """
+    import scipy.sparse
+
+    indptr = numpy.zeros(len(weights) + 1, dtype=int)
+    indptr[1:] = numpy.cumsum([len(i) for i, w in weights])
+
+    if len(weights) > 0:
+        indices = numpy.concatenate([i for i, w in weights]).astype(int)
+        values = numpy.concatenate([w for i, w in weights]).astype(float)
+    else:
+        indices = numpy.zeros(0, dtype=int)
+        values = numpy.zeros(0, dtype=float)
+
+    return scipy.sparse.csr_matrix((values, indices, indptr), shape=(len(weights), shape[0] * shape[1]))
+
+
+def weight_matrix(masks, shape, mask):
+    """
+    Compile the weights of all given masks into one sparse matrix, such that the traces of all masks can be obtained by
+    a single sparse-dense matrix product with the video data.
+    See :py:meth:`samuroi.masks.mask.Mask.sparse_weights` for the weights of a single mask.
+
+    :param masks: a list of masks, all of them need to implement :py:meth:`samuroi.masks.mask.Mask.sparse_weights`.
+    :param shape: the image shape (Y,X) of the video data.
+    :param mask: a 2D mask array with the given shape, which will be applied on all masks.
+    :return: scipy.sparse.csr_matrix with shape (len(masks), Y*X)
+    """
+    return compile_weights([m.sparse_weights(shape, mask) for m in masks], shape)
+
+
+cache_budget = 4 * 2 ** 20
+"""The number of bytes of time major video data that will be transposed at once by :py:func:`apply_weights`."""
+
+
+def apply_weights(weights, data):
+    """
+    Apply a weight matrix as created by :py:func:`samuroi.util.traces.weight_matrix` on the video data.
+
+    :param weights: sparse matrix with shape (N, Y*X)
+    :param data: the 3D video data with shape (Y,X,T)
+    :return: 2D numpy array with shape (N,T) holding one trace per row.
+    """
+    from .video import memory_layout
+    Y, X, T = data.shape
+    if memory_layout(data) != 'time':
+        return numpy.asarray(weights.dot(data.reshape(-1, T)))
+
+    # for time major data, transpose small blocks of frames which fit into the cpu cache
+    frames = numpy.transpose(data, (2, 0, 1)).reshape(T, -1)
+    n = max(1, cache_budget // (Y * X * data.dtype.itemsize))
+    traces = numpy.empty(shape=(weights.shape[0], T), dtype=float)
+    for start in range(0, T, n):
+        block = numpy.ascontiguousarray(frames[start:start + n].T)
+        traces[:, start:start + n] = weights.dot(block)
+    return traces
+
+
+def stream_traces(masks, chunks, shape, mask, out=None):
+    """
+    Calculate the traces of all given masks within a single sequential pass over video data which is provided chunk by
+    chunk from any source, such that only one chunk needs to be held in memory.
+    All masks which provide their :py:meth:`samuroi.masks.mask.Mask.sparse_weights` are compiled into one weight
+    matrix which is applied on each chunk, the traces of all other masks will be calculated by calling the mask on each
+    chunk. Masks which belong to a collection (e.g. the children of a :py:class:`samuroi.masks.pixel.PixelMaskCollection`)
+    are calculated together by the `linescan` of their collection.
+
+    :param masks: a list of masks.
+    :param chunks: iterable of tuples (start, stop, chunk), where chunk is a 3D numpy array with shape (Y,X,stop-start)
+        holding the frames in range `[start,stop(`, e.g. :py:func:`samuroi.util.video.frame_chunks`,
+        :py:func:`samuroi.plugins.tif.iter_tif` or :py:func:`samuroi.util.video.prefetch_chunks`.
+    :param shape: the shape (Y,X,T) of the whole video data.
+    :param mask: a 2D mask array with the same image shape as the data.
+    :param out: optional array with shape (len(masks),T) to write the traces into chunk by chunk, e.g. a numpy memmap
+        or a h5py dataset, such that not even the traces need to fit into memory.
+    :return: out or a new 2D numpy array with shape (len(masks),T), the rows are in the same order as the masks.
+    """
+    if out is None:
+        out = numpy.empty(shape=(len(masks), shape[-1]), dtype=float)
+
+    # split into masks that can be batched and the ones which need to be called
+    rows, weights, called = [], [], []
+    collections = {}
+    for i, m in enumerate(masks):
+        collection = getattr(m, "collection", None)
+        if collection is not None:
+            collections.setdefault(collection, []).append(i)
+            continue
+        try:
+            weights.append(m.sparse_weights(shape[0:2], mask))
+            rows.append(i)
+        except NotImplementedError:
+            called.append(i)
+    compiled = compile_weights(weights, shape[0:2])
+
+    for start, stop, chunk in chunks:
+        # write directly into numpy arrays, other outputs get written once per chunk
+        inplace = isinstance(out, numpy.ndarray)
+        traces = out[:, start:stop] if inplace else numpy.empty(shape=(len(masks), stop - start), dtype=float)
+        if len(rows) > 0:
+            traces[rows] = apply_weights(compiled, chunk)
+        for i in called:
+            traces[i] = masks[i](chunk, mask)
+        for collection, indices in collections.items():
+            traces[indices] = collection.linescan(chunk, mask, [masks[i].index for i in indices])
+        if not inplace:
+            out[:, start:stop] = traces
+    return out
+
+
+def extract_traces(masks, data, mask, budget=None, out=None):
+    """
+    Calculate the traces of all given masks, see :py:func:`samuroi.util.traces.stream_traces`.
+    Lazy video data (see :py:class:`samuroi.util.video.Video`) and memory mapped files which store one frame after
+    another will be read chunk by chunk in a single sequential pass, while the next chunk gets read in the background.
+
+    :param masks: a list of masks.
+    :param data: the 3D video data with shape (Y,X,T), either a numpy array or a :py:class:`samuroi.util.video.Video`.
+    :param mask: a 2D mask array with the same image shape as the data.
+    :param budget: the number of bytes a chunk of lazy video data may occupy, see :py:func:`samuroi.util.video.frame_chunks`
+    :param out: optional array with shape (len(masks),T) to write the traces into.
+    :return: 2D numpy array with shape (len(masks),T), the rows are in the same order as the masks.
+    """
+    from .video import is_lazy, is_streamed, frame_chunks, prefetch_chunks
+    if is_streamed(data):
+        chunks = frame_chunks(data, budget)
+        if not is_lazy(data):
+            # chunks of memory mapped data are views, copy them such that the file is read in the background thread
+            chunks = ((start, stop, numpy.array(chunk, order='K')) for start, stop, chunk in chunks)
+        chunks = prefetch_chunks(chunks)
+    else:
+        chunks = [(0, data.shape[-1], data)]
+    return stream_traces(masks, chunks, data.shape, mask, out=out)
@@ -0,0 +1,288 @@
+import numpy
+
+chunk_budget = 256 * 2 ** 20
+"""The default number of bytes that one chunk of video data may occupy, see :py:func:`samuroi.util.video.frame_chunks`."""
+
+
+class Video(object):
+    """
+    Base class for lazy video data with shape (Y,X,T), i.e. video data that is not held in memory as a whole.
+    Slicing a video object with numpy syntax (e.g. `video[..., 10]` or `video[:, :, 10:20]`) will only read the
+    requested part and return it as numpy array. To process the whole video use
+    :py:func:`samuroi.util.video.frame_chunks`, which reads the video in chunks of consecutive frames.
+
+    Derived classes need to provide the wrapped source via the `source` attribute, which has to support numpy like
+    slicing and have a `shape` and `dtype` attribute (e.g. numpy memmaps or h5py datasets).
+    """
+
+    def __init__(self, source):
+        self.source = source
+
+    @property
+    def shape(self):
+        return tuple(self.source.shape)
+
+    @property
+    def dtype(self):
+        return numpy.dtype(self.source.dtype)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        return int(numpy.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, item):
+        return numpy.asarray(self.source[item])
+
+    def __array__(self, dtype=None, copy=None):
+        """Read the whole video into memory. Only use this if the video is known to fit in memory."""
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
+
+    def frame(self, i):
+        """
+        :param i: the frame number.
+        :return: 2D numpy array holding the frame.
+        """
+        return self[:, :, i]
+
+
+class ArrayVideo(Video):
+    """A video which wraps some array like object with shape (Y,X,T), e.g. a numpy memmap."""
+
+
+class HDF5Video(Video):
+    """
+    A video which is stored as dataset in a hdf5 file. The file will stay open for reading as long as this object is
+    alive or until :py:meth:`samuroi.util.video.HDF5Video.close` was called.
+    """
+
+    def __init__(self, filename, dataset='data'):
+        """
+        :param filename: The filename/path of the hdf5 file.
+        :param dataset: The path of the dataset within the file.
+        """
+        import h5py
+        self.file = h5py.File(filename, mode='r')
+        super(HDF5Video, self).__init__(self.file[dataset])
+
+    def close(self):
+        self.file.close()
+
+
+class RawVideo(Video):
+    """A video which is stored as raw binary file without any header. The file will be memory mapped."""
+
+    def __init__(self, filename, shape, dtype, offset=0, layout='yxt'):
+        """
+        :param filename: The filename/path of the binary file.
+        :param shape: The shape (Y,X,T) of the video.
+        :param dtype: The numpy dtype of the stored values, e.g. '<u2' for little endian 16bit unsigned integers.
+        :param offset: Number of bytes to skip at the beginning of the file.
+        :param layout: Either 'yxt' if the file stores the time series of each pixel consecutively, or 'tyx' if it
+            stores one frame after another.
+        """
+        Y, X, T = shape
+        if layout == 'yxt':
+            source = numpy.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(Y, X, T))
+        elif layout == 'tyx':
+            source = numpy.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(T, Y, X)).transpose(1, 2, 0)
+        else:
+            raise Exception("Unknown layout: " + layout)
+        super(RawVideo, self).__init__(source)
+
+
+def frames_per_chunk(data, budget=None):
+    """
+    :param data: 3D numpy array or :py:class:`samuroi.util.video.Video` object.
+    :param budget: The number of bytes that one chunk may occupy, defaults to :py:data:`samuroi.util.video.chunk_budget`.
+    :return: The number of frames that fit into one chunk (at least one).
+    """
+    budget = chunk_budget if budget is None else budget
+    Y, X, T = data.shape
+    n = max(1, min(T, int(budget // (Y * X * numpy.dtype(data.dtype).itemsize))))
+    # align the chunks to the chunks of the storage (e.g. hdf5 datasets), such that each stored chunk gets read and
+    # decompressed only once
+    storage = getattr(getattr(data, 'source', data), 'chunks', None)
+    if isinstance(storage, tuple) and len(storage) == 3 and n < T:
+        n = max(1, n // storage[2]) * storage[2]
+    return min(n, T)
+
+
+def frame_chunks(data, budget=None):
+    """
+    Iterate over the video in chunks of consecutive frames, such that at most one chunk of the video needs to be held in
+    memory at a time.
+
+    :param data: 3D numpy array or :py:class:`samuroi.util.video.Video` object.
+    :param budget: The number of bytes that one chunk may occupy, defaults to :py:data:`samuroi.util.video.chunk_budget`.
+    :return: A generator object yielding tuples (start, stop, chunk), where chunk is a 3D numpy array holding the frames
+        in range `[start,stop(`.
+    """
+    n = frames_per_chunk(data, budget)
+    T = data.shape[-1]
+    for start in range(0, T, n):
+        stop = min(start + n, T)
+        yield start, stop, numpy.asarray(data[:, :, start:stop])
+
+
+def is_lazy(data):
+    """:return: True if the given data is a lazy :py:class:`samuroi.util.video.Video` object."""
+    return isinstance(data, Video)
+
+
+def is_mapped(data):
+    """:return: True if the given data is a numpy array which is backed by a memory mapped file."""
+    import mmap
+    base = data
+    while base is not None:
+        if isinstance(base, (numpy.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, 'base', None)
+    return False
+
+
+def is_streamed(data):
+    """
+    :return: True if the given data should be processed chunk by chunk (see :py:func:`samuroi.util.video.frame_chunks`)
+        instead of as a whole, i.e. if it is lazy, or a memory mapped file storing one frame after another, which can
+        be read sequentially in chunks of frames.
+    """
+    return is_lazy(data) or (is_mapped(data) and memory_layout(data) == 'time')
+
+
+def prefetch_chunks(chunks, depth=1):
+    """
+    Read the next chunks in a background thread while the present chunk is processed, such that reading (e.g. from
+    disc or decompressing) and processing overlap. At most `depth + 2` chunks are held in memory at a time.
+
+    :param chunks: iterable of chunks, e.g. :py:func:`samuroi.util.video.frame_chunks` or
+        :py:func:`samuroi.plugins.tif.iter_tif`.
+    :param depth: the number of chunks which are read ahead.
+    :return: A generator object yielding the same items as chunks.
+    """
+    import queue
+    import threading
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in chunks:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((None, e))
+
+    thread = threading.Thread(target=produce, name="prefetch_chunks")
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        # stop the reading thread if the consumer stops early
+        stop.set()
+
+
+def max_projection(data, budget=None):
+    """
+    Calculate the maximum over the time axis, reading the data chunk by chunk.
+
+    :param data: 3D numpy array or :py:class:`samuroi.util.video.Video` object.
+    :param budget: The number of bytes that one chunk may occupy.
+    :return: 2D numpy array.
+    """
+    if not is_lazy(data):
+        return numpy.max(data, axis=-1)
+    result = None
+    for start, stop, chunk in frame_chunks(data, budget):
+        m = numpy.max(chunk, axis=-1)
+        result = m if result is None else numpy.maximum(result, m)
+    return result
+
+
+def memory_layout(data):
+    """
+    Determine the memory layout of the given video data.
+
+    :param data: 3D numpy array or :py:class:`samuroi.util.video.Video` object with shape (Y,X,T).
+    :return: 'pixel' if the time series of each pixel is contiguous in memory (i.e. (Y,X,T) storage), 'time' if each
+        frame is contiguous in memory (i.e. (T,Y,X) storage) or None if the layout is unknown.
+    """
+    source = data.source if is_lazy(data) else data
+    if not isinstance(source, numpy.ndarray) or source.ndim != 3:
+        return None
+    sy, sx, st = [abs(s) for s in source.strides]
+    if st <= sx <= sy:
+        return 'pixel'
+    if sx <= sy <= st:
+        return 'time'
+    return None
+
+
+def to_layout(data, layout):
+    """
+    Convert the video data into the given memory layout, see :py:func:`samuroi.util.video.memory_layout`.
+    The returned array will always have the shape (Y,X,T), only the order of the values in memory differs.
+    Lazy video data will not be converted.
+
+    :param data: 3D numpy array with shape (Y,X,T).
+    :param layout: either 'pixel' or 'time'.
+    :return: 3D numpy array with shape (Y,X,T). If the data already has the requested layout, no copy is made.
+    """
+    if is_lazy(data):
+        return data
+    if layout == 'pixel':
+        return numpy.ascontiguousarray(data)
+    if layout == 'time':
+        return numpy.ascontiguousarray(numpy.transpose(data, (2, 0, 1))).transpose(1, 2, 0)
+    raise Exception("Unknown layout: " + str(layout))
+
+
+def frame(data, i):
+    """
+    :param data: 3D numpy array or :py:class:`samuroi.util.video.Video` object with shape (Y,X,T).
+    :param i: the frame number.
+    :return: 2D numpy array holding the frame.
+    """
+    if is_lazy(data):
+        return data.frame(i)
+    return data[:, :, i]
+
+
+def pixels(data, y, x):
+    """
+    Gather the time series of a set of pixels, with the access pattern that suits the memory layout of the data.
+
+    :param data: 3D numpy array with shape (Y,X,T).
+    :param y: 1D array with the row indices of the pixels.
+    :param x: 1D array with the column indices of the pixels.
+    :return: 2D numpy array with shape (N,T), where N is the number of pixels.
+    """
+    if memory_layout(data) == 'time':
+        # gather the pixels frame by frame
+        return numpy.transpose(data, (2, 0, 1))[:, y, x].T
+    return numpy.asarray(data[y, x, :])
@@ -0,0 +1,140 @@
+import numpy
+
+
+class ThresholdHierarchy(object):
+    """
+    Precomputed watershed hierarchy of a morphology image, which allows to obtain the overlay of
+    :py:attr:`samuroi.SamuROIData.threshold` for any positive threshold without running the watershed again.
+
+    The overlay for threshold t is the watershed of the sobel elevation map, flooded from the markers
+    `morphology < t` (background) and `morphology > 1.1 t` (foreground). A watershed by flooding is (up to the order
+    in which ties get resolved) a minimum spanning forest of the pixel graph, where each edge is weighted by the higher
+    elevation of both pixels: Kruskal's algorithm merges the pixels into ever larger regions and whenever a region
+    without markers gets merged, it takes the label of the pixel on the other side of the merging edge.
+
+    Since the markers only depend on the morphology within each region, the merge order is the same for all
+    thresholds. Walking the merges once, for every region the range of thresholds in which it holds no markers but
+    receives the foreground label from its neighbour can be calculated, which gives the highest threshold for which
+    each pixel is still part of the overlay (see :py:attr:`samuroi.util.watershed.ThresholdHierarchy.critical`).
+    Building the hierarchy walks all merges in a Python loop and takes about as long as 20 watersheds (about 2 seconds
+    for a 512x512 image), afterwards each overlay is a single comparison.
+
+    Edges of equal weight are ordered by the lower elevation of both pixels, which mimics the flooding order of
+    `skimage.morphology.watershed` closely. Still, a small fraction of pixels on ridges may differ from the watershed,
+    hence the hierarchy is only used if :py:attr:`samuroi.SamuROIData.approximate_threshold` is enabled.
+    """
+
+    def __init__(self, morphology, elevation=None):
+        """
+        :param morphology: 2D numpy array.
+        :param elevation: optional precalculated elevation map, defaults to `skimage.filters.sobel(morphology)`.
+        """
+        if elevation is None:
+            import skimage.filters
+            elevation = skimage.filters.sobel(morphology)
+        self.morphology = morphology
+        self.elevation = elevation
+        self.critical = self.__critical_thresholds(numpy.asarray(morphology, dtype=float),
+                                                   numpy.asarray(elevation, dtype=float))
+        """2D array with the highest threshold for which each pixel is still part of the overlay."""
+
+    def overlay(self, threshold):
+        """
+        :param threshold: a positive threshold.
+        :return: boolean 2D array, the overlay as the watershed with given threshold would produce it.
+        """
+        if threshold <= 0:
+            raise Exception("The threshold hierarchy only supports positive thresholds.")
+        return self.critical > threshold
+
+    @staticmethod
+    def __critical_thresholds(morphology, elevation):
+        import scipy.sparse
+        import scipy.sparse.csgraph
+
+        Y, X = morphology.shape
+        n = Y * X
+        index = numpy.arange(n).reshape(Y, X)
+        e = elevation.ravel()
+
+        # edges between 4-connected neighbours, weighted by the higher elevation of both pixels, ties are ordered by the
+        # lower elevation. use the rank as weight, such that there are no zero weights which the sparse matrix drops.
+        a = numpy.concatenate([index[:, :-1].ravel(), index[:-1, :].ravel()])
+        b = numpy.concatenate([index[:, 1:].ravel(), index[1:, :].ravel()])
+        rank = numpy.empty(len(a))
+        rank[numpy.lexsort((numpy.minimum(e[a], e[b]), numpy.maximum(e[a], e[b])))] = numpy.arange(1, len(a) + 1)
+
+        # only the edges of the minimum spanning tree merge regions
+        mst = scipy.sparse.csgraph.minimum_spanning_tree(
+            scipy.sparse.coo_matrix((rank, (a, b)), shape=(n, n)).tocsr()).tocoo()
+        order = numpy.argsort(mst.data)
+        a, b = mst.row[order].tolist(), mst.col[order].tolist()
+        m = len(a)
+
+        # union find, where the region created by the i-th merge is node n+i. each node stores the extrema of the
+        # morphology within the region and each link stores the maximal threshold for which the region below it got
+        # the foreground label from the merge, propagated to the pixels by path compression.
+        low = morphology.ravel().tolist() + [0.] * m
+        high = list(low)
+        # pixels which are foreground markers themselves
+        own = [v / 1.1 for v in low[:n]]
+        link = [-numpy.inf] * (n + m)
+        uf = list(range(n + m))
+
+        def find(x):
+            """
+            :return: tuple (root, t) where t is the maximum of the links on the path from x to the root.
+            """
+            t = -numpy.inf
+            p = uf[x]
+            while p != x:
+                g = uf[p]
+                lx = link[x]
+                if g != p:
+                    # path halving, let x skip its parent
+                    if link[p] > lx:
+                        link[x] = lx = link[p]
+                    uf[x] = g
+                if lx > t:
+                    t = lx
+                x = g
+                p = uf[x]
+            return x, t
+
+        def received(low_c, high_c, low_a, high_a, t):
+            """
+            The highest threshold for which the child region c holds no markers, but the merged region a does and the
+            label received from the other side is foreground, i.e. below t.
+            """
+            t = min(t, low_c)
+            if t <= high_c / 1.1:
+                return -numpy.inf
+            if high_a / 1.1 <= t <= low_a:
+                # the merged region holds no markers either at t, use the highest threshold below where it does
+                return high_a / 1.1 if high_a > high_c else -numpy.inf
+            return t
+
+        for i in range(m):
+            u, v = a[i], b[i]
+            ru, tu = find(u)
+            rv, tv = find(v)
+            # the highest foreground threshold of both pixels at the end of the edge so far
+            tu = max(tu, own[u])
+            tv = max(tv, own[v])
+            r = n + i
+            low[r] = min(low[ru], low[rv])
+            high[r] = max(high[ru], high[rv])
+            link[ru] = received(low[ru], high[ru], low[r], high[r], tv)
+            link[rv] = received(low[rv], high[rv], low[r], high[r], tu)
+            uf[ru] = uf[rv] = r
+
+        # maximum of the links on the path of each pixel to the root by pointer jumping
+        uf = numpy.array(uf)
+        link = numpy.array(link)
+        while True:
+            link = numpy.maximum(link, link[uf])
+            jumped = uf[uf]
+            if numpy.array_equal(jumped, uf):
+                break
+            uf = jumped
+        return numpy.maximum(own, link[:n]).reshape(Y, X)
@@ -26,10 +26,11 @@ setup(
     extras_require={
         'stabilize': ["opencv-python>=4.0.0"]
     },
-    # generate a samuroi "executable" that runs the main method.
+    # generate a samuroi "executable" that runs the main method and a headless "samuroi-batch" for batch processing.
     entry_points={
         'console_scripts': [
             'samuroi = samuroi:main.main',
+            'samuroi-batch = samuroi.batch:main',
         ],
     }
 )
@@ -0,0 +1,29 @@
+import numpy
+
+from samuroi.util.branch import Branch, split_branches
+
+
+def random_branches(n, seed=0):
+    rng = numpy.random.RandomState(seed)
+    branches = []
+    for i in range(n):
+        size = rng.randint(2, 20)
+        x, y = numpy.cumsum(rng.uniform(-3, 3, size=(2, size)), axis=1) + rng.uniform(0, 500, size=(2, 1))
+        branches.append(Branch(x=x, y=y, z=numpy.zeros(size), r=rng.uniform(1, 3, size)))
+    return branches
+
+
+def assert_same_segments(batched, single):
+    assert len(batched) == len(single)
+    for a, b in zip(batched, single):
+        assert len(a) == len(b)
+        for key in ('x', 'y', 'z', 'radius'):
+            assert numpy.array_equal(a[key], b[key])
+
+
+def test_split_branches_is_independent_of_the_batch():
+    branches = random_branches(200)
+    for kwargs in [dict(nsegments=3), dict(nsegments=7), dict(length=2.), dict(length=5.)]:
+        batched = split_branches(branches, **kwargs)
+        for branch, segments in zip(branches, batched):
+            assert_same_segments(segments, branch.split(**kwargs))